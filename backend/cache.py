@@ -1,15 +1,26 @@
 """
 Translation Caching Layer
-Provides in-memory caching with TTL for translation results
+Provides an O(1) LRU cache with TTL for translation results,
+backed by an optional SQLite tier so restarts start warm
 """
 import time
 import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
 from typing import Dict, Optional, Any
 from dataclasses import dataclass
 import logging
 
 logger = logging.getLogger(__name__)
 
+# On-disk tier location (set to None to keep the cache memory-only)
+CACHE_DB_PATH = "./translation_cache.db"
+
+# Write-behind tuning for the disk tier
+CACHE_FLUSH_INTERVAL = 0.5   # Seconds between batched disk writes
+CACHE_BATCH_SIZE = 200       # Pending writes that trigger an early flush
+
 
 @dataclass
 class CachedTranslation:
@@ -24,75 +35,335 @@ class CachedTranslation:
 
 class TranslationCache:
     """
-    Simple in-memory LRU-like cache with TTL
+    In-memory LRU cache with TTL and an optional SQLite tier
+
+    The memory tier is an OrderedDict kept in recency order, so lookups,
+    inserts and evictions are all O(1). When a db_path is given, inserts
+    and deletes are queued and written to SQLite in batches by a background
+    thread, so callers never wait on a disk write. Memory misses fall back
+    to the pending writes and then to SQLite.
     """
-    
-    def __init__(self, max_size: int = 1000, ttl_seconds: int = 86400):
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        ttl_seconds: int = 86400,
+        db_path: Optional[str] = None,
+        disk_max_size: int = 100000,
+        flush_interval: float = CACHE_FLUSH_INTERVAL,
+        batch_size: int = CACHE_BATCH_SIZE
+    ):
         """
         Initialize cache
-        
+
         Args:
-            max_size: Maximum number of items to store
+            max_size: Maximum number of items to keep in memory
             ttl_seconds: Time to live in seconds (default: 24h)
+            db_path: SQLite file for the persistent tier (None = memory only)
+            disk_max_size: Maximum number of items to keep on disk
+            flush_interval: Seconds between batched disk writes
+            batch_size: Pending disk writes that trigger an early flush
         """
-        self.cache: Dict[str, CachedTranslation] = {}
+        self.cache: "OrderedDict[str, CachedTranslation]" = OrderedDict()
         self.max_size = max_size
         self.ttl_seconds = ttl_seconds
-        
+        self.disk_max_size = disk_max_size
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        # Separate connection for the writer thread; WAL lets reads run alongside it
+        self._write_db: Optional[sqlite3.Connection] = None
+        self._disk_inserts = 0
+        # Disk writes not yet flushed, keyed by cache key (None = delete)
+        self._pending_disk: Dict[str, Optional[CachedTranslation]] = {}
+        # Writes taken by the flush in progress, readable until they commit
+        self._flushing: Dict[str, Optional[CachedTranslation]] = {}
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        if db_path:
+            self._open_db(db_path)
+        if self._db is not None:
+            self._writer = threading.Thread(
+                target=self._run_writer, name="TranslationCacheWriter", daemon=True
+            )
+            self._writer.start()
+
+    def _open_db(self, db_path: str):
+        """Open the SQLite tier and warm the memory tier from it"""
+        try:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS translation_cache (
+                    key TEXT PRIMARY KEY,
+                    translation TEXT NOT NULL,
+                    source_lang TEXT NOT NULL,
+                    target_lang TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    timestamp REAL NOT NULL
+                )"""
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS ix_translation_cache_timestamp "
+                "ON translation_cache (timestamp)"
+            )
+            # Drop anything that expired while we were down
+            self._db.execute(
+                "DELETE FROM translation_cache WHERE timestamp < ?",
+                (time.time() - self.ttl_seconds,)
+            )
+            rows = self._db.execute(
+                "SELECT key, translation, source_lang, target_lang, model, timestamp "
+                "FROM translation_cache ORDER BY timestamp DESC LIMIT ?",
+                (self.max_size,)
+            ).fetchall()
+            # Oldest first so the newest end up at the MRU end
+            for key, translation, source_lang, target_lang, model, ts in reversed(rows):
+                self.cache[key] = CachedTranslation(
+                    translation=translation,
+                    source_lang=source_lang,
+                    target_lang=target_lang,
+                    model=model,
+                    timestamp=ts
+                )
+            self._write_db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._write_db.execute("PRAGMA synchronous=NORMAL")
+            logger.info(f"Translation cache warmed with {len(rows)} entries from {db_path}")
+        except sqlite3.Error as e:
+            logger.error(f"Cache disk tier disabled: {str(e)}")
+            self._db = None
+            self._write_db = None
+
     def _generate_key(self, text: str, source_lang: str, target_lang: str) -> str:
         """Generate unique cache key"""
         content = f"{text}:{source_lang}:{target_lang}"
         return hashlib.md5(content.encode()).hexdigest()
-    
+
+    def _is_expired(self, item: CachedTranslation) -> bool:
+        return time.time() - item.timestamp > self.ttl_seconds
+
+    def _insert_memory(self, key: str, item: CachedTranslation):
+        """Insert at the MRU end, evicting from the LRU end when full"""
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        self.cache[key] = item
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key: str) -> Optional[CachedTranslation]:
+        if self._db is None:
+            return None
+        for writes in (self._pending_disk, self._flushing):
+            if key in writes:
+                return writes[key]
+        try:
+            row = self._db.execute(
+                "SELECT translation, source_lang, target_lang, model, timestamp "
+                "FROM translation_cache WHERE key = ?",
+                (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Cache disk read error: {str(e)}")
+            return None
+        if row is None:
+            return None
+        return CachedTranslation(
+            translation=row[0],
+            source_lang=row[1],
+            target_lang=row[2],
+            model=row[3],
+            timestamp=row[4]
+        )
+
+    def _disk_delete(self, key: str):
+        self._queue_disk_write(key, None)
+
+    def _disk_set(self, key: str, item: CachedTranslation):
+        self._queue_disk_write(key, item)
+
+    def _queue_disk_write(self, key: str, item: Optional[CachedTranslation]):
+        """Queue a disk write for the writer thread (caller holds self._lock)"""
+        if self._db is None:
+            return
+        self._pending_disk[key] = item
+        if len(self._pending_disk) >= self.batch_size:
+            self._wakeup.set()
+
+    def _run_writer(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write all pending inserts and deletes in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                if self._db is None or not self._pending_disk:
+                    return
+                writes, self._pending_disk = self._pending_disk, {}
+                self._flushing = writes
+            upserts = [
+                (key, item.translation, item.source_lang, item.target_lang, item.model, item.timestamp)
+                for key, item in writes.items() if item is not None
+            ]
+            deletes = [(key,) for key, item in writes.items() if item is None]
+            db = self._write_db
+            try:
+                db.execute("BEGIN")
+                try:
+                    db.executemany(
+                        "INSERT OR REPLACE INTO translation_cache "
+                        "(key, translation, source_lang, target_lang, model, timestamp) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        upserts
+                    )
+                    db.executemany("DELETE FROM translation_cache WHERE key = ?", deletes)
+                    # Trim the disk tier every so often rather than on every insert
+                    self._disk_inserts += len(upserts)
+                    if self._disk_inserts >= 1000:
+                        self._disk_inserts = 0
+                        self._trim_disk(db)
+                    db.execute("COMMIT")
+                except sqlite3.Error:
+                    db.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                logger.error(f"Cache disk write error, dropping {len(writes)} writes: {str(e)}")
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+    def _trim_disk(self, db: sqlite3.Connection):
+        """Drop expired rows and the oldest rows beyond disk_max_size"""
+        db.execute(
+            "DELETE FROM translation_cache WHERE timestamp < ?",
+            (time.time() - self.ttl_seconds,)
+        )
+        db.execute(
+            "DELETE FROM translation_cache WHERE key IN ("
+            "SELECT key FROM translation_cache ORDER BY timestamp DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_size,)
+        )
+
     def get(self, text: str, source_lang: str, target_lang: str) -> Optional[CachedTranslation]:
         """
         Retrieve from cache
-        
+
         Returns:
             CachedTranslation object or None if miss/expired
         """
         key = self._generate_key(text, source_lang, target_lang)
-        
-        if key in self.cache:
-            item = self.cache[key]
-            
-            # Check TTL
-            if time.time() - item.timestamp > self.ttl_seconds:
-                del self.cache[key]
-                return None
-            
-            logger.info("Cache HIT")
-            return item
-            
-        return None
-    
+
+        with self._lock:
+            item = self.cache.get(key)
+            if item is not None:
+                # Check TTL
+                if self._is_expired(item):
+                    del self.cache[key]
+                    self._disk_delete(key)
+                    self.expirations += 1
+                    self.misses += 1
+                    return None
+
+                self.cache.move_to_end(key)
+                self.hits += 1
+                logger.info("Cache HIT")
+                return item
+
+            item = self._disk_get(key)
+            if item is not None:
+                if self._is_expired(item):
+                    self._disk_delete(key)
+                    self.expirations += 1
+                    self.misses += 1
+                    return None
+
+                # Promote into the memory tier
+                self._insert_memory(key, item)
+                self.hits += 1
+                self.disk_hits += 1
+                logger.info("Cache HIT (disk)")
+                return item
+
+            self.misses += 1
+            return None
+
     def set(
-        self, 
-        text: str, 
-        source_lang: str, 
+        self,
+        text: str,
+        source_lang: str,
         target_lang: str,
         translation: str,
         model: str
     ):
         """Add to cache"""
         key = self._generate_key(text, source_lang, target_lang)
-        
-        # Evict if full (simple approach: clear 10% oldest)
-        if len(self.cache) >= self.max_size:
-            # Sort by timestamp and remove oldest
-            sorted_keys = sorted(self.cache.keys(), key=lambda k: self.cache[k].timestamp)
-            for k in sorted_keys[:int(self.max_size * 0.1)]:
-                del self.cache[k]
-        
-        self.cache[key] = CachedTranslation(
+        item = CachedTranslation(
             translation=translation,
             source_lang=source_lang,
             target_lang=target_lang,
             model=model,
             timestamp=time.time()
         )
+
+        with self._lock:
+            self._insert_memory(key, item)
+            self._disk_set(key, item)
         logger.info(f"Cached translation for key {key[:8]}...")
 
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        disk_size = 0
+        if self._db is not None:
+            try:
+                with self._lock:
+                    disk_size = self._db.execute(
+                        "SELECT COUNT(*) FROM translation_cache"
+                    ).fetchone()[0]
+            except sqlite3.Error:
+                pass
+        return {
+            "size": len(self.cache),
+            "max_size": self.max_size,
+            "disk_size": disk_size,
+            "persistent": self._db is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def close(self):
+        """Flush pending writes and close the on-disk tier"""
+        self._closed.set()
+        self._wakeup.set()
+        if self._writer is not None:
+            self._writer.join(timeout=5.0)
+            self._writer = None
+        self.flush()
+        with self._flush_lock, self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._write_db.close()
+                self._db = None
+                self._write_db = None
+
 
 # Global instance
-translation_cache = TranslationCache()
+translation_cache = TranslationCache(db_path=CACHE_DB_PATH)
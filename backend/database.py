@@ -4,10 +4,15 @@ Handles SQLite persistence using SQLAlchemy and aiosqlite
 """
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, event, text
 from datetime import datetime
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # Database configuration
 DATABASE_URL = "sqlite+aiosqlite:///./translation.db"
 
@@ -18,6 +23,22 @@ AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# Write-behind tuning for history rows
+HISTORY_FLUSH_INTERVAL = 0.5   # Seconds between bulk inserts
+HISTORY_BATCH_SIZE = 200       # Rows that trigger an early flush
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers run alongside the writer; NORMAL sync skips the per-commit fsync"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-16000")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
 
 class TranslationModel(Base):
     """SQLAlchemy model for translation history"""
@@ -29,7 +50,7 @@ class TranslationModel(Base):
     source_lang = Column(String, nullable=False)
     target_lang = Column(String, nullable=False)
     inference_time_ms = Column(Integer, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     model = Column(String, default="unknown")
 
 
@@ -37,6 +58,10 @@ async def init_db():
     """Initialize database tables"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # create_all does not add indexes to a table that already exists
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_translations_timestamp ON translations (timestamp)"
+        ))
 
 
 async def get_db():
@@ -70,10 +95,109 @@ async def add_translation(
     return db_item
 
 
+class HistoryWriter:
+    """
+    Write-behind queue for translation history
+
+    Rows are queued without touching the database and inserted in bulk by a
+    background task, so responses never wait on a commit and concurrent
+    requests do not serialise on a shared session.
+    """
+
+    def __init__(self, flush_interval: float = HISTORY_FLUSH_INTERVAL, batch_size: int = HISTORY_BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: List[Dict[str, Any]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+    def start(self):
+        """Start the background flusher (idempotent)"""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write whatever is still queued"""
+        if self._task is not None:
+            # Let _run finish a flush it is in the middle of; cancelling it
+            # would drop the rows that flush already took from the queue
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def enqueue(self, row: Dict[str, Any]):
+        self._pending.append(row)
+        self.start()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        """
+        Insert all queued rows in one transaction
+
+        Waits for any flush already in progress, so rows it took from the
+        queue are committed before this returns.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            rows, self._pending = self._pending, []
+            if not rows:
+                return
+            try:
+                async with AsyncSessionLocal() as session:
+                    session.add_all([TranslationModel(**row) for row in rows])
+                    await session.commit()
+            except Exception as e:
+                logger.error(f"History flush failed, dropping {len(rows)} rows: {str(e)}")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+history_writer = HistoryWriter()
+
+
+def queue_translation(
+    source_text: str,
+    translated_text: str,
+    source_lang: str,
+    target_lang: str,
+    inference_time_ms: int,
+    model: str = "unknown"
+):
+    """Queue a translation record for the next bulk insert (does not block)"""
+    history_writer.enqueue({
+        "source_text": source_text,
+        "translated_text": translated_text,
+        "source_lang": source_lang,
+        "target_lang": target_lang,
+        "inference_time_ms": inference_time_ms,
+        "model": model,
+        "timestamp": datetime.utcnow()
+    })
+
+
 async def get_recent_translations(session: AsyncSession, limit: int = 50):
     """Get recent translations ordered by timestamp desc"""
     from sqlalchemy import select
     
+    # Make queued rows visible before reading
+    await history_writer.flush()
+    
     result = await session.execute(
         select(TranslationModel)
         .order_by(TranslationModel.timestamp.desc())
@@ -85,5 +209,6 @@ async def get_recent_translations(session: AsyncSession, limit: int = 50):
 async def clear_all_history(session: AsyncSession):
     """Clear all translation history"""
     from sqlalchemy import delete
+    await history_writer.flush()
     await session.execute(delete(TranslationModel))
     await session.commit()
@@ -0,0 +1,394 @@
+"""
+Document translation pipeline
+Streams text out of the uploaded file off the event loop, splits it on
+paragraph/sentence boundaries as it arrives, translates chunks concurrently
+and reassembles them in order
+"""
+import asyncio
+import codecs
+import mmap
+import os
+import re
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Iterator, AsyncIterator
+import logging
+
+from translation_memory import translation_memory
+from translation import language_detector, get_language_name
+from database import queue_translation
+
+logger = logging.getLogger(__name__)
+
+# Pipeline configuration
+DOCUMENT_CHUNK_CHARS = 2000      # ~500 tokens per chunk
+DOCUMENT_CONCURRENCY = 4         # Chunks in flight per document
+MAX_DOCUMENT_CHARS = 100000
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+JOB_RETENTION_SECONDS = 3600     # How long finished jobs stay downloadable
+SUPPORTED_EXTENSIONS = ('.txt', '.md', '.srt', '.pdf', '.docx')
+
+_SPOOL_BLOCK_BYTES = 1024 * 1024
+_TEXT_BLOCK_BYTES = 64 * 1024
+_SENTENCE_END = re.compile(r"[.!?。！？\n]")
+
+
+class DocumentError(ValueError):
+    """Raised when a document cannot be read or is out of bounds"""
+
+
+async def spool_upload(upload) -> str:
+    """
+    Copy an UploadFile to a temp file block by block
+
+    Returns:
+        Path of the temp file (the caller owns it)
+    """
+    suffix = os.path.splitext(upload.filename or "")[1].lower()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix="paraos_upload_", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await upload.read(_SPOOL_BLOCK_BYTES)
+                if not block:
+                    break
+                size += len(block)
+                if size > MAX_UPLOAD_BYTES:
+                    raise DocumentError(f"File too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)}MB upload)")
+                out.write(block)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def _iter_pdf(buffer: mmap.mmap) -> Iterator[str]:
+    try:
+        from PyPDF2 import PdfReader
+    except ImportError:
+        raise DocumentError("PyPDF2 not installed on server")
+    try:
+        pdf_reader = PdfReader(buffer)
+        for page in pdf_reader.pages:
+            yield (page.extract_text() or "") + "\n"
+    except DocumentError:
+        raise
+    except Exception as e:
+        raise DocumentError(f"PDF Parse Error: {str(e)}")
+
+
+def _iter_docx(path: str) -> Iterator[str]:
+    try:
+        import docx
+    except ImportError:
+        raise DocumentError("python-docx not installed on server")
+    try:
+        document = docx.Document(path)
+    except Exception as e:
+        raise DocumentError(f"DOCX Parse Error: {str(e)}")
+    for paragraph in document.paragraphs:
+        yield paragraph.text + "\n"
+    for table in document.tables:
+        for row in table.rows:
+            yield "\t".join(cell.text for cell in row.cells) + "\n"
+
+
+def _iter_text(buffer: mmap.mmap) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for offset in range(0, len(buffer), _TEXT_BLOCK_BYTES):
+            text = decoder.decode(buffer[offset:offset + _TEXT_BLOCK_BYTES])
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+    except UnicodeDecodeError:
+        raise DocumentError("File encoding must be UTF-8")
+
+
+def iter_document(filename: str, path: str) -> Iterator[str]:
+    """
+    Lazily yield text from a spooled document (pages, paragraphs or text blocks)
+
+    The file is memory-mapped rather than read into memory, so peak memory
+    stays flat regardless of the upload size. Blocking; run it in a thread.
+    """
+    filename = filename.lower()
+    if filename.endswith('.docx'):
+        yield from _iter_docx(path)
+        return
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if filename.endswith('.pdf'):
+                yield from _iter_pdf(buffer)
+            else:
+                yield from _iter_text(buffer)
+
+
+class Chunker:
+    """
+    Incrementally split streamed text into chunks of at most max_chars
+
+    Splits prefer paragraph breaks, then sentence ends, then a hard cut.
+    The emitted chunks concatenate back to exactly the input.
+    """
+
+    def __init__(self, max_chars: int = DOCUMENT_CHUNK_CHARS):
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def _split_point(self) -> int:
+        window = self.buffer[:self.max_chars]
+        paragraph = window.rfind("\n\n")
+        if paragraph > 0:
+            return paragraph + 2
+        sentence = -1
+        for match in _SENTENCE_END.finditer(window):
+            sentence = match.end()
+        if sentence > 0:
+            return sentence
+        return self.max_chars
+
+    def feed(self, text: str) -> List[str]:
+        self.buffer += text
+        chunks = []
+        while len(self.buffer) > self.max_chars:
+            point = self._split_point()
+            chunks.append(self.buffer[:point])
+            self.buffer = self.buffer[point:]
+        return chunks
+
+    def flush(self) -> List[str]:
+        chunks = [self.buffer] if self.buffer else []
+        self.buffer = ""
+        return chunks
+
+
+def split_into_chunks(text: str, max_chars: int = DOCUMENT_CHUNK_CHARS) -> List[str]:
+    """Split text into chunks of at most max_chars on paragraph and sentence boundaries"""
+    chunker = Chunker(max_chars)
+    return chunker.feed(text) + chunker.flush()
+
+
+@dataclass
+class DocumentJob:
+    """State of one document translation"""
+    id: str
+    filename: str
+    target_lang: str
+    source_lang: str = "auto"
+    status: str = "extracting"
+    error: Optional[str] = None
+    rejected: bool = False           # Document itself was unusable (client error)
+    extraction_done: bool = False
+    total_chars: int = 0
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    chunks: List[str] = field(default_factory=list)
+    results: List[Optional[str]] = field(default_factory=list)
+    failed_chunks: int = 0
+    changed: asyncio.Condition = field(default_factory=asyncio.Condition)
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    task: Optional[asyncio.Task] = None
+
+    @property
+    def completed_chunks(self) -> int:
+        return sum(1 for r in self.results if r is not None)
+
+    def original_content(self) -> str:
+        return "".join(self.chunks)
+
+    def translated_content(self) -> str:
+        return "".join(r for r in self.results if r is not None)
+
+    async def notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    def progress(self) -> Dict[str, Any]:
+        total = len(self.chunks)
+        if not self.extraction_done:
+            fraction = 0.0
+        else:
+            fraction = round(self.completed_chunks / total, 4) if total else 1.0
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "source_lang": self.source_lang,
+            "target_lang": self.target_lang,
+            "extraction_done": self.extraction_done,
+            "total_chunks": total,
+            "completed_chunks": self.completed_chunks,
+            "failed_chunks": self.failed_chunks,
+            "progress": fraction,
+            "error": self.error
+        }
+
+
+class DocumentPipeline:
+    """Runs document translations as background jobs"""
+
+    def __init__(self, concurrency: int = DOCUMENT_CONCURRENCY, chunk_chars: int = DOCUMENT_CHUNK_CHARS):
+        self.concurrency = concurrency
+        self.chunk_chars = chunk_chars
+        self.jobs: Dict[str, DocumentJob] = {}
+
+    def _prune(self):
+        """Forget finished jobs older than the retention window"""
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def submit(self, filename: str, path: str, target_lang: str) -> DocumentJob:
+        """
+        Start translating a spooled document in the background
+
+        The pipeline takes ownership of the temp file at path and deletes it
+        once extraction finishes.
+        """
+        self._prune()
+
+        job = DocumentJob(id=uuid.uuid4().hex, filename=filename, target_lang=target_lang)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, path))
+        logger.info(f"Document job {job.id[:8]} started for {filename}")
+        return job
+
+    def get(self, job_id: str) -> Optional[DocumentJob]:
+        return self.jobs.get(job_id)
+
+    async def _translate_chunk(self, job: DocumentJob, index: int, semaphore: asyncio.Semaphore,
+                               target_lang_name: str):
+        chunk = job.chunks[index]
+        try:
+            if not chunk.strip():
+                job.results[index] = chunk
+                return
+
+            # Translate the body, keep the surrounding whitespace so paragraphs survive
+            body = chunk.strip()
+            leading = chunk[:len(chunk) - len(chunk.lstrip())]
+            trailing = chunk[len(chunk.rstrip()):]
+            source_lang_name = get_language_name(job.source_lang) if job.source_lang != "auto" else "English"
+
+            # Segments already in the translation memory are reused, only new ones hit the model
+            async with semaphore:
+                result = await translation_memory.translate(
+                    text=body,
+                    source_lang=source_lang_name,
+                    target_lang=target_lang_name
+                )
+
+            if result["success"]:
+                job.results[index] = leading + result["translation"] + trailing
+                # Simplified DB logging (log first chunk only for speed/cleanliness)
+                if index == 0:
+                    self._log_history(job, chunk, result)
+            else:
+                job.failed_chunks += 1
+                job.results[index] = chunk + " [Error]"
+        finally:
+            await job.notify()
+
+    def _log_history(self, job: DocumentJob, chunk: str, result: Dict[str, Any]):
+        queue_translation(
+            source_text=chunk[:200] + "...",
+            translated_text=result["translation"][:200] + "...",
+            source_lang="auto",
+            target_lang=job.target_lang,
+            inference_time_ms=result["inference_time_ms"],
+            model=result.get("model", "Qwen2.5")
+        )
+
+    async def _extract(self, job: DocumentJob, path: str, semaphore: asyncio.Semaphore,
+                       target_lang_name: str, tasks: List[asyncio.Task]):
+        """Pull text out of the file in a worker thread and start chunks as they appear"""
+        chunker = Chunker(self.chunk_chars)
+        pages = iter_document(job.filename, path)
+
+        def start(new_chunks: List[str]):
+            for chunk in new_chunks:
+                if job.source_lang == "auto" and chunk.strip():
+                    # Detect the source language once, from the first real chunk
+                    job.source_lang = language_detector.detect(chunk)
+                job.chunks.append(chunk)
+                job.results.append(None)
+                index = len(job.chunks) - 1
+                tasks.append(asyncio.create_task(
+                    self._translate_chunk(job, index, semaphore, target_lang_name)
+                ))
+
+        try:
+            while True:
+                # PDF/DOCX parsing is CPU-bound, keep it off the event loop
+                text = await asyncio.to_thread(next, pages, None)
+                if text is None:
+                    break
+                job.total_chars += len(text)
+                if job.total_chars > MAX_DOCUMENT_CHARS:
+                    raise DocumentError("File too large (max 100k chars for demo)")
+                start(chunker.feed(text))
+                if job.chunks:
+                    job.status = "running"
+                await job.notify()
+            start(chunker.flush())
+        finally:
+            await asyncio.to_thread(pages.close)
+            os.unlink(path)
+
+        if not any(chunk.strip() for chunk in job.chunks):
+            raise DocumentError("File is empty or no text found")
+
+    async def _run(self, job: DocumentJob, path: str):
+        target_lang_name = get_language_name(job.target_lang)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks: List[asyncio.Task] = []
+        try:
+            await self._extract(job, path, semaphore, target_lang_name, tasks)
+            job.extraction_done = True
+            job.status = "running"
+            await job.notify()
+            await asyncio.gather(*tasks)
+            job.status = "completed"
+        except Exception as e:
+            for task in tasks:
+                task.cancel()
+            job.rejected = isinstance(e, DocumentError)
+            if not job.rejected:
+                logger.error(f"Document job {job.id[:8]} failed: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.extraction_done = True
+            job.finished_at = time.time()
+            job.done.set()
+            await job.notify()
+
+    async def stream(self, job: DocumentJob) -> AsyncIterator[str]:
+        """Yield translated chunks in document order as soon as each is ready"""
+        index = 0
+        while True:
+            async with job.changed:
+                while not job.done.is_set() and (
+                    index >= len(job.results) or job.results[index] is None
+                ):
+                    await job.changed.wait()
+            if job.status == "failed":
+                return
+            while index < len(job.results) and job.results[index] is not None:
+                yield job.results[index]
+                index += 1
+            if job.done.is_set():
+                return
+
+
+# Global instance
+document_pipeline = DocumentPipeline()
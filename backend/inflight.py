@@ -0,0 +1,154 @@
+"""
+Request coalescing (single-flight) for in-flight translations
+Duplicate concurrent requests share one upstream call instead of each hitting Parallax
+"""
+import asyncio
+import hashlib
+import json
+from typing import Dict, Any, Callable, Awaitable, AsyncIterator, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(*parts: Any) -> str:
+    """Generate a coalescing key from the request parameters
+
+    Parts are JSON-encoded as a list, so a separator inside one part can't make two
+    different requests (e.g. batches ["a:b"] and ["a", "b"]) share a key
+    """
+    content = json.dumps(list(parts), default=str)
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+class _StreamBroadcast:
+    """A running token stream that several subscribers can attach to"""
+
+    def __init__(self):
+        self.chunks: List[Dict[str, Any]] = []
+        self.done = False
+        self.subscribers = 0
+        self.condition = asyncio.Condition()
+        self.task: asyncio.Task = None
+
+    async def publish(self, chunk: Dict[str, Any]):
+        async with self.condition:
+            self.chunks.append(chunk)
+            if chunk.get("done"):
+                self.done = True
+            self.condition.notify_all()
+
+
+class InflightRegistry:
+    """
+    Registry of translations currently being computed
+
+    run() shares one future between identical concurrent calls; stream()
+    lets late callers attach to a token stream that is already running,
+    replaying the tokens they missed.
+    """
+
+    def __init__(self):
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _StreamBroadcast] = {}
+        self.coalesced = 0
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await the shared result for key, starting factory() if nobody else has
+
+        The shared task is shielded so one caller disconnecting does not
+        cancel the work for everyone else waiting on it.
+        """
+        task = self._futures.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._futures[key] = task
+            task.add_done_callback(lambda _: self._futures.pop(key, None))
+        else:
+            self.coalesced += 1
+            logger.info(f"Coalesced request onto in-flight key {key[:8]}...")
+        return await asyncio.shield(task)
+
+    async def stream(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[Dict[str, Any]]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield chunks from the shared stream for key, starting factory() if needed
+
+        The upstream stream is cancelled once its last subscriber goes away.
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _StreamBroadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, factory))
+        else:
+            self.coalesced += 1
+            logger.info(f"Attached to in-flight stream {key[:8]}...")
+
+        broadcast.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with broadcast.condition:
+                    while index >= len(broadcast.chunks) and not broadcast.done:
+                        await broadcast.condition.wait()
+                    pending = broadcast.chunks[index:]
+                index += len(pending)
+                for chunk in pending:
+                    yield chunk
+                    if chunk.get("done"):
+                        return
+                if broadcast.done and index >= len(broadcast.chunks):
+                    return
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                # Unregister now so new callers start a fresh stream instead of
+                # attaching to one that will never publish its done chunk
+                self._release_stream(key, broadcast)
+                broadcast.task.cancel()
+
+    async def _pump(
+        self,
+        key: str,
+        broadcast: _StreamBroadcast,
+        factory: Callable[[], AsyncIterator[Dict[str, Any]]]
+    ):
+        """Drive the upstream generator and fan its chunks out to subscribers"""
+        try:
+            async for chunk in factory():
+                await broadcast.publish(chunk)
+                if chunk.get("done"):
+                    break
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Shared stream error: {str(e)}")
+            await broadcast.publish({"error": str(e), "done": True})
+        finally:
+            self._release_stream(key, broadcast)
+            if not broadcast.done:
+                async with broadcast.condition:
+                    broadcast.done = True
+                    broadcast.condition.notify_all()
+
+    def _release_stream(self, key: str, broadcast: _StreamBroadcast):
+        """Unregister broadcast, leaving a newer stream for the same key in place"""
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Current in-flight counts and total coalesced requests"""
+        return {
+            "inflight_requests": len(self._futures),
+            "inflight_streams": len(self._streams),
+            "coalesced": self.coalesced
+        }
+
+
+# Global instance
+inflight_registry = InflightRegistry()
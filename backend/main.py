@@ -13,6 +13,9 @@ import json
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from parallax_client import parallax_client
+from inflight import inflight_registry, make_key
+from translation_memory import translation_memory
+from documents import document_pipeline, spool_upload, DocumentError, SUPPORTED_EXTENSIONS
 from translation import (
     language_detector,
     SUPPORTED_LANGUAGES,
@@ -22,7 +25,8 @@ from translation import (
 from database import (
     init_db, 
     get_db, 
-    add_translation, 
+    queue_translation, 
+    history_writer,
     get_recent_translations, 
     clear_all_history,
     TranslationModel # Needed for stats query
@@ -72,8 +76,19 @@ class DetectLanguageRequest(BaseModel):
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
+    """Initialize database and start the history write-behind queue on startup"""
     await init_db()
+    history_writer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled Parallax connections and the persistent cache tier"""
+    from cache import translation_cache
+    await parallax_client.aclose()
+    await history_writer.stop()
+    translation_cache.close()
+    translation_memory.close()
 
 
 @app.get("/")
@@ -114,10 +129,7 @@ async def get_languages():
 
 
 @app.post("/api/translate")
-async def translate(
-    request: TranslateRequest,
-    db: AsyncSession = Depends(get_db)
-):
+async def translate(request: TranslateRequest):
     """
     Translate text using Parallax local inference
     """
@@ -158,11 +170,14 @@ async def translate(
     
     logger.info(f"Translating from {source_lang_name} to {target_lang_name}")
     
-    # Perform translation
-    result = await parallax_client.translate(
-        text=request.text,
-        source_lang=source_lang_name,
-        target_lang=target_lang_name
+    # Perform translation (identical concurrent requests share one call)
+    result = await inflight_registry.run(
+        make_key(request.text, source_lang_name, target_lang_name),
+        lambda: parallax_client.translate(
+            text=request.text,
+            source_lang=source_lang_name,
+            target_lang=target_lang_name
+        )
     )
     
     if not result["success"]:
@@ -176,8 +191,7 @@ async def translate(
         target_lang=request.target_lang
     )
     
-    await add_translation(
-        session=db,
+    queue_translation(
         source_text=request.text,
         translated_text=result["translation"],
         source_lang=source_lang,
@@ -221,12 +235,9 @@ class BatchTranslateRequest(BaseModel):
 
 
 @app.post("/api/batch-translate")
-async def batch_translate(
-    request: BatchTranslateRequest,
-    db: AsyncSession = Depends(get_db)
-):
+async def batch_translate(request: BatchTranslateRequest):
     """
-    Translate multiple texts concurrently
+    Translate multiple texts, packing short segments into shared engine requests
     """
     if not request.texts or len(request.texts) == 0:
         raise HTTPException(status_code=400, detail="Texts list cannot be empty")
@@ -235,88 +246,98 @@ async def batch_translate(
         raise HTTPException(status_code=400, detail="Batch size too large (max 50 items)")
     
     import asyncio
+    from cache import translation_cache
     
-    # Helper function for single translation within batch
-    async def translate_single(text: str):
+    source_lang_name = get_language_name(request.source_lang)
+    target_lang_name = get_language_name(request.target_lang)
+    results = [None] * len(request.texts)
+    models = {}
+    
+    # 1. Check Cache, and group the misses by (per item) source language
+    pending = {}
+    for i, text in enumerate(request.texts):
+        cached = translation_cache.get(text, source_lang_name, target_lang_name)
+        if cached:
+            results[i] = {
+                "text": text,
+                "translation": cached.translation,
+                "inference_time_ms": 0,
+                "cached": True,
+                "success": True
+            }
+            continue
+        
+        # Auto-detect if needed (per item)
+        item_source_lang = request.source_lang
+        if item_source_lang == "auto":
+            detected_code = language_detector.detect(text)
+            item_source_lang = get_language_name(detected_code)
+        else:
+            item_source_lang = get_language_name(item_source_lang)
+        pending.setdefault(item_source_lang, []).append(i)
+    
+    # 2. Translate each group, packing short segments into shared engine requests
+    async def translate_group(item_source_lang: str, indices: List[int]):
+        texts = [request.texts[i] for i in indices]
         try:
-            # Reuse existing translate logic by creating a request object
-            # Note: This is a simplified internal call
-            # In a real app, we'd refactor the core logic out of the route handler
-            
-            # 1. Check Cache
-            from cache import translation_cache
-            source_lang_name = get_language_name(request.source_lang)
-            target_lang_name = get_language_name(request.target_lang)
-            
-            cached = translation_cache.get(text, source_lang_name, target_lang_name)
-            if cached:
-                return {
+            group_results = await inflight_registry.run(
+                make_key("batch", item_source_lang, target_lang_name, *texts),
+                lambda: parallax_client.translate_batch(
+                    texts=texts,
+                    source_lang=item_source_lang,
+                    target_lang=target_lang_name
+                )
+            )
+        except Exception as e:
+            group_results = [{"success": False, "error": str(e)}] * len(texts)
+        
+        if len(group_results) != len(texts):
+            logger.error(f"Batch returned {len(group_results)} results for {len(texts)} texts")
+            group_results = [{"success": False, "error": "Mismatched batch results"}] * len(texts)
+        
+        for i, text, result in zip(indices, texts, group_results):
+            if not result["success"]:
+                results[i] = {
                     "text": text,
-                    "translation": cached.translation,
-                    "inference_time_ms": 0,
-                    "cached": True,
-                    "success": True
+                    "error": result.get("error"),
+                    "success": False
                 }
+                continue
             
-            # 2. Translate
-            # Auto-detect if needed (per item)
-            item_source_lang = request.source_lang
-            if item_source_lang == "auto":
-                detected_code = language_detector.detect(text)
-                item_source_lang = get_language_name(detected_code)
-            else:
-                item_source_lang = get_language_name(item_source_lang)
-                
-            result = await parallax_client.translate(
+            # Update Cache
+            translation_cache.set(
                 text=text,
                 source_lang=item_source_lang,
-                target_lang=target_lang_name
+                target_lang=target_lang_name,
+                translation=result["translation"],
+                model=result["model"]
             )
             
-            if result["success"]:
-                # Save to DB
-                await add_translation(
-                    session=db,
-                    source_text=text,
-                    translated_text=result["translation"],
-                    source_lang=request.source_lang,
-                    target_lang=request.target_lang,
-                    inference_time_ms=result["inference_time_ms"],
-                    model=result["model"]
-                )
-                
-                # Update Cache
-                translation_cache.set(
-                    text=text,
-                    source_lang=item_source_lang,
-                    target_lang=target_lang_name,
-                    translation=result["translation"],
-                    model=result["model"]
-                )
-                
-                return {
-                    "text": text,
-                    "translation": result["translation"],
-                    "inference_time_ms": result["inference_time_ms"],
-                    "cached": False,
-                    "success": True
-                }
-            else:
-                return {
-                    "text": text,
-                    "error": result.get("error"),
-                    "success": False
-                }
-                
-        except Exception as e:
-            return {
+            models[i] = result["model"]
+            results[i] = {
                 "text": text,
-                "error": str(e),
-                "success": False
+                "translation": result["translation"],
+                "inference_time_ms": result["inference_time_ms"],
+                "cached": False,
+                "success": True
             }
-
-    # Run all translations concurrently
-    results = await asyncio.gather(*[translate_single(text) for text in request.texts])
+    
+    await asyncio.gather(*[
+        translate_group(lang, indices) for lang, indices in pending.items()
+    ])
+    
+    # 3. Queue history rows for the next bulk insert
+    for i, text in enumerate(request.texts):
+        result = results[i]
+        if result["success"] and not result["cached"]:
+            queue_translation(
+                source_text=text,
+                translated_text=result["translation"],
+                source_lang=request.source_lang,
+                target_lang=request.target_lang,
+                inference_time_ms=result["inference_time_ms"],
+                model=models[i]
+            )
     
     return {
         "results": results,
@@ -376,20 +397,34 @@ async def translate_stream(
         """Generate SSE events for real-time token streaming"""
         try:
             full_translation = ""
-            async for chunk in parallax_client.translate_streaming(
-                text=text,
-                source_lang=source_lang_name,
-                target_lang=target_lang_name,
-                context_text=context_text,
-                is_document=is_document
-            ):
+            # Attach to an identical stream that is already running, if any
+            stream_key = make_key(text, source_lang_name, target_lang_name, context_text, is_document)
+            if is_document:
+                # Documents go through the translation memory: unchanged segments are reused
+                def start_stream():
+                    return translation_memory.translate_streaming(
+                        text=text,
+                        source_lang=source_lang_name,
+                        target_lang=target_lang_name,
+                        context_text=context_text
+                    )
+            else:
+                def start_stream():
+                    return parallax_client.translate_streaming(
+                        text=text,
+                        source_lang=source_lang_name,
+                        target_lang=target_lang_name,
+                        context_text=context_text,
+                        is_document=is_document
+                    )
+            
+            async for chunk in inflight_registry.stream(stream_key, start_stream):
                 if chunk.get("done"):
                     # Final chunk with complete translation
                     if "error" not in chunk:
                         full_translation = chunk.get("full_text", "")
                         # Add to database
-                        await add_translation(
-                            session=db,
+                        queue_translation(
                             source_text=text,
                             translated_text=full_translation,
                             source_lang=source_lang,
@@ -484,97 +519,39 @@ async def get_stats(db: AsyncSession = Depends(get_db)):
     }
 
 
+async def _start_document_job(file: UploadFile, target_lang: str):
+    """Validate and spool an upload, then hand it to the document pipeline"""
+    filename = file.filename.lower()
+    if not filename.endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Supported formats: .txt, .md, .srt, .pdf, .docx")
+    
+    # Spool to disk in blocks instead of buffering the whole upload
+    try:
+        path = await spool_upload(file)
+    except DocumentError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return document_pipeline.submit(file.filename, path, target_lang)
+
+
 @app.post("/api/translate-file")
 async def translate_file(
     file: UploadFile = File(...),
-    target_lang: str = "en",
-    db: AsyncSession = Depends(get_db)
+    target_lang: str = "en"
 ):
     """
-    Supports PDF, TXT, MD, SRT
+    Supports PDF, DOCX, TXT, MD, SRT
     """
-    filename = file.filename.lower()
-    allowed_exts = ('.txt', '.md', '.srt', '.pdf')
-    if not filename.endswith(allowed_exts):
-        raise HTTPException(status_code=400, detail="Supported formats: .txt, .md, .srt, .pdf")
+    job = await _start_document_job(file, target_lang)
     
-    content = await file.read()
-    text_content = ""
+    # Extraction, chunking and translation overlap; wait for the whole job
+    await job.done.wait()
     
-    # 1. Extract Text
-    if filename.endswith('.pdf'):
-        try:
-            from PyPDF2 import PdfReader
-            pdf_reader = PdfReader(io.BytesIO(content))
-            for page in pdf_reader.pages:
-                text_content += (page.extract_text() or "") + "\n"
-        except ImportError:
-             raise HTTPException(status_code=500, detail="PyPDF2 not installed on server")
-        except Exception as e:
-             raise HTTPException(status_code=400, detail=f"PDF Parse Error: {str(e)}")
-    else:
-        # text files
-        try:
-            text_content = content.decode("utf-8")
-        except UnicodeDecodeError:
-            raise HTTPException(status_code=400, detail="File encoding must be UTF-8")
-
-    if not text_content.strip():
-        raise HTTPException(status_code=400, detail="File is empty or no text found")
-
-    if len(text_content) > 100000:
-        raise HTTPException(status_code=400, detail="File too large (max 100k chars for demo)")
-
-    # 2. Chunking & Translation
-    lines = text_content.split('\n')
-    chunks = []
-    current_chunk = ""
+    if job.status == "failed":
+        raise HTTPException(status_code=400 if job.rejected else 500, detail=job.error or "Translation failed")
     
-    for line in lines:
-        if len(current_chunk) + len(line) < 2000: # ~500 tokens
-            current_chunk += line + "\n"
-        else:
-            chunks.append(current_chunk)
-            current_chunk = line + "\n"
-    if current_chunk:
-        chunks.append(current_chunk)
-        
-    target_lang_name = get_language_name(target_lang)
-    translated_chunks = []
-    
-    # Process chunks (In production, use background tasks)
-    for chunk in chunks:
-        if not chunk.strip():
-            translated_chunks.append(chunk)
-            continue
-        
-        # Detect source language for proper translation prompt
-        detected_code = language_detector.detect(chunk)
-        source_lang_name = get_language_name(detected_code) if detected_code != "auto" else "English"
-            
-        result = await parallax_client.translate(
-            text=chunk,
-            source_lang=source_lang_name,
-            target_lang=target_lang_name
-        )
-        
-        if result["success"]:
-            translated_chunks.append(result["translation"])
-            # Simplified DB logging for demo (log first chunk only for speed/cleanliness)
-            if chunk == chunks[0]:
-                await add_translation(
-                    db,
-                    source_text=chunk[:200] + "...",
-                    translated_text=result["translation"][:200] + "...",
-                    source_lang="auto",
-                    target_lang=target_lang,
-                    inference_time_ms=result["inference_time_ms"],
-                    model=result.get("model", "Qwen2.5")
-                )
-        else:
-            translated_chunks.append(chunk + " [Error]")
-
-    full_translation = "".join(translated_chunks)
+    text_content = job.original_content()
+    full_translation = job.translated_content()
     
     # 3. Calculate Savings (Demo Metric)
     # Value: $20/million chars (Google pricing)
@@ -589,6 +566,44 @@ async def translate_file(
     }
 
 
+@app.post("/api/documents")
+async def create_document_job(
+    file: UploadFile = File(...),
+    target_lang: str = "en"
+):
+    """
+    Start a background document translation and return its job id
+    """
+    job = await _start_document_job(file, target_lang)
+    return job.progress()
+
+
+@app.get("/api/documents/{job_id}")
+async def get_document_job(job_id: str):
+    """
+    Get progress of a document translation job
+    """
+    job = document_pipeline.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.progress()
+
+
+@app.get("/api/documents/{job_id}/download")
+async def download_document_job(job_id: str):
+    """
+    Stream the translated document, chunk by chunk in order, as it is produced
+    """
+    job = document_pipeline.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return StreamingResponse(
+        document_pipeline.stream(job),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename=translated_{job.filename}.txt"}
+    )
+
 
 @app.get("/api/status/offline")
 async def check_offline_status():
@@ -659,6 +674,16 @@ async def export_history_json(db: AsyncSession = Depends(get_db)):
     )
 
 
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Translation cache hit/miss/eviction counters"""
+    from cache import translation_cache
+    stats = translation_cache.stats()
+    stats.update(inflight_registry.stats())
+    stats["translation_memory"] = translation_memory.stats()
+    return stats
+
+
 # CLUSTER MANAGEMENT
 
 @app.get("/api/cluster/status")
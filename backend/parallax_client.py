@@ -1,40 +1,60 @@
 """
 Parallax Client - Interface for connecting to Parallax distributed AI cluster
 """
+import asyncio
 import httpx
+import random
+import re
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Numbered line in a packed batch response, e.g. "[3] Hola mundo"
+_SEGMENT_LINE = re.compile(r"^\s*\[(\d+)\]\s?(.*)$")
+
 
 class ParallaxClient:
     """Client for interacting with Parallax inference engine"""
     
-    def __init__(self, base_urls: list = ["http://localhost:3001"]):
+    def __init__(
+        self,
+        base_urls: list = ["http://localhost:3001"],
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0
+    ):
         """
         Initialize Parallax client with support for multiple nodes
         
         Args:
             base_urls: List of Base URLs for Parallax scheduler nodes
+            max_connections: Connection pool size per node
+            max_keepalive_connections: Idle keep-alive connections kept per node
+            keepalive_expiry: Seconds an idle keep-alive connection is kept open
         """
         # Initialize nodes
         self.nodes = []
         for i, url in enumerate(base_urls):
-            self.nodes.append({
-                "id": f"node-{i+1}",
-                "url": url,
-                "name": f"Node {i+1}",
-                "status": "unknown",
-                "last_check": 0,
-                "active_requests": 0
-            })
+            self.nodes.append(self._new_node(f"node-{i+1}", url, f"Node {i+1}"))
             
-        self.current_node_index = 0
         self.timeout = 300.0
         
+        # Load-balancing tuning
+        self.ewma_alpha = 0.3          # Weight of the newest latency sample
+        self.max_failures = 3          # Consecutive failures before a node is benched
+        self.failure_cooldown = 10.0   # Seconds a benched node is skipped
+        
+        # Long-lived connection pools, one per node URL
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        
     @property
     def base_url(self):
         """Return primary node URL for backward compatibility"""
@@ -45,46 +65,130 @@ class ParallaxClient:
         """Return OpenAI-compatible API endpoint"""
         return f"{self.base_url}/v1/chat/completions"
         
-    def get_active_node(self):
-        """Get next active node using round-robin"""
-        # Simple round-robin among online nodes
-        start_index = self.current_node_index
+    def _get_client(self, url: str) -> httpx.AsyncClient:
+        """Return the pooled keep-alive client for a node, creating it on first use"""
+        client = self._clients.get(url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=url,
+                timeout=self.timeout,
+                limits=self.limits,
+                headers={"Content-Type": "application/json"}
+            )
+            self._clients[url] = client
+        return client
+    
+    async def aclose(self):
+        """Close all pooled connections (called on application shutdown)"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        await asyncio.gather(*[c.aclose() for c in clients], return_exceptions=True)
         
-        while True:
-            node = self.nodes[self.current_node_index]
-            self.current_node_index = (self.current_node_index + 1) % len(self.nodes)
-            
-            # In a real scenario, we'd check if node['status'] == 'online'
-            # For now, we assume the primary node is always the one to use
-            # unless we have real multi-node setup
-            if node['status'] != 'offline':
-                return node
-                
-            if self.current_node_index == start_index:
-                # All nodes offline, return primary
-                return self.nodes[0]
+    @staticmethod
+    def _new_node(node_id: str, url: str, name: str) -> Dict[str, Any]:
+        """Build a node record with its load-tracking fields"""
+        return {
+            "id": node_id,
+            "url": url,
+            "name": name,
+            "status": "unknown",
+            "last_check": 0,
+            "active_requests": 0,
+            "latency_ewma_ms": 0.0,
+            "ttft_ewma_ms": 0.0,
+            "consecutive_failures": 0,
+            "unhealthy_until": 0.0
+        }
+    
+    def _node_cost(self, node: Dict[str, Any], metric: str = "latency_ewma_ms") -> float:
+        """Expected cost of sending one more request to a node"""
+        # Unmeasured nodes get a neutral latency so they are tried early
+        latency = node[metric] or 1.0
+        return (node['active_requests'] + 1) * latency
+    
+    def get_active_node(self, stream: bool = False):
+        """
+        Pick a node using power-of-two-choices on in-flight load x EWMA latency
+        
+        Streams are weighted by time-to-first-token and full requests by
+        completion latency, so nodes are compared on the same quantity.
+        Nodes that are offline or benched after repeated failures are skipped
+        unless nothing else is available.
+        """
+        if len(self.nodes) == 1:
+            return self.nodes[0]
+        
+        now = time.time()
+        candidates = [
+            n for n in self.nodes
+            if n['status'] != 'offline' and n['unhealthy_until'] <= now
+        ]
+        if not candidates:
+            # All nodes look unhealthy, fall back to the least loaded one
+            candidates = self.nodes
+        metric = "ttft_ewma_ms" if stream else "latency_ewma_ms"
+        if len(candidates) <= 2:
+            return min(candidates, key=lambda n: self._node_cost(n, metric))
+        
+        a, b = random.sample(candidates, 2)
+        return a if self._node_cost(a, metric) <= self._node_cost(b, metric) else b
+    
+    def _begin_request(self, node: Dict[str, Any]):
+        node['active_requests'] += 1
+    
+    def _end_request(
+        self,
+        node: Dict[str, Any],
+        latency_ms: float,
+        success: bool,
+        metric: str = "latency_ewma_ms",
+        cancelled: bool = False
+    ):
+        """
+        Record the outcome of a request for load tracking and passive health
+        
+        Requests the caller abandoned (client disconnects, cancelled streams)
+        only release their load slot; they say nothing about node health.
+        """
+        node['active_requests'] = max(0, node['active_requests'] - 1)
+        if cancelled:
+            return
+        if success:
+            if node[metric]:
+                node[metric] += self.ewma_alpha * (latency_ms - node[metric])
+            else:
+                node[metric] = float(latency_ms)
+            node['consecutive_failures'] = 0
+            node['unhealthy_until'] = 0.0
+            node['status'] = 'online'
+        else:
+            node['consecutive_failures'] += 1
+            if node['consecutive_failures'] >= self.max_failures:
+                node['unhealthy_until'] = time.time() + self.failure_cooldown
+                logger.warning(f"{node['name']} benched after {node['consecutive_failures']} failures")
 
     async def get_cluster_status(self) -> Dict[str, Any]:
         """Get status of all nodes in the cluster"""
         total_nodes = len(self.nodes)
-        online_nodes = 0
         
-        for node in self.nodes:
+        async def probe(node):
             try:
                 # Quick health check
-                async with httpx.AsyncClient(timeout=2.0) as client:
-                    resp = await client.get(f"{node['url']}/v1/models")
-                    if resp.status_code == 200:
-                        node['status'] = 'online'
-                        online_nodes += 1
-                        # Mock some load metrics
-                        import random
-                        node['load'] = random.randint(10, 40)
-                    else:
-                        node['status'] = 'error'
+                resp = await self._get_client(node['url']).get("/v1/models", timeout=2.0)
+                if resp.status_code == 200:
+                    node['status'] = 'online'
+                    node['consecutive_failures'] = 0
+                    node['unhealthy_until'] = 0.0
+                else:
+                    node['status'] = 'error'
             except:
                 node['status'] = 'offline'
-                node['load'] = 0
+            node['load'] = node['active_requests']
+            node['last_check'] = time.time()
+        
+        # Probe all nodes concurrently
+        await asyncio.gather(*[probe(node) for node in self.nodes])
+        online_nodes = sum(1 for node in self.nodes if node['status'] == 'online')
         
         return {
             "nodes": self.nodes,
@@ -96,14 +200,7 @@ class ParallaxClient:
     def add_node(self, url: str, name: str = None):
         """Add a new node to the cluster"""
         new_id = f"node-{len(self.nodes) + 1}"
-        self.nodes.append({
-            "id": new_id,
-            "url": url,
-            "name": name or f"Node {len(self.nodes) + 1}",
-            "status": "unknown",
-            "last_check": 0,
-            "active_requests": 0
-        })
+        self.nodes.append(self._new_node(new_id, url, name or f"Node {len(self.nodes) + 1}"))
         return {"id": new_id, "message": "Node added"}
         
     async def check_health(self) -> Dict[str, Any]:
@@ -114,13 +211,12 @@ class ParallaxClient:
             Dict with status and message
         """
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(self.base_url)
-                return {
-                    "status": "online",
-                    "message": "Parallax is running",
-                    "code": response.status_code
-                }
+            response = await self._get_client(self.base_url).get("/", timeout=5.0)
+            return {
+                "status": "online",
+                "message": "Parallax is running",
+                "code": response.status_code
+            }
         except httpx.ConnectError:
             return {
                 "status": "offline",
@@ -139,7 +235,8 @@ class ParallaxClient:
         text: str,
         source_lang: str,
         target_lang: str,
-        max_tokens: int = 512
+        max_tokens: int = 512,
+        context_text: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Translate text using Parallax local inference
@@ -149,6 +246,7 @@ class ParallaxClient:
             source_lang: Source language name (e.g., "English")
             target_lang: Target language name (e.g., "Spanish")
             max_tokens: Maximum tokens for response
+            context_text: Optional previous translations to keep terminology consistent
             
         Returns:
             Dict with translation, inference_time_ms, and model info
@@ -156,7 +254,7 @@ class ParallaxClient:
         start_time = time.time()
         
         # Optimized prompt for fast, accurate translation
-        prompt = self._build_translation_prompt(text, source_lang, target_lang)
+        prompt = self._build_translation_prompt(text, source_lang, target_lang, context_text)
         
         payload = {
             "max_tokens": max_tokens,
@@ -177,34 +275,36 @@ class ParallaxClient:
             }
         }
         
+        node = self.get_active_node()
+        self._begin_request(node)
+        success = False
+        cancelled = False
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    self.api_url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                
-                # Extract translation from response
-                translation = result["choices"][0]["message"]["content"].strip()
-                
-                # Calculate inference time
-                inference_time_ms = int((time.time() - start_time) * 1000)
-                
-                logger.info(f"Translation completed in {inference_time_ms}ms")
-                
-                return {
-                    "success": True,
-                    "translation": translation,
-                    "inference_time_ms": inference_time_ms,
-                    "model": result.get("model", "unknown"),
-                    "source_lang": source_lang,
-                    "target_lang": target_lang
-                }
-                
+            client = self._get_client(node['url'])
+            response = await client.post("/v1/chat/completions", json=payload)
+            response.raise_for_status()
+            
+            result = response.json()
+            
+            # Extract translation from response
+            translation = result["choices"][0]["message"]["content"].strip()
+            
+            # Calculate inference time
+            inference_time_ms = int((time.time() - start_time) * 1000)
+            
+            logger.info(f"Translation completed in {inference_time_ms}ms on {node['name']}")
+            success = True
+            
+            return {
+                "success": True,
+                "translation": translation,
+                "inference_time_ms": inference_time_ms,
+                "model": result.get("model", "unknown"),
+                "source_lang": source_lang,
+                "target_lang": target_lang,
+                "node_id": node['id']
+            }
+            
         except httpx.ConnectError:
             return {
                 "success": False,
@@ -224,6 +324,183 @@ class ParallaxClient:
                 "error": f"Translation failed: {str(e)}",
                 "inference_time_ms": int((time.time() - start_time) * 1000)
             }
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            self._end_request(
+                node, (time.time() - start_time) * 1000, success, cancelled=cancelled
+            )
+    
+    @staticmethod
+    def _is_packable(text: str, max_chars: int) -> bool:
+        """Only short single-line segments survive the numbered round-trip reliably"""
+        return "\n" not in text.strip() and len(text) <= max_chars
+    
+    def _build_batch_prompt(
+        self,
+        texts: List[str],
+        source_lang: str,
+        target_lang: str,
+        context_text: Optional[str] = None
+    ) -> str:
+        """Build a numbered prompt that translates several segments at once"""
+        numbered = "\n".join(f"[{i + 1}] {t.strip()}" for i, t in enumerate(texts))
+        context_section = ""
+        if context_text:
+            context_section = f"\nContext from previous translations:\n{context_text}\n"
+        return f"""You are a professional translator. Translate each numbered line below.
+
+From: {source_lang}
+To: {target_lang}
+
+Rules:
+- Output ONLY the {target_lang} translations, one per line
+- Keep the same [number] prefix on each line
+- Output exactly {len(texts)} lines, in the same order
+- No explanations or commentary
+{context_section}
+Lines to translate:
+{numbered}
+
+{target_lang} translations:"""
+    
+    @staticmethod
+    def _parse_batch_response(content: str, count: int) -> Optional[List[str]]:
+        """Split a numbered response back into segments, or None if it does not line up"""
+        segments: Dict[int, str] = {}
+        for line in content.splitlines():
+            match = _SEGMENT_LINE.match(line)
+            if match:
+                index = int(match.group(1))
+                if 1 <= index <= count and index not in segments:
+                    segments[index] = match.group(2).strip()
+        if len(segments) != count or not all(segments.values()):
+            return None
+        return [segments[i + 1] for i in range(count)]
+    
+    async def _translate_packed(
+        self,
+        texts: List[str],
+        source_lang: str,
+        target_lang: str,
+        context_text: Optional[str] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Translate a group of segments in one engine request; None if it cannot be split"""
+        start_time = time.time()
+        prompt = self._build_batch_prompt(texts, source_lang, target_lang, context_text)
+        
+        payload = {
+            # Budget roughly 2 tokens per input character plus numbering overhead
+            "max_tokens": min(4096, 64 + 8 * len(texts) + 2 * sum(len(t) for t in texts)),
+            "messages": [
+                {
+                    "role": "system",
+                    "content": f"You are a professional {target_lang} translator. Respond only with translations, never explanations."
+                },
+                {"role": "user", "content": prompt}
+            ],
+            "stream": False,
+            "temperature": 0.2,
+            "chat_template_kwargs": {"enable_thinking": False}
+        }
+        
+        node = self.get_active_node()
+        self._begin_request(node)
+        success = False
+        cancelled = False
+        try:
+            response = await self._get_client(node['url']).post("/v1/chat/completions", json=payload)
+            response.raise_for_status()
+            result = response.json()
+            success = True
+        except Exception as e:
+            logger.error(f"Packed batch translation error: {str(e)}")
+            return None
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            self._end_request(
+                node, (time.time() - start_time) * 1000, success, cancelled=cancelled
+            )
+        
+        content = result["choices"][0]["message"]["content"]
+        translations = self._parse_batch_response(content, len(texts))
+        if translations is None:
+            logger.warning(f"Could not split packed response for {len(texts)} segments, falling back")
+            return None
+        
+        inference_time_ms = int((time.time() - start_time) * 1000)
+        logger.info(f"Packed translation of {len(texts)} segments completed in {inference_time_ms}ms")
+        return [
+            {
+                "success": True,
+                "translation": translation,
+                "inference_time_ms": inference_time_ms,
+                "model": result.get("model", "unknown"),
+                "source_lang": source_lang,
+                "target_lang": target_lang,
+                "node_id": node['id'],
+                "packed": True
+            }
+            for translation in translations
+        ]
+    
+    async def translate_batch(
+        self,
+        texts: List[str],
+        source_lang: str,
+        target_lang: str,
+        max_segments_per_request: int = 16,
+        max_segment_chars: int = 200,
+        context_text: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Translate many segments, packing short ones into shared engine requests
+        
+        Short single-line segments are sent as numbered groups of up to
+        max_segments_per_request, which saves the per-request system prompt
+        prefill and scheduler slots. Longer segments, and any group whose
+        response cannot be split back per segment, go through translate().
+        
+        Returns:
+            One result dict per input text, in input order (same shape as translate())
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        packable = [i for i, t in enumerate(texts) if self._is_packable(t, max_segment_chars)]
+        groups = [
+            packable[i:i + max_segments_per_request]
+            for i in range(0, len(packable), max_segments_per_request)
+        ]
+        # A lone segment gains nothing from packing
+        groups = [g for g in groups if len(g) > 1]
+        
+        async def run_group(group: List[int]):
+            packed = await self._translate_packed(
+                [texts[i] for i in group], source_lang, target_lang, context_text
+            )
+            if packed is not None:
+                for i, item in zip(group, packed):
+                    results[i] = item
+        
+        await asyncio.gather(*[run_group(g) for g in groups])
+        
+        # Everything not handled by a packed request falls back to per-item calls
+        remaining = [i for i, r in enumerate(results) if r is None]
+        singles = await asyncio.gather(*[
+            self.translate(
+                text=texts[i],
+                source_lang=source_lang,
+                target_lang=target_lang,
+                context_text=context_text
+            )
+            for i in remaining
+        ])
+        for i, item in zip(remaining, singles):
+            results[i] = item
+        
+        return results
     
     def _build_translation_prompt(
         self, 
@@ -291,8 +568,7 @@ Text to translate:
             max_tokens = 4096
         
         # Get active node
-        node = self.get_active_node()
-        api_url = f"{node['url']}/v1/chat/completions"
+        node = self.get_active_node(stream=True)
         
         prompt = self._build_translation_prompt(text, source_lang, target_lang, context_text, is_document)
         
@@ -310,57 +586,73 @@ Text to translate:
             "chat_template_kwargs": {"enable_thinking": False}
         }
         
+        self._begin_request(node)
+        success = False
+        cancelled = False
+        first_token_ms = None
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                async with client.stream(
-                    "POST",
-                    api_url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                ) as response:
-                    response.raise_for_status()
-                    
-                    full_translation = ""
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            data_str = line[6:]  # Remove "data: " prefix
-                            if data_str == "[DONE]":
-                                break
-                            
-                            try:
-                                import json
-                                chunk_data = json.loads(data_str)
-                                if "choices" in chunk_data and len(chunk_data["choices"]) > 0:
-                                    delta = chunk_data["choices"][0].get("delta", {})
-                                    content = delta.get("content", "")
-                                    if content:
-                                        full_translation += content
-                                        yield {
-                                            "token": content,
-                                            "full_text": full_translation,
-                                            "done": False,
-                                            "node_id": node['id']
-                                        }
-                            except Exception as e:
-                                logger.error(f"Error parsing chunk: {e}")
-                    
-                    # Final chunk with timing
-                    inference_time_ms = int((time.time() - start_time) * 1000)
-                    yield {
-                        "token": "",
-                        "full_text": full_translation,
-                        "done": True,
-                        "inference_time_ms": inference_time_ms,
-                        "node_id": node['id'],
-                        "node_name": node['name']
-                    }
-                    
+            client = self._get_client(node['url'])
+            async with client.stream(
+                "POST",
+                "/v1/chat/completions",
+                json=payload
+            ) as response:
+                response.raise_for_status()
+                
+                full_translation = ""
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        data_str = line[6:]  # Remove "data: " prefix
+                        if data_str == "[DONE]":
+                            break
+                        
+                        try:
+                            import json
+                            chunk_data = json.loads(data_str)
+                            if "choices" in chunk_data and len(chunk_data["choices"]) > 0:
+                                delta = chunk_data["choices"][0].get("delta", {})
+                                content = delta.get("content", "")
+                                if content:
+                                    if first_token_ms is None:
+                                        first_token_ms = (time.time() - start_time) * 1000
+                                    full_translation += content
+                                    yield {
+                                        "token": content,
+                                        "full_text": full_translation,
+                                        "done": False,
+                                        "node_id": node['id']
+                                    }
+                        except Exception as e:
+                            logger.error(f"Error parsing chunk: {e}")
+                
+                # Final chunk with timing
+                inference_time_ms = int((time.time() - start_time) * 1000)
+                success = True
+                yield {
+                    "token": "",
+                    "full_text": full_translation,
+                    "done": True,
+                    "inference_time_ms": inference_time_ms,
+                    "node_id": node['id'],
+                    "node_name": node['name']
+                }
+                
+        except (GeneratorExit, asyncio.CancelledError):
+            # The consumer stopped iterating (client disconnect or cancelled pump)
+            cancelled = True
+            raise
         except Exception as e:
             logger.error(f"Streaming error: {str(e)}")
             yield {
                 "error": str(e),
                 "done": True
             }
+        finally:
+            # Streams vary wildly in length, so track time-to-first-token
+            latency_ms = first_token_ms if first_token_ms is not None else (time.time() - start_time) * 1000
+            self._end_request(
+                node, latency_ms, success, metric="ttft_ewma_ms", cancelled=cancelled and not success
+            )
 
 
 # Global client instance
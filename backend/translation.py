@@ -1,6 +1,7 @@
 """
 Translation utilities - language detection and reliability checking
 """
+import re
 from typing import Dict, Tuple
 
 
@@ -24,13 +25,12 @@ def check_translation_reliability(
         return True, ""
     
     # Use language detection on output
-    detector = LanguageDetector()
-    detected_output = detector.detect(translated_text)
-    detected_input = detector.detect(source_text)
+    detected_output = language_detector.detect(translated_text)
+    detected_input = language_detector.detect(source_text)
     
     # For non-Latin target languages (zh, ja, ko, ar, ru, etc.)
     # Check if output contains expected characters
-    non_latin_targets = {'zh', 'ja', 'ko', 'ar', 'ru', 'el', 'he', 'th'}
+    non_latin_targets = {'zh', 'ja', 'ko', 'ar', 'ru', 'el', 'he', 'th', 'hi'}
     
     if target_lang.lower() in non_latin_targets:
         if detected_output != target_lang.lower() and detected_output == detected_input:
@@ -45,13 +45,112 @@ def check_translation_reliability(
     return True, ""
 
 
+# Unicode ranges for the non-Latin scripts we can identify from characters alone
+_SCRIPT_RANGES = {
+    "zh": [(0x4E00, 0x9FFF), (0x3400, 0x4DBF)],
+    "ja": [(0x3040, 0x309F), (0x30A0, 0x30FF)],
+    "ko": [(0xAC00, 0xD7AF), (0x1100, 0x11FF)],
+    "ar": [(0x0600, 0x06FF)],
+    "ru": [(0x0400, 0x04FF)],
+    "el": [(0x0370, 0x03FF)],
+    "he": [(0x0590, 0x05FF)],
+    "th": [(0x0E00, 0x0E7F)],
+    "hi": [(0x0900, 0x097F)],
+}
+_LATIN_RANGES = [(0x41, 0x5A), (0x61, 0x7A), (0xC0, 0x24F), (0x1E00, 0x1EFF)]
+
+# Each script maps to one private-use tag character so a single str.translate
+# pass turns the sample into a string whose tag counts are the histogram
+_SCRIPT_TAGS = {code: chr(0xE000 + i) for i, code in enumerate(_SCRIPT_RANGES)}
+_LATIN_TAG = chr(0xE000 + len(_SCRIPT_RANGES))
+_SCRIPT_TABLE = {}
+for _code, _ranges in _SCRIPT_RANGES.items():
+    for _lo, _hi in _ranges:
+        _SCRIPT_TABLE.update(dict.fromkeys(range(_lo, _hi + 1), _SCRIPT_TAGS[_code]))
+for _lo, _hi in _LATIN_RANGES:
+    _SCRIPT_TABLE.update(dict.fromkeys(range(_lo, _hi + 1), _LATIN_TAG))
+
+# A non-Latin script wins once it makes up this share of the letters
+_SCRIPT_DOMINANCE = 0.2
+_SAMPLE_CHARS = 4096
+
+# Word-unigram profiles (frequent function words) plus characters that are
+# distinctive for a language, for telling Latin-script languages apart
+_LATIN_WORDS = {
+    "en": "the and is are was were of to in that it with for this have has you not be on at by from which will would they we",
+    "es": "el la los las de que y en un una es por con para del se no como está pero más su al lo muy son",
+    "fr": "le la les de des et est un une du que qui pas pour dans avec sur ce il elle nous vous sont au aux mais ne",
+    "de": "der die das und ist nicht ein eine zu den mit von sich auf dem des ich sie es wir auch für sind wird im",
+    "it": "il lo la gli le di che e è un una per non con del della sono si da anche ma come questo nel alla",
+    "pt": "o a os as de que e do da em um uma não para com por é são mais dos das no na mas você ele",
+    "nl": "de het een en van ik je dat niet is op te zijn met voor er maar ook wat dit wordt naar bij",
+    "sv": "och att det som är en på för med inte jag har till av den var om ett men de vi kan så",
+    "no": "og det er som en på til med ikke jeg har av for at den var de vi kan seg så skal også",
+    "da": "og det er at en til på med ikke jeg har af for den var de vi kan sig så skal også være",
+    "fi": "ja on ei se että hän oli ole mutta kuin tämä joka myös niin kun ovat minä sinä me te",
+    "pl": "i w z na nie się jest to że do o jak ale co tak od po przez dla są czy jego",
+    "tr": "ve bir bu da de için ile çok ne daha gibi olan var ama değil ben sen o mi olarak",
+    "vi": "và của là có không một những được trong cho với các người này đã để khi như",
+    "id": "dan yang di ini itu dengan untuk tidak dari dalam akan ada saya kami mereka juga atau pada bisa sudah",
+    "ms": "dan yang di ini itu dengan untuk tidak dari dalam akan ada saya kami mereka juga atau pada boleh sudah adalah kerana",
+    "yo": "ni ti àti won si ó mo o wa fún kò jẹ́ rẹ̀ naa yìí",
+    "ig": "na ya nke bụ ọ ha m gị ka dị ahụ a nwere maka ma",
+}
+_LATIN_CHARS = {
+    "es": "ñ¿¡",
+    "fr": "çèêàùœ",
+    "de": "ßäöü",
+    "pt": "ãõ",
+    "sv": "åäö",
+    "no": "æøå",
+    "da": "æøå",
+    "fi": "äö",
+    "pl": "łąęśźżćń",
+    "tr": "ğşı",
+    "vi": "ơưđạảấầẩẫậắằẳẵặẹẻẽếềểễệỉịọỏốồổỗộớờởỡợụủứừửữựỳỵỷỹ",
+    "yo": "ẹọṣ",
+    "ig": "ịọụṅ",
+}
+_WORD_LANGS = {}
+for _code, _words in _LATIN_WORDS.items():
+    for _word in _words.split():
+        _WORD_LANGS.setdefault(_word, []).append(_code)
+_WORD_PATTERN = re.compile(r"[^\W\d_]+")
+_MIN_LATIN_SCORE = 2
+
+
 class LanguageDetector:
-    """Simple language detection based on character patterns"""
+    """Language detection from a script histogram and a Latin word/character model"""
+    
+    @staticmethod
+    def _sample(text: str) -> str:
+        """Bounded sample: head, middle and tail of long texts"""
+        if len(text) <= _SAMPLE_CHARS:
+            return text
+        part = _SAMPLE_CHARS // 4
+        middle = len(text) // 2
+        return text[:2 * part] + text[middle:middle + part] + text[-part:]
+    
+    @staticmethod
+    def _detect_latin(sample: str) -> str:
+        """Score Latin-script languages by function words and distinctive letters"""
+        lowered = sample.lower()
+        scores = dict.fromkeys(_LATIN_WORDS, 0)
+        for word in _WORD_PATTERN.findall(lowered):
+            for code in _WORD_LANGS.get(word, ()):
+                scores[code] += 1
+        for code, chars in _LATIN_CHARS.items():
+            scores[code] += sum(lowered.count(c) for c in chars)
+        
+        best = max(scores, key=scores.get)
+        if scores[best] < _MIN_LATIN_SCORE:
+            return "auto"
+        return best
     
     @staticmethod
     def detect(text: str) -> str:
         """
-        Detect language from text using character patterns
+        Detect language from text using a single-pass script histogram
         
         Returns:
             Language code (en, es, zh, etc.) or "auto"
@@ -59,40 +158,25 @@ class LanguageDetector:
         if not text or len(text.strip()) < 3:
             return "auto"
         
-        # Check for Chinese characters
-        if any('\u4e00' <= char <= '\u9fff' for char in text):
-            return "zh"
-        
-        # Check for Japanese characters (Hiragana, Katakana)
-        if any('\u3040' <= char <= '\u309f' or '\u30a0' <= char <= '\u30ff' for char in text):
-            return "ja"
+        sample = LanguageDetector._sample(text)
+        tagged = sample.translate(_SCRIPT_TABLE)
+        counts = {code: tagged.count(tag) for code, tag in _SCRIPT_TAGS.items()}
+        latin = tagged.count(_LATIN_TAG)
         
-        # Check for Korean characters
-        if any('\uac00' <= char <= '\ud7af' for char in text):
-            return "ko"
+        # Japanese mixes kana with kanji, so any kana claims the Han characters
+        if counts["ja"]:
+            counts["ja"] += counts["zh"]
+            counts["zh"] = 0
         
-        # Check for Arabic characters
-        if any('\u0600' <= char <= '\u06ff' for char in text):
-            return "ar"
-        
-        # Check for Cyrillic (Russian)
-        if any('\u0400' <= char <= '\u04ff' for char in text):
-            return "ru"
-        
-        # Check for Greek
-        if any('\u0370' <= char <= '\u03ff' for char in text):
-            return "el"
-        
-        # Check for Hebrew
-        if any('\u0590' <= char <= '\u05ff' for char in text):
-            return "he"
+        letters = latin + sum(counts.values())
+        if not letters:
+            return "auto"
         
-        # Check for Thai
-        if any('\u0e00' <= char <= '\u0e7f' for char in text):
-            return "th"
+        script = max(counts, key=counts.get)
+        if counts[script] and counts[script] >= _SCRIPT_DOMINANCE * letters:
+            return script
         
-        # Default to auto for Latin scripts (will need context to distinguish)
-        return "auto"
+        return LanguageDetector._detect_latin(sample)
 
 
 # Supported languages mapping
@@ -0,0 +1,620 @@
+"""
+Segment-level translation memory
+Stores sentence pairs per language pair in SQLite, with exact lookups by
+digest and fuzzy lookups through a MinHash/LSH index over character n-grams
+"""
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Set, Tuple, AsyncIterator
+import logging
+
+from parallax_client import parallax_client
+
+logger = logging.getLogger(__name__)
+
+# Translation memory location (set to None to keep it memory-only)
+TM_DB_PATH = "./translation_memory.db"
+
+# Segments kept in the in-memory indexes; older ones are only found on disk (exact matches)
+TM_MAX_SEGMENTS = 100000
+
+# Rows indexed per lock hold while the indexes are rebuilt at startup
+TM_LOAD_CHUNK = 1000
+
+# Segments are sentences, or lines for text without sentence punctuation
+_SEGMENT_SPLIT = re.compile(r"(\s*\n\s*|(?<=[.!?。！？])\s+)")
+_WHITESPACE = re.compile(r"\s+")
+
+_NGRAM = 3
+_NUM_PERM = 32
+_BANDS = 8
+_ROWS = _NUM_PERM // _BANDS
+_MERSENNE_PRIME = (1 << 61) - 1
+# Fixed permutation parameters so signatures are stable across restarts
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME | 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME
+    )
+    for i in range(_NUM_PERM)
+]
+
+
+def split_segments(text: str) -> List[Tuple[str, bool]]:
+    """
+    Split text into (piece, translatable) pairs
+
+    Translatable pieces are sentences or lines; the others are the whitespace
+    between them. Joining all pieces gives back the original text.
+    """
+    pieces = []
+    for i, piece in enumerate(_SEGMENT_SPLIT.split(text)):
+        if not piece:
+            continue
+        # Odd indices are the captured separators
+        pieces.append((piece, i % 2 == 0 and bool(piece.strip())))
+    return pieces
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text.strip())
+
+
+def _digest(text: str) -> str:
+    return hashlib.md5(_normalize(text).encode()).hexdigest()
+
+
+def _shingles(text: str) -> Set[str]:
+    normalized = _normalize(text).lower()
+    if len(normalized) <= _NGRAM:
+        return {normalized}
+    return {normalized[i:i + _NGRAM] for i in range(len(normalized) - _NGRAM + 1)}
+
+
+def _minhash(shingles: Set[str]) -> List[int]:
+    hashes = [zlib.crc32(s.encode()) for s in shingles]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _fuzzy_context(
+    indices: List[int],
+    matches: Dict[int, "MemoryMatch"],
+    source_lang: str,
+    target_lang: str,
+    context_text: Optional[str]
+) -> Optional[str]:
+    """Context for the model: similar earlier sentences keep terminology consistent across revisions"""
+    hints = [
+        f"Original ({source_lang}): {matches[i].source_text}\nTranslation ({target_lang}): {matches[i].translation}"
+        for i in indices if i in matches
+    ]
+    if context_text:
+        hints.insert(0, context_text)
+    return "\n---\n".join(hints) if hints else None
+
+
+@dataclass
+class MemoryMatch:
+    """A translation memory hit"""
+    source_text: str
+    translation: str
+    score: float  # 1.0 for exact matches
+
+
+class _FuzzyIndex:
+    """MinHash LSH buckets for one language pair"""
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[int, int], Set[int]] = {}
+        self.entries: Dict[int, Tuple[str, str]] = {}
+        self.entry_buckets: Dict[int, List[Tuple[int, int]]] = {}
+
+    def add(self, entry_id: int, source_text: str, translation: str):
+        signature = _minhash(_shingles(source_text))
+        self.entries[entry_id] = (source_text, translation)
+        keys = self.entry_buckets[entry_id] = []
+        for band in range(_BANDS):
+            key = (band, hash(tuple(signature[band * _ROWS:(band + 1) * _ROWS])))
+            self.buckets.setdefault(key, set()).add(entry_id)
+            keys.append(key)
+
+    def remove(self, entry_id: int):
+        self.entries.pop(entry_id, None)
+        for key in self.entry_buckets.pop(entry_id, []):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def query(self, text: str, threshold: float) -> Optional[MemoryMatch]:
+        shingles = _shingles(text)
+        signature = _minhash(shingles)
+        candidates: Set[int] = set()
+        for band in range(_BANDS):
+            key = (band, hash(tuple(signature[band * _ROWS:(band + 1) * _ROWS])))
+            candidates |= self.buckets.get(key, set())
+
+        best = None
+        for entry_id in candidates:
+            source_text, translation = self.entries[entry_id]
+            score = _jaccard(shingles, _shingles(source_text))
+            if score >= threshold and (best is None or score > best.score):
+                best = MemoryMatch(source_text, translation, score)
+        return best
+
+
+class TranslationMemory:
+    """
+    Sentence-level translation memory
+
+    Exact matches are reused verbatim; fuzzy matches are not reused but are
+    passed to the model as context so revised sentences keep the same
+    terminology as their previous version.
+
+    The in-memory indexes hold the max_segments most recently stored pairs.
+    Older pairs stay in SQLite, where exact lookups still find them. Lookups
+    and stores hash and touch SQLite, so the async paths run them in a
+    worker thread. The indexes are rebuilt from SQLite on a background
+    thread; until that finishes, exact lookups also check SQLite.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        fuzzy_threshold: float = 0.6,
+        max_segments: int = TM_MAX_SEGMENTS
+    ):
+        """
+        Initialize translation memory
+
+        Args:
+            db_path: SQLite file for stored segment pairs (None = memory only)
+            fuzzy_threshold: Minimum character 3-gram Jaccard similarity for a fuzzy match
+            max_segments: Maximum number of segment pairs kept in the in-memory indexes
+        """
+        self.fuzzy_threshold = fuzzy_threshold
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._exact: Dict[Tuple[str, str, str], Tuple[str, str]] = {}
+        self._fuzzy: Dict[Tuple[str, str], _FuzzyIndex] = {}
+        # Entry ids in least-recently-stored order, for eviction
+        self._ids: "OrderedDict[Tuple[str, str, str], int]" = OrderedDict()
+        self._next_id = 0
+        self.evictions = 0
+
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._loaded = threading.Event()
+        self._stop_loading = threading.Event()
+        self._loader: Optional[threading.Thread] = None
+        if db_path:
+            self._open_db(db_path)
+        if self._db is None:
+            self._loaded.set()
+
+    def _open_db(self, db_path: str):
+        """Open the SQLite store and start rebuilding the in-memory indexes from it"""
+        try:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS translation_memory (
+                    source_lang TEXT NOT NULL,
+                    target_lang TEXT NOT NULL,
+                    source_hash TEXT NOT NULL,
+                    source_text TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    timestamp REAL NOT NULL,
+                    PRIMARY KEY (source_lang, target_lang, source_hash)
+                )"""
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS ix_translation_memory_timestamp "
+                "ON translation_memory (timestamp)"
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Translation memory persistence disabled: {str(e)}")
+            self._db = None
+            return
+        self._loader = threading.Thread(
+            target=self._load_indexes, args=(db_path,), name="TranslationMemoryLoader", daemon=True
+        )
+        self._loader.start()
+
+    def _load_indexes(self, db_path: str):
+        """Index the newest stored pairs, behind any pairs stored since startup"""
+        loaded = 0
+        try:
+            db = sqlite3.connect(db_path)
+            try:
+                cursor = db.execute(
+                    "SELECT source_lang, target_lang, source_hash, source_text, translation "
+                    "FROM translation_memory ORDER BY timestamp DESC LIMIT ?",
+                    (self.max_segments,)
+                )
+                while not self._stop_loading.is_set():
+                    rows = cursor.fetchmany(TM_LOAD_CHUNK)
+                    if not rows or len(self._ids) >= self.max_segments:
+                        break
+                    with self._lock:
+                        for source_lang, target_lang, source_hash, source_text, translation in rows:
+                            key = (source_lang, target_lang, source_hash)
+                            if key in self._ids:
+                                # Stored again since startup; the newer pair wins
+                                continue
+                            if len(self._ids) >= self.max_segments:
+                                break
+                            self._index(source_lang, target_lang, source_hash, source_text, translation)
+                            # Rows come newest first and are all older than pairs stored since startup
+                            self._ids.move_to_end(key, last=False)
+                            loaded += 1
+            finally:
+                db.close()
+            logger.info(f"Translation memory loaded {loaded} segments from {db_path}")
+        except sqlite3.Error as e:
+            logger.error(f"Translation memory load error: {str(e)}")
+        finally:
+            self._loaded.set()
+
+    def _index(self, source_lang: str, target_lang: str, source_hash: str, source_text: str, translation: str):
+        key = (source_lang, target_lang, source_hash)
+        index = self._fuzzy.setdefault((source_lang, target_lang), _FuzzyIndex())
+        self._exact[key] = (source_text, translation)
+        entry_id = self._ids.get(key)
+        if entry_id is not None:
+            # Same source again: keep the newest translation, no need to re-bucket
+            index.entries[entry_id] = (source_text, translation)
+            self._ids.move_to_end(key)
+            return
+        entry_id = self._ids[key] = self._next_id
+        index.add(entry_id, source_text, translation)
+        self._next_id += 1
+        while len(self._ids) > self.max_segments:
+            old_key, old_id = self._ids.popitem(last=False)
+            del self._exact[old_key]
+            self._fuzzy[old_key[:2]].remove(old_id)
+            self.evictions += 1
+
+    def _disk_lookup(self, source_lang: str, target_lang: str, source_hash: str) -> Optional[Tuple[str, str]]:
+        """Exact lookup of a pair evicted from memory or not loaded yet (caller holds self._lock)"""
+        if self._db is None or (self._loaded.is_set() and len(self._ids) < self.max_segments):
+            return None
+        try:
+            return self._db.execute(
+                "SELECT source_text, translation FROM translation_memory "
+                "WHERE source_lang = ? AND target_lang = ? AND source_hash = ?",
+                (source_lang, target_lang, source_hash)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Translation memory read error: {str(e)}")
+            return None
+
+    def lookup(self, text: str, source_lang: str, target_lang: str) -> Optional[MemoryMatch]:
+        """Return an exact match, else the best fuzzy match above threshold, else None"""
+        source_hash = _digest(text)
+        with self._lock:
+            exact = self._exact.get((source_lang, target_lang, source_hash))
+            if exact is None:
+                exact = self._disk_lookup(source_lang, target_lang, source_hash)
+            if exact is not None:
+                self.exact_hits += 1
+                return MemoryMatch(exact[0], exact[1], 1.0)
+
+            index = self._fuzzy.get((source_lang, target_lang))
+            match = index.query(text, self.fuzzy_threshold) if index else None
+            if match is not None:
+                self.fuzzy_hits += 1
+            else:
+                self.misses += 1
+            return match
+
+    def lookup_segments(
+        self,
+        pieces: List[Tuple[str, bool]],
+        source_lang: str,
+        target_lang: str
+    ) -> Dict[int, MemoryMatch]:
+        """Look up every translatable piece from split_segments(), keyed by piece index"""
+        matches = {}
+        for i, (piece, translatable) in enumerate(pieces):
+            if translatable:
+                match = self.lookup(piece, source_lang, target_lang)
+                if match is not None:
+                    matches[i] = match
+        return matches
+
+    def add(self, text: str, translation: str, source_lang: str, target_lang: str):
+        """Store a segment pair"""
+        self.add_many([(text, translation)], source_lang, target_lang)
+
+    def add_many(self, pairs: List[Tuple[str, str]], source_lang: str, target_lang: str):
+        """Store (text, translation) segment pairs in one transaction"""
+        if not pairs:
+            return
+        now = time.time()
+        rows = [(source_lang, target_lang, _digest(text), text, translation, now) for text, translation in pairs]
+        with self._lock:
+            for _, _, source_hash, text, translation, _ in rows:
+                self._index(source_lang, target_lang, source_hash, text, translation)
+            if self._db is not None:
+                try:
+                    self._db.execute("BEGIN")
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO translation_memory "
+                        "(source_lang, target_lang, source_hash, source_text, translation, timestamp) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        rows
+                    )
+                    self._db.execute("COMMIT")
+                except sqlite3.Error as e:
+                    logger.error(f"Translation memory write error: {str(e)}")
+                    if self._db.in_transaction:
+                        self._db.execute("ROLLBACK")
+
+    async def iter_translate(
+        self,
+        text: str,
+        source_lang: str,
+        target_lang: str,
+        max_segments_per_request: int = 16,
+        context_text: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Translate text segment by segment, reusing stored segments
+
+        Only segments without an exact match are sent to the model, packed in
+        document order into groups that are translated concurrently. Yields one
+        dict per piece, in order: {"text", "segment", "reused", "success"} plus
+        "model" or "error" for segments that went to the model.
+        """
+        pieces = split_segments(text)
+        matches = await asyncio.to_thread(self.lookup_segments, pieces, source_lang, target_lang)
+        new_segments = [
+            i for i, (_, translatable) in enumerate(pieces)
+            if translatable and (i not in matches or matches[i].score < 1.0)
+        ]
+
+        groups = [
+            new_segments[i:i + max_segments_per_request]
+            for i in range(0, len(new_segments), max_segments_per_request)
+        ]
+
+        async def run_group(group: List[int]) -> Dict[int, Dict[str, Any]]:
+            results = await parallax_client.translate_batch(
+                texts=[pieces[i][0].strip() for i in group],
+                source_lang=source_lang,
+                target_lang=target_lang,
+                max_segments_per_request=max_segments_per_request,
+                context_text=_fuzzy_context(group, matches, source_lang, target_lang, context_text)
+            )
+            pairs = [
+                (pieces[i][0].strip(), result["translation"])
+                for i, result in zip(group, results) if result["success"]
+            ]
+            await asyncio.to_thread(self.add_many, pairs, source_lang, target_lang)
+            return dict(zip(group, results))
+
+        tasks = [asyncio.ensure_future(run_group(g)) for g in groups]
+        group_of = {i: g for g, group in enumerate(groups) for i in group}
+        try:
+            for i, (piece, translatable) in enumerate(pieces):
+                if not translatable:
+                    yield {"text": piece, "segment": False, "reused": False, "success": True}
+                    continue
+
+                # Keep the whitespace that is stripped off stored/translated segments
+                leading = piece[:len(piece) - len(piece.lstrip())]
+                trailing = piece[len(piece.rstrip()):]
+                if i not in group_of:
+                    yield {
+                        "text": leading + matches[i].translation + trailing,
+                        "segment": True,
+                        "reused": True,
+                        "success": True
+                    }
+                    continue
+
+                result = (await tasks[group_of[i]])[i]
+                if result["success"]:
+                    yield {
+                        "text": leading + result["translation"] + trailing,
+                        "segment": True,
+                        "reused": False,
+                        "success": True,
+                        "model": result.get("model")
+                    }
+                else:
+                    yield {
+                        "text": piece,
+                        "segment": True,
+                        "reused": False,
+                        "success": False,
+                        "error": result.get("error")
+                    }
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def translate(self, text: str, source_lang: str, target_lang: str) -> Dict[str, Any]:
+        """
+        Translate text through the memory
+
+        Returns:
+            Dict shaped like ParallaxClient.translate(), plus reused/total segment counts
+        """
+        start_time = time.time()
+        parts = []
+        reused = total = 0
+        model = "translation-memory"
+        errors = []
+        async for piece in self.iter_translate(text, source_lang, target_lang):
+            parts.append(piece["text"])
+            if piece["reused"]:
+                reused += 1
+            if piece.get("model"):
+                model = piece["model"]
+            if not piece["success"]:
+                errors.append(piece.get("error") or "Translation failed")
+            if piece["segment"]:
+                total += 1
+
+        inference_time_ms = int((time.time() - start_time) * 1000)
+        if errors:
+            return {"success": False, "error": errors[0], "inference_time_ms": inference_time_ms}
+        return {
+            "success": True,
+            "translation": "".join(parts),
+            "inference_time_ms": inference_time_ms,
+            "model": model,
+            "source_lang": source_lang,
+            "target_lang": target_lang,
+            "reused_segments": reused,
+            "total_segments": total
+        }
+
+    async def translate_streaming(
+        self,
+        text: str,
+        source_lang: str,
+        target_lang: str,
+        context_text: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a document translation through the memory
+
+        Exact matches are emitted as soon as they are reached. Each stretch of
+        new segments between them is token-streamed from the model with the
+        document prompt. Only single-segment stretches are stored: a streamed
+        translation of several segments can't be aligned back to them reliably,
+        and a misaligned pair would be reused verbatim from then on.
+
+        Yields chunks shaped like ParallaxClient.translate_streaming()
+        """
+        start_time = time.time()
+        pieces = split_segments(text)
+        matches = await asyncio.to_thread(self.lookup_segments, pieces, source_lang, target_lang)
+
+        def is_new(i: int) -> bool:
+            return pieces[i][1] and (i not in matches or matches[i].score < 1.0)
+
+        full_translation = ""
+        model = "translation-memory"
+        reused = total = 0
+        i = 0
+        while i < len(pieces):
+            piece, translatable = pieces[i]
+            if not is_new(i):
+                if translatable:
+                    total += 1
+                    reused += 1
+                    # Keep the whitespace that is stripped off stored segments
+                    leading = piece[:len(piece) - len(piece.lstrip())]
+                    trailing = piece[len(piece.rstrip()):]
+                    piece = leading + matches[i].translation + trailing
+                full_translation += piece
+                yield {"token": piece, "full_text": full_translation, "done": False}
+                i += 1
+                continue
+
+            # Stream the stretch of pieces up to the last new segment before the next reused one
+            end = i
+            while end + 1 < len(pieces) and (is_new(end + 1) or not pieces[end + 1][1]):
+                end += 1
+            while not pieces[end][1]:
+                end -= 1
+            run = [i + k for k, (_, t) in enumerate(pieces[i:end + 1]) if t]
+            total += len(run)
+            run_text = "".join(p for p, _ in pieces[i:end + 1])
+            leading = run_text[:len(run_text) - len(run_text.lstrip())]
+            trailing = run_text[len(run_text.rstrip()):]
+            if leading:
+                full_translation += leading
+                yield {"token": leading, "full_text": full_translation, "done": False}
+
+            run_translation = ""
+            async for chunk in parallax_client.translate_streaming(
+                text=run_text.strip(),
+                source_lang=source_lang,
+                target_lang=target_lang,
+                context_text=_fuzzy_context(run, matches, source_lang, target_lang, context_text),
+                is_document=True
+            ):
+                if "error" in chunk:
+                    yield {
+                        "token": "",
+                        "full_text": full_translation,
+                        "done": True,
+                        "error": chunk["error"],
+                        "inference_time_ms": int((time.time() - start_time) * 1000)
+                    }
+                    return
+                if chunk.get("done"):
+                    model = chunk.get("model", model)
+                    break
+                run_translation += chunk["token"]
+                full_translation += chunk["token"]
+                yield {"token": chunk["token"], "full_text": full_translation, "done": False}
+
+            if trailing:
+                full_translation += trailing
+                yield {"token": trailing, "full_text": full_translation, "done": False}
+
+            if len(run) == 1 and run_translation.strip():
+                await asyncio.to_thread(
+                    self.add, pieces[run[0]][0].strip(), run_translation.strip(), source_lang, target_lang
+                )
+            i = end + 1
+
+        yield {
+            "token": "",
+            "full_text": full_translation,
+            "done": True,
+            "inference_time_ms": int((time.time() - start_time) * 1000),
+            "model": model,
+            "reused_segments": reused,
+            "total_segments": total
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookup counters and size"""
+        return {
+            "segments": len(self._exact),
+            "max_segments": self.max_segments,
+            "loading": not self._loaded.is_set(),
+            "evictions": self.evictions,
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses
+        }
+
+    def close(self):
+        """Stop index loading and close the SQLite store"""
+        self._stop_loading.set()
+        if self._loader is not None:
+            self._loader.join()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+# Global instance
+translation_memory = TranslationMemory(db_path=TM_DB_PATH)
@@ -0,0 +1,119 @@
+"""
+Accuracy and size harness for the inter-peer activation transports.
+
+Packs hidden states the way peers send them (`pack_hidden_states`), encodes them with
+each transport in `ACTIVATION_TRANSPORTS`, decodes them again and reports the
+encoded size, encode/decode time and the error against the original tensor.
+
+By default it uses synthetic activations with a few outlier channels, like real
+residual streams. Pass activations captured from a model with `--hidden-states`
+(a safetensors file; every tensor in it is measured).
+
+Example:
+    python scripts/benchmark_activation_transport.py --tokens 1 4096 --hidden-size 3584
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add src to sys.path to allow importing parallax modules
+current_dir = Path(__file__).resolve().parent
+src_dir = current_dir.parent / "src"
+sys.path.append(str(src_dir))
+
+import mlx.core as mx
+
+try:
+    from parallax.p2p.message_util import (
+        encode_hidden_states,
+        pack_hidden_states,
+        supported_activation_transports,
+        unpack_hidden_states,
+    )
+except ImportError:
+    print(
+        f"Error: Could not import parallax modules. Please ensure 'src' directory is in PYTHONPATH or script is located in 'scripts/'. Added path: {src_dir}"
+    )
+    sys.exit(1)
+
+DTYPES = {"float16": mx.float16, "bfloat16": mx.bfloat16, "float32": mx.float32}
+
+
+def synthetic_hidden_states(num_tokens: int, hidden_size: int, dtype: mx.Dtype) -> mx.array:
+    x = mx.random.normal((num_tokens, hidden_size))
+    # A handful of massive-activation channels dominate each token's absmax
+    outliers = mx.random.randint(0, hidden_size, (max(1, hidden_size // 512),))
+    x[:, outliers] = x[:, outliers] * 50
+    return x.astype(dtype)
+
+
+def measure(name: str, hidden_states: mx.array, transports, iters: int):
+    frame = pack_hidden_states([hidden_states])
+    reference = hidden_states.astype(mx.float32)
+    for transport in transports:
+        start = time.perf_counter()
+        for _ in range(iters):
+            encoded = encode_hidden_states(frame, transport)
+        encode_ms = (time.perf_counter() - start) / iters * 1000
+
+        start = time.perf_counter()
+        for _ in range(iters):
+            decoded = unpack_hidden_states(encoded)[0]
+            mx.eval(decoded)
+        decode_ms = (time.perf_counter() - start) / iters * 1000
+
+        decoded = decoded.astype(mx.float32)
+        error = decoded - reference
+        max_error = mx.max(mx.abs(error)).item()
+        rel_rms = (mx.sqrt(mx.mean(error**2)) / mx.sqrt(mx.mean(reference**2))).item()
+        cosine = mx.min(
+            mx.sum(decoded * reference, axis=-1)
+            / mx.maximum(
+                mx.linalg.norm(decoded, axis=-1) * mx.linalg.norm(reference, axis=-1), 1e-12
+            )
+        ).item()
+        print(
+            f"{name:>24} {transport:>6} {len(encoded) / (1024 * 1024):>9.3f} "
+            f"{len(encoded) / len(frame):>6.3f} {encode_ms:>9.3f} {decode_ms:>9.3f} "
+            f"{max_error:>10.4g} {rel_rms:>10.4g} {cosine:>10.6f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure size and accuracy of the activation transports."
+    )
+    parser.add_argument("--tokens", type=int, nargs="+", default=[1, 512, 4096])
+    parser.add_argument("--hidden-size", type=int, default=3584)
+    parser.add_argument("--dtype", type=str, default="bfloat16", choices=list(DTYPES))
+    parser.add_argument(
+        "--hidden-states", type=str, default=None, help="safetensors file of captured activations"
+    )
+    parser.add_argument("--iters", type=int, default=5)
+    args = parser.parse_args()
+
+    transports = supported_activation_transports()
+    print(f"Transports: {transports}")
+    print(
+        f"{'tensor':>24} {'mode':>6} {'size MB':>9} {'ratio':>6} {'enc ms':>9} {'dec ms':>9} "
+        f"{'max err':>10} {'rel rms':>10} {'min cos':>10}"
+    )
+
+    if args.hidden_states is not None:
+        for name, hidden_states in mx.load(args.hidden_states).items():
+            measure(
+                name, hidden_states.reshape(-1, hidden_states.shape[-1]), transports, args.iters
+            )
+        return
+
+    mx.random.seed(0)
+    for num_tokens in args.tokens:
+        hidden_states = synthetic_hidden_states(num_tokens, args.hidden_size, DTYPES[args.dtype])
+        mx.eval(hidden_states)
+        measure(f"{num_tokens}x{args.hidden_size}", hidden_states, transports, args.iters)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Microbenchmark for the paged attention backends.
+
+Times decode-step `paged_attention` and `reshape_and_cache` for the Metal kernels
+and the pure-MLX backend across batch sizes and context lengths. The Metal backend
+is skipped when Metal is unavailable.
+
+Example:
+    python scripts/benchmark_paged_attention.py --batch-sizes 1 8 32 --context-lengths 512 4096
+"""
+
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+# Add src to sys.path to allow importing parallax modules
+current_dir = Path(__file__).resolve().parent
+src_dir = current_dir.parent / "src"
+sys.path.append(str(src_dir))
+
+import mlx.core as mx
+import numpy as np
+
+try:
+    from parallax.metal.paged_attention import mlx_backend
+    from parallax.metal.paged_attention.kernel import (
+        paged_attention_metal,
+        reshape_and_cache_metal,
+    )
+except ImportError:
+    print(
+        f"Error: Could not import parallax modules. Please ensure 'src' directory is in PYTHONPATH or script is located in 'scripts/'. Added path: {src_dir}"
+    )
+    sys.exit(1)
+
+DTYPES = {"float16": mx.float16, "bfloat16": mx.bfloat16, "float32": mx.float32}
+
+
+def time_ms(fn, warmup: int, iters: int) -> float:
+    for _ in range(warmup):
+        mx.eval(fn())
+    start = time.perf_counter()
+    for _ in range(iters):
+        mx.eval(fn())
+    return (time.perf_counter() - start) / iters * 1000
+
+
+def bench_case(args, backends, batch_size: int, context_len: int):
+    block_size = args.block_size
+    blocks_per_seq = (context_len + block_size - 1) // block_size
+    num_blocks = batch_size * blocks_per_seq
+    dtype = DTYPES[args.dtype]
+    scale = 1.0 / math.sqrt(args.head_dim)
+
+    cache_shape = (1, num_blocks, args.num_kv_heads, block_size, args.head_dim)
+    key_cache = mx.random.uniform(shape=cache_shape).astype(dtype)
+    value_cache = mx.random.uniform(shape=cache_shape).astype(dtype)
+    block_tables = mx.array(
+        np.random.permutation(num_blocks).astype(np.int32).reshape(batch_size, blocks_per_seq)
+    )
+    context_lengths = mx.full((batch_size,), context_len, dtype=mx.int32)
+    queries = mx.random.uniform(shape=(batch_size, args.num_heads, 1, args.head_dim)).astype(dtype)
+    new_kv = mx.random.uniform(shape=(batch_size, 1, args.num_kv_heads, args.head_dim)).astype(
+        dtype
+    )
+    mx.eval(key_cache, value_cache, block_tables, queries, new_kv)
+
+    row = {}
+    for name, (attention_fn, cache_fn) in backends.items():
+
+        def run_attention():
+            return attention_fn(
+                queries,
+                key_cache,
+                value_cache,
+                block_tables,
+                context_lengths,
+                block_size,
+                scale,
+                args.num_kv_heads,
+                0,
+            )
+
+        def run_cache():
+            return cache_fn(
+                new_kv,
+                new_kv,
+                key_cache,
+                value_cache,
+                block_tables,
+                context_lengths,
+                block_size,
+                0,
+            )
+
+        row[name] = (
+            time_ms(run_attention, args.warmup, args.iters),
+            time_ms(run_cache, args.warmup, args.iters),
+        )
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark Metal vs pure-MLX paged attention backends."
+    )
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--context-lengths", type=int, nargs="+", default=[256, 1024, 4096])
+    parser.add_argument("--num-heads", type=int, default=32)
+    parser.add_argument("--num-kv-heads", type=int, default=8)
+    parser.add_argument("--head-dim", type=int, default=128)
+    parser.add_argument("--block-size", type=int, default=64)
+    parser.add_argument("--dtype", type=str, default="float16", choices=list(DTYPES))
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--iters", type=int, default=20)
+    args = parser.parse_args()
+
+    backends = {"mlx": (mlx_backend.paged_attention, mlx_backend.reshape_and_cache)}
+    if mx.metal.is_available():
+        backends = {"metal": (paged_attention_metal, reshape_and_cache_metal), **backends}
+    else:
+        print("Metal is not available; benchmarking the pure-MLX backend only.")
+
+    header = f"{'batch':>6} {'context':>8}"
+    for name in backends:
+        header += f" {name + ' attn ms':>14} {name + ' cache ms':>15}"
+    print(header)
+    for batch_size in args.batch_sizes:
+        for context_len in args.context_lengths:
+            row = bench_case(args, backends, batch_size, context_len)
+            line = f"{batch_size:>6} {context_len:>8}"
+            for attn_ms, cache_ms in row.values():
+                line += f" {attn_ms:>14.3f} {cache_ms:>15.3f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
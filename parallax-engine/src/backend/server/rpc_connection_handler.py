@@ -178,6 +178,7 @@ class RPCConnectionHandler(ConnectionHandler):
             model_info=self.scheduler.model_info,
             kvcache_mem_ratio=node_json.get("kvcache_mem_ratio"),
             param_mem_ratio=node_json.get("param_mem_ratio"),
+            kv_cache_dtype=node_json.get("kv_cache_dtype", "auto"),
             max_concurrent_requests=node_json.get("max_concurrent_requests"),
             max_sequence_length=node_json.get("max_sequence_length"),
             is_active=node_json.get("is_active", True),
@@ -1,3 +1,4 @@
+import asyncio
 import threading
 import time
 from typing import List
@@ -258,33 +259,39 @@ class SchedulerManage:
         )
         logger.debug("RPCConnectionHandler initialized")
 
-    def get_routing_table(self, request_id, received_ts):
-        """Block briefly until the scheduler assigns a routing path for the request.
+    async def get_routing_table(self, request_id, received_ts, timeout):
+        """Wait until the scheduler admits the request and assigns a routing path.
 
-        Distinguish three states via `RequestSignal.routing_table`:
-        - None: not yet decided, keep waiting up to timeout
-        - []: decided but no capacity (pipelines full), return immediately
-        - [..]: valid routing path, return immediately
+        The dispatcher resolves `RequestSignal.routed`, so the event loop is never
+        blocked while waiting. Requests that find every pipeline full wait in the
+        scheduler's admission queue until capacity frees up. Returns:
+        - None: not admitted within `timeout`; the request is withdrawn from the queue
+        - []: the scheduler is not bootstrapped or stopped before routing the request
+        - [..]: valid routing path
         """
         logger.debug(f"Routing table requested for request_id={request_id}")
+        if not self.scheduler.is_bootstrapped():
+            # Nothing dispatches requests until bootstrap; don't hold the caller
+            logger.debug(f"Scheduler not bootstrapped; rejecting request_id={request_id}")
+            return []
         request = RequestSignal(request_id, received_ts)
         self.scheduler.receive_request(request)
 
-        # Wait up to 5 seconds, but return immediately if the routing table is set (including an empty list)
         start_time = time.time()
-        while request.routing_table is None and (time.time() - start_time) < 5.0:
-            time.sleep(0.05)
-
-        # Return the routing_table
-        if request.routing_table is None:
+        try:
+            routing_table = await asyncio.wait_for(asyncio.wrap_future(request.routed), timeout)
+        except asyncio.TimeoutError:
+            request.routed.cancel()
             logger.debug(
                 f"Routing table not ready after {(time.time() - start_time):.2f}s for request_id={request_id}"
             )
-        else:
-            logger.debug(
-                f"Routing table resolved for request_id={request_id}: {request.routing_table}"
-            )
-        return request.routing_table
+            return None
+
+        logger.debug(
+            f"Routing table resolved for request_id={request_id} after "
+            f"{(time.time() - start_time):.3f}s: {routing_table}"
+        )
+        return routing_table
 
     def get_schedule_status(self):
         """
@@ -135,6 +135,8 @@ if __name__ == "__main__":
                 kvcache_mem_ratio=args.kvcache_mem_ratio,
                 shared_state=shared_state.dict,  # Pass dict to subprocess
                 log_level=args.log_level,
+                kv_cache_dtype=args.kv_cache_dtype,
+                activation_transport=args.activation_transport,
             )
 
             # Launch all executor processes (including tp_rank=0)
@@ -183,6 +185,8 @@ if __name__ == "__main__":
                 kvcache_mem_ratio=args.kvcache_mem_ratio,
                 shared_state=shared_state.dict,  # Pass dict to subprocess
                 log_level=args.log_level,
+                kv_cache_dtype=args.kv_cache_dtype,
+                activation_transport=args.activation_transport,
             )
 
             # Wait for layer allocation from scheduler (via shared state)
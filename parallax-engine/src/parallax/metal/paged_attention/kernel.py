@@ -3,9 +3,34 @@ from typing import Dict, List, Optional
 
 import mlx.core as mx
 
+from parallax.metal.paged_attention import mlx_backend
+from parallax.metal.paged_attention.mlx_backend import QuantizedPagedCache
+
 # Cache for compiled kernels
 _KERNELS: Dict[str, object] = {}
 
+# "metal" or "mlx"; resolved lazily from PARALLAX_PAGED_ATTENTION_BACKEND or Metal availability
+_BACKEND: Optional[str] = None
+
+
+def get_backend() -> str:
+    """Returns the active paged attention backend: "metal" or the pure-MLX "mlx" fallback."""
+    global _BACKEND
+    if _BACKEND is None:
+        backend = os.environ.get("PARALLAX_PAGED_ATTENTION_BACKEND")
+        if backend is None:
+            backend = "metal" if mx.metal.is_available() else "mlx"
+        set_backend(backend)
+    return _BACKEND
+
+
+def set_backend(backend: str):
+    """Forces the paged attention backend, e.g. for benchmarking both on the same machine."""
+    global _BACKEND
+    if backend not in ("metal", "mlx"):
+        raise ValueError(f"Unsupported paged attention backend: {backend}")
+    _BACKEND = backend
+
 
 def _get_metal_source(filename):
     path = os.path.join(os.path.dirname(__file__), filename)
@@ -56,6 +81,100 @@ using namespace metal;
 
 
 def reshape_and_cache(
+    key: mx.array,
+    value: mx.array,
+    key_cache: mx.array,
+    value_cache: mx.array,
+    block_tables: mx.array,
+    context_lengths: mx.array,
+    block_size: int,
+    layer_idx: int,
+    slot_mapping: Optional[mx.array] = None,
+):
+    """
+    Writes new keys and values into the Paged KV Cache in place.
+    Dispatches to the Metal kernel or the pure-MLX backend, see `get_backend`;
+    int8 caches always use the pure-MLX backend.
+    """
+    if get_backend() == "mlx" or isinstance(key_cache, QuantizedPagedCache):
+        return mlx_backend.reshape_and_cache(
+            key,
+            value,
+            key_cache,
+            value_cache,
+            block_tables,
+            context_lengths,
+            block_size,
+            layer_idx,
+            slot_mapping=slot_mapping,
+        )
+    return reshape_and_cache_metal(
+        key,
+        value,
+        key_cache,
+        value_cache,
+        block_tables,
+        context_lengths,
+        block_size,
+        layer_idx,
+        slot_mapping=slot_mapping,
+    )
+
+
+def paged_attention(
+    queries: mx.array,
+    key_cache: mx.array,
+    value_cache: mx.array,
+    block_tables: mx.array,
+    context_lengths: mx.array,
+    block_size: int,
+    scale: float,
+    num_kv_heads: int,
+    layer_idx: int,
+    v_head_dim: Optional[int] = None,
+    top_k_indices: Optional[mx.array] = None,
+    window_size: Optional[int] = None,
+    sinks: Optional[mx.array] = None,
+) -> mx.array:
+    """
+    Paged Attention for decode steps.
+    Dispatches to the Metal kernel or the pure-MLX backend, see `get_backend`;
+    int8 caches always use the pure-MLX backend.
+    """
+    impl = paged_attention_metal
+    if get_backend() == "mlx" or isinstance(key_cache, QuantizedPagedCache):
+        impl = mlx_backend.paged_attention
+    return impl(
+        queries,
+        key_cache,
+        value_cache,
+        block_tables,
+        context_lengths,
+        block_size,
+        scale,
+        num_kv_heads,
+        layer_idx,
+        v_head_dim=v_head_dim,
+        top_k_indices=top_k_indices,
+        window_size=window_size,
+        sinks=sinks,
+    )
+
+
+def gather_kv_cache(
+    key_cache: mx.array,
+    value_cache: mx.array,
+    block_tables: mx.array,
+    layer_idx: int,
+):
+    """
+    Gathers the cached keys and values of a batch for prefill segments that attend
+    to an already cached prefix. Plain MLX gathers, shared by both backends.
+    """
+    return mlx_backend.gather_kv_cache(key_cache, value_cache, block_tables, layer_idx)
+
+
+def reshape_and_cache_metal(
     key: mx.array,  # (batch, target_len, num_kv_heads, head_dim)
     value: mx.array,  # ...
     key_cache: mx.array,  # (num_layers, num_blocks, num_kv_heads, block_size, head_dim)
@@ -212,11 +331,14 @@ def reshape_and_cache(
         verbose=False,
     )
 
-    mx.eval(outputs)
+    # The cache write is a side effect with no consumers in the graph, so it has to be
+    # scheduled explicitly. async_eval keeps it ordered ahead of the attention kernels on
+    # the same stream without blocking the host on every layer.
+    mx.async_eval(outputs)
     return key_cache, value_cache
 
 
-def paged_attention(
+def paged_attention_metal(
     queries: mx.array,
     key_cache: mx.array,
     value_cache: mx.array,
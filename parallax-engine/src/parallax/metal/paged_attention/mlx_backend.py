@@ -0,0 +1,230 @@
+"""
+Pure-MLX implementation of the paged KV cache kernels.
+
+Mirrors the signatures and semantics of the Metal kernels in `kernel.py` using MLX
+gather/scatter ops only, so the paged-KV path also runs where Metal is unavailable
+(Linux CI, CPU nodes). `kernel.py` selects this backend automatically.
+
+It also implements the int8 cache layout (`QuantizedPagedCache`), which the Metal
+kernels don't support: values are quantized on write and dequantized on gather.
+"""
+
+from typing import NamedTuple, Optional, Union
+
+import mlx.core as mx
+import numpy as np
+
+
+class QuantizedPagedCache(NamedTuple):
+    """
+    int8 paged KV cache storage with a scale per cached token and KV head.
+
+    Exposes the `shape` of the quantized values and the `dtype` keys and values are
+    dequantized to, so models can use it wherever they take a plain cache array.
+    """
+
+    data: mx.array  # (num_layers, num_blocks, num_kv_heads, block_size, head_dim), int8
+    scales: mx.array  # (num_layers, num_blocks, num_kv_heads, block_size, 1), compute dtype
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def dtype(self) -> mx.Dtype:
+        return self.scales.dtype
+
+
+PagedCache = Union[mx.array, QuantizedPagedCache]
+
+
+def quantize_kv(x: mx.array):
+    """Symmetric int8 quantization over the last axis; returns (int8 values, scales)."""
+    absmax = mx.max(mx.abs(x.astype(mx.float32)), axis=-1, keepdims=True)
+    # Quantize against the scale as stored, so dequantization sees the same value
+    scales = (absmax / 127.0).astype(x.dtype)
+    inv_scales = 1.0 / mx.maximum(scales.astype(mx.float32), 1e-12)
+    q = mx.clip(mx.round(x.astype(mx.float32) * inv_scales), -127, 127).astype(mx.int8)
+    return q, scales
+
+
+def _write_slots(cache: PagedCache, layer_idx: int, blocks, heads, offsets, x: mx.array):
+    if isinstance(cache, QuantizedPagedCache):
+        q, scales = quantize_kv(x)
+        cache.data[layer_idx, blocks, heads, offsets] = q
+        cache.scales[layer_idx, blocks, heads, offsets] = scales
+    else:
+        cache[layer_idx, blocks, heads, offsets] = x
+
+
+def _gather_blocks(cache: PagedCache, layer_idx: int, block_tables: mx.array) -> mx.array:
+    """Gathers (batch, max_blocks, kv_heads, block_size, dim) blocks of one layer."""
+    if isinstance(cache, QuantizedPagedCache):
+        data = cache.data[layer_idx][block_tables]
+        return data.astype(cache.dtype) * cache.scales[layer_idx][block_tables]
+    return cache[layer_idx][block_tables]
+
+
+def reshape_and_cache(
+    key: mx.array,
+    value: mx.array,
+    key_cache: PagedCache,  # (num_layers, num_blocks, num_kv_heads, block_size, head_dim)
+    value_cache: PagedCache,
+    block_tables: mx.array,  # (batch, max_blocks)
+    context_lengths: mx.array,  # (batch,)
+    block_size: int,
+    layer_idx: int,
+    slot_mapping: Optional[mx.array] = None,  # (batch * target_len,)
+):
+    """
+    Writes new keys and values into the Paged KV Cache with MLX scatter ops.
+    NOTE: Like the Metal kernel, this updates key_cache/value_cache in place, so
+    other references to the same cache arrays observe the write.
+    """
+    dtype = key.dtype
+    if key_cache.dtype != dtype:
+        raise ValueError(f"Key cache dtype {key_cache.dtype} does not match key dtype {dtype}")
+
+    if slot_mapping is None:
+        # Decode Mode: one token per sequence at position context_length - 1
+        batch_size = key.shape[0]
+        if key.ndim == 4:
+            if key.shape[1] == 1:
+                key = key.squeeze(1)
+                value = value.squeeze(1)
+            elif key.shape[2] == 1:
+                key = key.squeeze(2)
+                value = value.squeeze(2)
+
+        indices = context_lengths - 1
+        physical_blocks = block_tables[mx.arange(batch_size), indices // block_size]
+        slots = physical_blocks.astype(mx.int32) * block_size + (indices % block_size).astype(
+            mx.int32
+        )
+    else:
+        # Prefill Mode: (batch, target_len, heads, dim) -> (total_tokens, heads, dim)
+        if key.ndim == 4:
+            B, T, H, D = key.shape
+            key = key.reshape(B * T, H, D)
+            value = value.reshape(B * T, H, value.shape[3])
+
+        if slot_mapping.shape[0] != key.shape[0]:
+            raise ValueError(
+                f"Slot mapping length {slot_mapping.shape[0]} != tokens {key.shape[0]}"
+            )
+
+        # Padding tokens are mapped to -1 and must not be written. The slot mapping
+        # is a small host-built input, so filtering it on the host is cheap.
+        valid = np.flatnonzero(np.array(slot_mapping) >= 0)
+        if len(valid) < slot_mapping.shape[0]:
+            valid_idx = mx.array(valid.astype(np.int32))
+            key = key[valid_idx]
+            value = value[valid_idx]
+            slot_mapping = slot_mapping[valid_idx]
+        slots = slot_mapping.astype(mx.int32)
+
+    if slots.shape[0] == 0:
+        return key_cache, value_cache
+
+    num_kv_heads = key.shape[1]
+    blocks = (slots // block_size)[:, None]
+    offsets = (slots % block_size)[:, None]
+    heads = mx.arange(num_kv_heads)[None, :]
+    _write_slots(key_cache, layer_idx, blocks, heads, offsets, key)
+    _write_slots(value_cache, layer_idx, blocks, heads, offsets, value)
+    return key_cache, value_cache
+
+
+def gather_kv_cache(
+    key_cache: PagedCache,
+    value_cache: PagedCache,
+    block_tables: mx.array,  # (batch, max_blocks)
+    layer_idx: int,
+):
+    """
+    Gathers each sequence's cached keys and values into contiguous tensors.
+
+    Returns (keys, values) of shape (batch, num_kv_heads, max_blocks * block_size, dim);
+    positions beyond a sequence's context length hold stale data and must be masked.
+    """
+    batch_size, max_blocks = block_tables.shape
+    num_kv_heads, block_size = key_cache.shape[2], key_cache.shape[3]
+    max_tokens = max_blocks * block_size
+
+    # (batch, max_blocks, kv_heads, block_size, dim) -> (batch, kv_heads, max_tokens, dim)
+    keys = _gather_blocks(key_cache, layer_idx, block_tables)
+    keys = keys.transpose(0, 2, 1, 3, 4).reshape(batch_size, num_kv_heads, max_tokens, -1)
+    values = _gather_blocks(value_cache, layer_idx, block_tables)
+    values = values.transpose(0, 2, 1, 3, 4).reshape(batch_size, num_kv_heads, max_tokens, -1)
+    return keys, values
+
+
+def paged_attention(
+    queries: mx.array,
+    key_cache: PagedCache,
+    value_cache: PagedCache,
+    block_tables: mx.array,
+    context_lengths: mx.array,
+    block_size: int,
+    scale: float,
+    num_kv_heads: int,
+    layer_idx: int,
+    v_head_dim: Optional[int] = None,
+    top_k_indices: Optional[mx.array] = None,
+    window_size: Optional[int] = None,
+    sinks: Optional[mx.array] = None,
+) -> mx.array:
+    """
+    Single-token (decode) attention over the paged KV cache using MLX gathers.
+
+    Supports the same variants as the Metal kernels: DeepSeek V3.2 top-k token
+    selection, and GPT-OSS sliding window with attention sinks.
+    """
+    if queries.ndim == 4:
+        queries = queries.squeeze(2)
+    batch_size, num_heads, k_head_dim = queries.shape
+    dtype = queries.dtype
+
+    max_blocks = block_tables.shape[1]
+    max_tokens = max_blocks * block_size
+
+    keys, values = gather_kv_cache(key_cache, value_cache, block_tables, layer_idx)
+    if v_head_dim is not None:
+        values = values[..., :v_head_dim]
+
+    # Query heads sharing a KV head are contiguous: (batch, kv_heads, n_rep, dim)
+    q = queries.reshape(batch_size, num_kv_heads, num_heads // num_kv_heads, k_head_dim)
+    scores = (q.astype(mx.float32) @ keys.astype(mx.float32).swapaxes(-1, -2)) * scale
+
+    positions = mx.arange(max_tokens)[None, :]
+    valid = positions < context_lengths[:, None]
+
+    if top_k_indices is not None:
+        # A leading -1 means "attend to the whole context"
+        selected = mx.put_along_axis(
+            mx.zeros((batch_size, max_tokens), dtype=mx.bool_),
+            mx.clip(top_k_indices, 0, max_tokens - 1).astype(mx.int32),
+            mx.array(True),
+            axis=1,
+        )
+        use_top_k = (top_k_indices[:, 0] != -1)[:, None]
+        valid = mx.where(use_top_k, selected, valid)
+
+    use_sinks = window_size is not None and sinks is not None
+    if use_sinks and window_size > 0:
+        window_start = (context_lengths - 1 - window_size)[:, None]
+        valid = valid & (positions >= window_start)
+
+    scores = mx.where(valid[:, None, None, :], scores, -mx.inf)
+
+    if use_sinks:
+        # The sink is an implicit extra token with zero value and a per-head logit
+        sink_scores = sinks.astype(mx.float32).reshape(1, num_kv_heads, -1, 1)
+        sink_scores = mx.broadcast_to(sink_scores, scores.shape[:-1] + (1,))
+        probs = mx.softmax(mx.concatenate([sink_scores, scores], axis=-1), axis=-1)[..., 1:]
+    else:
+        probs = mx.softmax(scores, axis=-1)
+
+    output = probs @ values.astype(mx.float32)
+    output = output.reshape(batch_size, num_heads, -1).astype(dtype)
+    return output[:, :, None, :]
@@ -10,7 +10,12 @@ from mlx_lm.models.deepseek_v3 import DeepseekV3Attention as MLXDeepseekV3Attent
 from mlx_lm.models.deepseek_v3 import DeepseekV3DecoderLayer as MLXDeepseekV3Block
 from mlx_lm.models.deepseek_v3 import ModelArgs
 
-from parallax.metal.paged_attention.kernel import paged_attention, reshape_and_cache
+from parallax.metal.paged_attention.kernel import (
+    gather_kv_cache,
+    paged_attention,
+    reshape_and_cache,
+)
+from parallax.utils.utils import get_rope_offsets
 
 
 class ParallaxDeepSeekV3Attention(MLXDeepseekV3Attention):
@@ -31,6 +36,7 @@ class ParallaxDeepSeekV3Attention(MLXDeepseekV3Attention):
         context_lengths: Optional[mx.array] = None,
         slot_mapping: Optional[mx.array] = None,
         layer_idx: int = 0,
+        prefix_lens: Optional[mx.array] = None,
     ) -> mx.array:
         """
         Attention forward pass with explicit KV cache handling.
@@ -42,6 +48,7 @@ class ParallaxDeepSeekV3Attention(MLXDeepseekV3Attention):
             block_tables: (batch, max_blocks) - PagedKV block tables.
             context_lengths: (batch,) - PagedKV sequence lengths.
             layer_idx: Layer index for PagedKV access.
+            prefix_lens: (batch,) - Tokens already cached before each prefill segment.
 
         Returns:
             output_h: (batch, target_len, hidden_dim) - Output hidden states.
@@ -67,19 +74,9 @@ class ParallaxDeepSeekV3Attention(MLXDeepseekV3Attention):
         # k_pe = self.rope(k_pe, offset=offset)
         key_cache_global, value_cache_global = cache
 
-        q_pe_list = []
-        k_pe_list = []
-        for i in range(batch):
-            current_pos = int(context_lengths[i]) - 1 if target_len == 1 else 0
-            q_slice = q_pe[i : i + 1]
-            k_slice = k_pe[i : i + 1]
-            q_rot = self.rope(q_slice, offset=current_pos)
-            k_rot = self.rope(k_slice, offset=current_pos)
-            q_pe_list.append(q_rot)
-            k_pe_list.append(k_rot)
-
-        q_pe = mx.concatenate(q_pe_list, axis=0)
-        k_pe = mx.concatenate(k_pe_list, axis=0)
+        rope_offsets = get_rope_offsets(context_lengths, target_len, prefix_lens)
+        q_pe = self.rope(q_pe, offset=rope_offsets)
+        k_pe = self.rope(k_pe, offset=rope_offsets)
 
         k_pe = mx.repeat(k_pe, self.num_heads, axis=1)
         queries = mx.concatenate([q_nope, q_pe], axis=-1)
@@ -119,10 +116,16 @@ class ParallaxDeepSeekV3Attention(MLXDeepseekV3Attention):
             if mask is not None:
                 mask = mx.array(mask, dtype=queries.dtype)
 
+            keys_attn, values_attn = keys, values.transpose(0, 2, 1, 3)
+            if prefix_lens is not None:
+                # Attend to the cached prefix as well as the new segment
+                keys_attn, values_attn = gather_kv_cache(
+                    key_cache_global, value_cache_global, block_tables, layer_idx
+                )
             output = scaled_dot_product_attention(
                 queries,
-                keys,
-                values.transpose(0, 2, 1, 3),
+                keys_attn,
+                values_attn,
                 scale=self.scale,
                 mask=mask,
                 cache=None,
@@ -151,6 +154,7 @@ class ParallaxDeepSeekV3Block(MLXDeepseekV3Block):
         block_tables: Optional[mx.array] = None,
         context_lengths: Optional[mx.array] = None,
         slot_mapping: Optional[mx.array] = None,
+        prefix_lens: Optional[mx.array] = None,
         **kwargs,
     ):
         r = self.self_attn(
@@ -161,6 +165,7 @@ class ParallaxDeepSeekV3Block(MLXDeepseekV3Block):
             context_lengths=context_lengths,
             slot_mapping=slot_mapping,
             layer_idx=self.layer_idx,
+            prefix_lens=prefix_lens,
         )
         h = x + r
         r = self.mlp(self.post_attention_layernorm(h))
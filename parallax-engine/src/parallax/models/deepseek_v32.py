@@ -10,6 +10,7 @@ from mlx_lm.models.deepseek_v32 import ModelArgs
 
 from parallax.metal.indexer.kernel import q_dot_k, store_indexer_cache
 from parallax.metal.paged_attention.kernel import paged_attention, reshape_and_cache
+from parallax.utils.utils import get_rope_offsets
 
 
 class ParallaxDeepSeekV32Indexer(MLXDeepseekV32Indexer):
@@ -35,18 +36,9 @@ class ParallaxDeepSeekV32Indexer(MLXDeepseekV32Indexer):
         k = mx.reshape(k, (batch, 1, target_len, self.head_dim))
         k_pe, k_nope = mx.split(k, [self.rope_head_dim], axis=-1)
 
-        q_pe_list = []
-        k_pe_list = []
-        for i in range(batch):
-            current_pos = int(context_lengths[i]) - 1 if target_len == 1 else 0
-            q_slice = q_pe[i : i + 1]
-            k_slice = k_pe[i : i + 1]
-            q_rot = self.rope(q_slice, offset=current_pos)
-            k_rot = self.rope(k_slice, offset=current_pos)
-            q_pe_list.append(q_rot)
-            k_pe_list.append(k_rot)
-        q_pe = mx.concatenate(q_pe_list, axis=0)
-        k_pe = mx.concatenate(k_pe_list, axis=0)
+        rope_offsets = get_rope_offsets(context_lengths, target_len)
+        q_pe = self.rope(q_pe, offset=rope_offsets)
+        k_pe = self.rope(k_pe, offset=rope_offsets)
         q = mx.concatenate([q_pe, q_nope], axis=-1)
         k = mx.concatenate([k_pe, k_nope], axis=-1)
 
@@ -142,18 +134,9 @@ class ParallaxDeepSeekV32Attention(MLXDeepseekV32Attention):
         k_nope, values = mx.split(kv, [self.qk_nope_head_dim], axis=-1)
         k_nope = k_nope.transpose(0, 2, 1, 3)
         key_cache_global, value_cache_global = cache
-        q_pe_list = []
-        k_pe_list = []
-        for i in range(batch):
-            current_pos = int(context_lengths[i]) - 1 if target_len == 1 else 0
-            q_slice = q_pe[i : i + 1]
-            k_slice = k_pe[i : i + 1]
-            q_rot = self.rope(q_slice, offset=current_pos)
-            k_rot = self.rope(k_slice, offset=current_pos)
-            q_pe_list.append(q_rot)
-            k_pe_list.append(k_rot)
-        q_pe = mx.concatenate(q_pe_list, axis=0)
-        k_pe = mx.concatenate(k_pe_list, axis=0)
+        rope_offsets = get_rope_offsets(context_lengths, target_len)
+        q_pe = self.rope(q_pe, offset=rope_offsets)
+        k_pe = self.rope(k_pe, offset=rope_offsets)
 
         k_pe = mx.repeat(k_pe, self.num_heads, axis=1)
         queries = mx.concatenate([q_nope, q_pe], axis=-1)
@@ -10,7 +10,12 @@ from mlx_lm.models.gpt_oss import AttentionBlock as MLXGPTOSSAttention
 from mlx_lm.models.gpt_oss import ModelArgs
 from mlx_lm.models.gpt_oss import TransformerBlock as MLXGPTOSSBlock
 
-from parallax.metal.paged_attention.kernel import paged_attention, reshape_and_cache
+from parallax.metal.paged_attention.kernel import (
+    gather_kv_cache,
+    paged_attention,
+    reshape_and_cache,
+)
+from parallax.utils.utils import create_prefix_causal_mask, get_rope_offsets
 
 
 class ParallaxGPTOSSAttention(MLXGPTOSSAttention):
@@ -30,6 +35,7 @@ class ParallaxGPTOSSAttention(MLXGPTOSSAttention):
         slot_mapping: Optional[mx.array] = None,
         layer_idx: int = 0,
         window_size: Optional[int] = None,
+        prefix_lens: Optional[mx.array] = None,
     ) -> mx.array:
         """
         Attention forward pass with PagedAttention integration.
@@ -50,19 +56,9 @@ class ParallaxGPTOSSAttention(MLXGPTOSSAttention):
 
         key_cache_global, value_cache_global = cache
 
-        queries_rotated_list = []
-        keys_rotated_list = []
-        for i in range(batch):
-            current_pos = int(context_lengths[i]) - 1 if target_len == 1 else 0
-            q_slice = queries_new[i : i + 1]
-            k_slice = keys_new[i : i + 1]
-            q_rot = self.rope(q_slice, offset=current_pos)
-            k_rot = self.rope(k_slice, offset=current_pos)
-            queries_rotated_list.append(q_rot)
-            keys_rotated_list.append(k_rot)
-
-        queries_rotated = mx.concatenate(queries_rotated_list, axis=0)
-        keys_rotated = mx.concatenate(keys_rotated_list, axis=0)
+        rope_offsets = get_rope_offsets(context_lengths, target_len, prefix_lens)
+        queries_rotated = self.rope(queries_new, offset=rope_offsets)
+        keys_rotated = self.rope(keys_new, offset=rope_offsets)
 
         # Update Paged Cache
         block_size = key_cache_global.shape[3]
@@ -96,16 +92,31 @@ class ParallaxGPTOSSAttention(MLXGPTOSSAttention):
             )
             output = output.transpose(0, 2, 1, 3).reshape(batch, target_len, -1)
         else:
-            if window_size is not None:
+            if window_size is not None and prefix_lens is not None:
+                mask = create_prefix_causal_mask(
+                    prefix_lens,
+                    context_lengths,
+                    target_len,
+                    mask.shape[-1],
+                    queries_rotated.dtype,
+                    window_size=window_size,
+                )
+            elif window_size is not None:
                 mask_prefill = create_causal_mask(target_len, offset=0, window_size=window_size)
                 mask_prefill = (1 - mask_prefill) * -1e9
                 mask = mask + mask_prefill
 
             mask = mask.astype(queries_rotated.dtype)
+            keys_attn, values_attn = keys_rotated, values_new.transpose(0, 2, 1, 3)
+            if prefix_lens is not None:
+                # Attend to the cached prefix as well as the new segment
+                keys_attn, values_attn = gather_kv_cache(
+                    key_cache_global, value_cache_global, block_tables, layer_idx
+                )
             output = scaled_dot_product_attention(
                 queries_rotated,
-                keys_rotated,
-                values_new.transpose(0, 2, 1, 3),
+                keys_attn,
+                values_attn,
                 scale=self.sm_scale,
                 mask=mask,
                 cache=None,
@@ -142,6 +153,7 @@ class ParallaxGPTOSSBlock(MLXGPTOSSBlock):
         block_tables: Optional[mx.array] = None,
         context_lengths: Optional[mx.array] = None,
         slot_mapping: Optional[mx.array] = None,
+        prefix_lens: Optional[mx.array] = None,
         **kwargs,
     ):
         # Determine window size for this layer
@@ -158,6 +170,7 @@ class ParallaxGPTOSSBlock(MLXGPTOSSBlock):
             context_lengths=context_lengths,
             slot_mapping=slot_mapping,
             layer_idx=self.layer_idx,
+            prefix_lens=prefix_lens,
             window_size=window_size,
         )
         h = x + r
@@ -10,7 +10,12 @@ from mlx_lm.models.qwen3 import Attention as MLXQwen3Attention
 from mlx_lm.models.qwen3 import ModelArgs
 from mlx_lm.models.qwen3 import TransformerBlock as MLXQwen3Block
 
-from parallax.metal.paged_attention.kernel import paged_attention, reshape_and_cache
+from parallax.metal.paged_attention.kernel import (
+    gather_kv_cache,
+    paged_attention,
+    reshape_and_cache,
+)
+from parallax.utils.utils import get_rope_offsets
 
 
 class ParallaxQwen3Attention(MLXQwen3Attention):
@@ -29,6 +34,7 @@ class ParallaxQwen3Attention(MLXQwen3Attention):
         context_lengths: Optional[mx.array] = None,
         slot_mapping: Optional[mx.array] = None,
         layer_idx: int = 0,
+        prefix_lens: Optional[mx.array] = None,
     ) -> mx.array:
         """
         Attention forward pass with explicit KV cache handling.
@@ -40,6 +46,7 @@ class ParallaxQwen3Attention(MLXQwen3Attention):
             block_tables: (batch, max_blocks) - PagedKV block tables.
             context_lengths: (batch,) - PagedKV sequence lengths.
             layer_idx: Layer index for PagedKV access.
+            prefix_lens: (batch,) - Tokens already cached before each prefill segment.
 
         Returns:
             output: (batch, target_len, hidden_dim) - Output hidden states.
@@ -60,22 +67,9 @@ class ParallaxQwen3Attention(MLXQwen3Attention):
 
         key_cache_global, value_cache_global = cache
 
-        queries_rotated_list = []
-        keys_rotated_list = []
-
-        for i in range(batch):
-            # TODO: for chunked Prefill, we need to pass in the offset for each chunk.
-            # Currently, we assume the offset is 0 for all chunks.
-            current_pos = int(context_lengths[i]) - 1 if target_len == 1 else 0
-            q_slice = queries_new[i : i + 1]
-            k_slice = keys_new[i : i + 1]
-            q_rot = self.rope(q_slice, offset=current_pos)
-            k_rot = self.rope(k_slice, offset=current_pos)
-            queries_rotated_list.append(q_rot)
-            keys_rotated_list.append(k_rot)
-
-        queries_rotated = mx.concatenate(queries_rotated_list, axis=0)
-        keys_rotated = mx.concatenate(keys_rotated_list, axis=0)
+        rope_offsets = get_rope_offsets(context_lengths, target_len, prefix_lens)
+        queries_rotated = self.rope(queries_new, offset=rope_offsets)
+        keys_rotated = self.rope(keys_new, offset=rope_offsets)
 
         block_size = key_cache_global.shape[3]
 
@@ -108,10 +102,16 @@ class ParallaxQwen3Attention(MLXQwen3Attention):
             output = output.transpose(0, 2, 1, 3).reshape(batch, target_len, -1)
         else:
             # Prefill Phase: Use Standard Self-Attention on local data
+            keys_attn, values_attn = keys_rotated, values_new.transpose(0, 2, 1, 3)
+            if prefix_lens is not None:
+                # Attend to the cached prefix as well as the new segment
+                keys_attn, values_attn = gather_kv_cache(
+                    key_cache_global, value_cache_global, block_tables, layer_idx
+                )
             output = scaled_dot_product_attention(
                 queries_rotated,
-                keys_rotated,
-                values_new.transpose(0, 2, 1, 3),
+                keys_attn,
+                values_attn,
                 scale=self.scale,
                 mask=mask,
                 cache=None,
@@ -139,6 +139,7 @@ class ParallaxQwen3Block(MLXQwen3Block):
         block_tables: Optional[mx.array] = None,
         context_lengths: Optional[mx.array] = None,
         slot_mapping: Optional[mx.array] = None,
+        prefix_lens: Optional[mx.array] = None,
         **kwargs,
     ):
         r = self.self_attn(
@@ -149,6 +150,7 @@ class ParallaxQwen3Block(MLXQwen3Block):
             context_lengths=context_lengths,
             slot_mapping=slot_mapping,
             layer_idx=self.layer_idx,
+            prefix_lens=prefix_lens,
         )
         h = x + r
         r = self.mlp(self.post_attention_layernorm(h))
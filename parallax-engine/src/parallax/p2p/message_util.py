@@ -3,17 +3,39 @@ Utility functions for message serialization and deserialization.
 
 This module contains utility functions for serializing and deserializing messages
 between the P2P server and the executor.
+
+Hidden states travel as one raw batch buffer (see `pack_hidden_states`) next to the
+ForwardRequest: as an extra ZMQ frame between the executor and its P2P server, and in
+`ForwardRequest.hidden_states` between nodes. Between nodes the buffer can be further
+encoded with one of `ACTIVATION_TRANSPORTS` (see `encode_hidden_states`).
 """
 
 import io
-from typing import Any, List, Optional
+import json
+import struct
+from typing import Any, Dict, List, Optional, Sequence
 
 import mlx.core as mx
+import numpy as np
 
 from parallax.p2p.proto import forward_pb2
 from parallax.server.request import IntermediateRequest, Request, RequestStatus
 from parallax.server.sampling.sampling_params import SamplingParams
 
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Encodings for hidden states sent between peers. "lz4" and "zstd" are lossless and
+# need the optional lz4 / zstandard packages; "int8" quantizes per token.
+ACTIVATION_TRANSPORTS = ("none", "lz4", "zstd", "int8")
+
 
 def request_to_proto(
     requests: List[IntermediateRequest],
@@ -22,6 +44,21 @@ def request_to_proto(
     """
     Convert a list of IntermediateRequest objects to a ForwardRequest protobuf message.
     IntermediateRequest contains request_id, current_position, status, and hidden_states.
+    The hidden states of all requests are packed into `ForwardRequest.hidden_states`.
+    """
+    forward_request, hidden_states = request_to_frames(requests, device)
+    if hidden_states is not None:
+        forward_request.hidden_states = hidden_states
+    return forward_request
+
+
+def request_to_frames(
+    requests: List[IntermediateRequest],
+    device: Optional[str] = "mlx",
+):
+    """
+    Like `request_to_proto`, but returns the packed hidden states separately so they can
+    be sent as their own ZMQ frame. Returns (ForwardRequest, hidden states frame or None).
     """
     forward_request = forward_pb2.ForwardRequest()
     assert len(requests) > 0, "No requests to convert"
@@ -38,40 +75,45 @@ def request_to_proto(
     for request in requests:
         proto_req = forward_pb2.Req()
         proto_req.rid = request.request_id
+        # Negative for a partial prefill chunk that ends before the prompt does
         proto_req.output_length = request.current_position - len(request.input_ids)
         proto_req.input_ids.extend(request.input_ids)
         proto_req.routing_table.extend(request.routing_table)
         proto_req.sampling_params.CopyFrom(sampling_params_to_proto(request.sampling_params))
         proto_req.lora_path = request.lora_path if request.lora_path is not None else ""
 
-        if request.hidden_states is not None:
-            proto_req.hidden_states = tensor_to_bytes(request.hidden_states, device=device)
-
         if request.next_token_id is not None:
             proto_req.next_token_id = request.next_token_id
 
         forward_request.reqs.append(proto_req)
 
-    return forward_request
+    hidden_states = pack_hidden_states([request.hidden_states for request in requests], device)
+    return forward_request, hidden_states
 
 
 def proto_to_request(
     proto_request: forward_pb2.ForwardRequest,
     device: Optional[str] = "mlx",
+    hidden_states: Optional[bytes] = None,
 ) -> List[IntermediateRequest]:
     """
     Convert a ForwardRequest protobuf message to a IntermediateRequest object.
+    `hidden_states` is the packed hidden states frame, if it was sent separately.
     """
 
     requests = []
+    if hidden_states is None:
+        hidden_states = proto_request.hidden_states
+    batch_hidden_states = unpack_hidden_states(hidden_states, device) if hidden_states else {}
 
-    for proto_req in proto_request.reqs:
+    for i, proto_req in enumerate(proto_request.reqs):
         current_position = len(proto_req.input_ids) + proto_req.output_length
 
         next_token_id = proto_req.next_token_id
 
-        hidden_states = None
-        if proto_req.hidden_states:
+        hidden_states = batch_hidden_states.get(i)
+        if hidden_states is None and proto_req.hidden_states:
+            # Per-request safetensors payload from older senders
             hidden_states = bytes_to_tensor(proto_req.hidden_states, device)
 
         status = None
@@ -84,6 +126,11 @@ def proto_to_request(
         else:
             raise ValueError(f"Invalid forward mode: {proto_request.forward_mode}")
 
+        # Prefill hidden states skip the prompt tokens the sender found in its prefix cache
+        num_computed_tokens = 0
+        if status == RequestStatus.PREFILLING and hidden_states.ndim == 2:
+            num_computed_tokens = current_position - hidden_states.shape[0]
+
         sampling_params = proto_to_sampling_params(proto_req.sampling_params)
 
         request = IntermediateRequest(
@@ -96,6 +143,7 @@ def proto_to_request(
             next_token_id=next_token_id,
             sampling_params=sampling_params,
             lora_path=proto_req.lora_path if proto_req.lora_path != "" else None,
+            num_computed_tokens=num_computed_tokens,
         )
 
         requests.append(request)
@@ -215,3 +263,233 @@ def bytes_to_tensor(
         tensors_dict = mx.load(buffer, format="safetensors")
         tensor = tensors_dict["tensor"]
     return tensor
+
+
+def _dtype_name(dtype: Any) -> str:
+    # "mlx.core.bfloat16" / "torch.bfloat16" -> "bfloat16"
+    return str(dtype).split(".")[-1]
+
+
+def _itemsize(dtype_name: str) -> int:
+    # numpy has no bfloat16
+    return 2 if dtype_name == "bfloat16" else np.dtype(dtype_name).itemsize
+
+
+def _tensor_buffer(tensor: Any, device: Optional[str] = "mlx") -> memoryview:
+    """Returns a flat byte view of a tensor's host memory."""
+    if device == "cuda":
+        import torch
+
+        cpu_tensor = tensor.detach().contiguous().cpu()
+        if cpu_tensor.dtype == torch.bfloat16:
+            cpu_tensor = cpu_tensor.view(torch.int16)
+        return memoryview(cpu_tensor.numpy()).cast("B")
+    return memoryview(mx.contiguous(tensor)).cast("B")
+
+
+def supported_activation_transports() -> List[str]:
+    """Returns the transports this process can decode."""
+    transports = ["none", "int8"]
+    if lz4 is not None:
+        transports.append("lz4")
+    if zstandard is not None:
+        transports.append("zstd")
+    return transports
+
+
+def parse_activation_transport(spec: Sequence[str]) -> Dict[Optional[str], str]:
+    """
+    Parses `--activation-transport` values, e.g. ["zstd", "<peer_id>=int8"], into
+    {None: default transport, peer_id: transport}.
+    """
+    routes = {None: "none"}
+    for item in spec:
+        peer_id, _, transport = item.rpartition("=")
+        if transport not in ACTIVATION_TRANSPORTS:
+            raise ValueError(
+                f"Unknown activation transport: {transport}. "
+                f"Supported transports: {list(ACTIVATION_TRANSPORTS)}"
+            )
+        routes[peer_id or None] = transport
+    return routes
+
+
+def _quantize_int8(buffer: memoryview, dtype_name: str, shape: List[int]) -> bytes:
+    """Symmetric int8 quantization per token (last axis); returns scales then values."""
+    rows = _decode_raw(buffer, dtype_name, "mlx").reshape(-1, shape[-1] if shape else 1)
+    rows = rows.astype(mx.float32)
+    scales = mx.max(mx.abs(rows), axis=-1, keepdims=True) / 127.0
+    q = mx.clip(mx.round(rows / mx.maximum(scales, 1e-12)), -127, 127).astype(mx.int8)
+    return b"".join([memoryview(scales), memoryview(q)])
+
+
+def _dequantize_int8(buffer: bytes, dtype_name: str, shape: List[int], device: str) -> Any:
+    dim = shape[-1] if shape else 1
+    num_rows = int(np.prod(shape, dtype=np.int64)) // dim
+    scales = np.frombuffer(buffer, dtype=np.float32, count=num_rows).reshape(-1, 1)
+    q = np.frombuffer(buffer, dtype=np.int8, offset=4 * num_rows).reshape(-1, dim)
+    if device == "cuda":
+        import torch
+
+        values = torch.from_numpy(q).to(device).float() * torch.from_numpy(scales).to(device)
+        return values.to(getattr(torch, dtype_name))
+    values = mx.array(q).astype(mx.float32) * mx.array(scales)
+    return values.astype(getattr(mx, dtype_name))
+
+
+def _decode_raw(buffer: Any, dtype_name: str, device: str) -> Any:
+    if device == "cuda":
+        import torch
+
+        # The frame is read-only; the copy to the device happens right away
+        return torch.frombuffer(buffer, dtype=getattr(torch, dtype_name)).to(device)
+    if dtype_name == "bfloat16":
+        return mx.array(np.frombuffer(buffer, dtype=np.uint16)).view(mx.bfloat16)
+    return mx.array(np.frombuffer(buffer, dtype=dtype_name))
+
+
+def _join_frame(entries: List[list], buffers: List[Any]) -> bytes:
+    header = json.dumps(entries, separators=(",", ":")).encode()
+    padding = -(4 + len(header)) % 16
+    return b"".join([struct.pack("<I", len(header)), header, bytes(padding), *buffers])
+
+
+def _split_frame(frame: bytes):
+    """Yields (request index, dtype name, shape, transport, byte view) per packed tensor."""
+    frame = memoryview(frame)
+    (header_len,) = struct.unpack_from("<I", frame)
+    entries = json.loads(bytes(frame[4 : 4 + header_len]))
+    offset = 4 + header_len
+    offset += -offset % 16
+    for entry in entries:
+        index, dtype_name, shape = entry[:3]
+        if len(entry) > 3:
+            # Encoded entries: [index, dtype, shape, transport, encoded size]
+            transport, nbytes = entry[3:]
+        else:
+            transport = "none"
+            nbytes = int(np.prod(shape, dtype=np.int64)) * _itemsize(dtype_name)
+        yield index, dtype_name, shape, transport, frame[offset : offset + nbytes]
+        offset += nbytes
+
+
+def _entry(index: int, dtype_name: str, shape: List[int], transport: str, buffer) -> list:
+    if transport == "none":
+        return [index, dtype_name, shape]
+    return [index, dtype_name, shape, transport, len(buffer)]
+
+
+def pack_hidden_states(
+    tensors: Sequence[Optional[Any]], device: Optional[str] = "mlx"
+) -> Optional[bytes]:
+    """
+    Packs the hidden states of a batch into one raw buffer.
+
+    Layout: a little-endian uint32 header length, a JSON header listing
+    [request index, dtype, shape] for every tensor, padding to 16 bytes, then the
+    tensors' bytes back to back. Requests without hidden states are left out.
+    Returns None if no request has hidden states.
+    """
+    entries = []
+    buffers = []
+    for i, tensor in enumerate(tensors):
+        if tensor is None:
+            continue
+        entries.append([i, _dtype_name(tensor.dtype), list(tensor.shape)])
+        buffers.append(_tensor_buffer(tensor, device))
+    if not entries:
+        return None
+    return _join_frame(entries, buffers)
+
+
+def encode_hidden_states(frame: bytes, transport: str) -> bytes:
+    """
+    Re-encodes the raw tensors of a packed batch with `transport`.
+
+    Encoded entries carry the transport and their encoded size in the header.
+    int8 only applies to floating point tensors, so token ids sent back to the
+    first peer pass through unchanged.
+    """
+    if transport == "none":
+        return frame
+    entries = []
+    buffers = []
+    for index, dtype_name, shape, entry_transport, buffer in _split_frame(frame):
+        if entry_transport == "none":
+            entry_transport = transport
+            if transport == "lz4":
+                buffer = lz4.frame.compress(buffer)
+            elif transport == "zstd":
+                buffer = zstandard.ZstdCompressor(level=1).compress(buffer)
+            elif transport == "int8" and dtype_name in ("float16", "bfloat16", "float32"):
+                buffer = _quantize_int8(buffer, dtype_name, shape)
+            else:
+                entry_transport = "none"
+        entries.append(_entry(index, dtype_name, shape, entry_transport, buffer))
+        buffers.append(buffer)
+    return _join_frame(entries, buffers)
+
+
+def unpack_hidden_states(frame: bytes, device: Optional[str] = "mlx") -> Dict[int, Any]:
+    """
+    Decodes a buffer written by `pack_hidden_states` into {request index: tensor}.
+    Raw tensors are read directly from views into the frame.
+    """
+    tensors = {}
+    for index, dtype_name, shape, transport, buffer in _split_frame(frame):
+        if transport == "int8":
+            tensor = _dequantize_int8(buffer, dtype_name, shape, device)
+        else:
+            if transport == "lz4":
+                buffer = lz4.frame.decompress(buffer)
+            elif transport == "zstd":
+                buffer = zstandard.ZstdDecompressor().decompress(buffer)
+            elif transport != "none":
+                raise ValueError(f"Unknown activation transport: {transport}")
+            tensor = _decode_raw(buffer, dtype_name, device)
+        tensors[index] = tensor.reshape(shape)
+    return tensors
+
+
+def slice_hidden_states(frame: bytes, indices: Sequence[int]) -> Optional[bytes]:
+    """
+    Re-packs the hidden states of the requests at `indices` of a packed batch without
+    decoding them. Requests are renumbered by their position in `indices`.
+    """
+    spans = {entry[0]: entry[1:] for entry in _split_frame(frame)}
+    entries = []
+    buffers = []
+    for new_index, index in enumerate(indices):
+        if index in spans:
+            dtype_name, shape, transport, buffer = spans[index]
+            entries.append(_entry(new_index, dtype_name, shape, transport, buffer))
+            buffers.append(buffer)
+    if not entries:
+        return None
+    return _join_frame(entries, buffers)
+
+
+def merge_forward_requests(
+    requests: Sequence[forward_pb2.ForwardRequest],
+) -> forward_pb2.ForwardRequest:
+    """
+    Coalesces ForwardRequests of the same forward mode into one, keeping their order.
+    Packed hidden states are concatenated without decoding.
+    """
+    if len(requests) == 1:
+        return requests[0]
+    merged = forward_pb2.ForwardRequest()
+    merged.forward_mode = requests[0].forward_mode
+    entries = []
+    buffers = []
+    for request in requests:
+        assert request.forward_mode == merged.forward_mode, "Forward modes must match"
+        offset = len(merged.reqs)
+        if request.hidden_states:
+            for index, dtype_name, shape, transport, buffer in _split_frame(request.hidden_states):
+                entries.append(_entry(offset + index, dtype_name, shape, transport, buffer))
+                buffers.append(buffer)
+        merged.reqs.extend(request.reqs)
+    if entries:
+        merged.hidden_states = _join_frame(entries, buffers)
+    return merged
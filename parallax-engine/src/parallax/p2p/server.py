@@ -7,13 +7,15 @@ It is used to handle the communication between the peers, and communicate with t
 
 """
 
+import collections
 import dataclasses
 import enum
 import json
 import multiprocessing
+import queue
 import threading
 import time
-from typing import List, Optional
+from typing import Any, Callable, List, Optional, Tuple
 
 import dijkstar
 import httpx
@@ -21,6 +23,13 @@ import zmq
 from lattica import ConnectionHandler, Lattica, rpc_method, rpc_stream, rpc_stream_iter
 
 from backend.server.rpc_connection_handler import RPCConnectionHandler
+from parallax.p2p.message_util import (
+    encode_hidden_states,
+    merge_forward_requests,
+    parse_activation_transport,
+    slice_hidden_states,
+    supported_activation_transports,
+)
 from parallax.p2p.proto import forward_pb2
 from parallax.p2p.utils import AsyncWorker
 from parallax.server.server_info import detect_node_hardware
@@ -67,6 +76,9 @@ class ServerInfo:
 
 
 def send_notify(notify_url, block_start_index, block_end_index, request, status):
+    if notify_url is None:
+        return
+
     payload = [
         {
             "session_id": req.rid,
@@ -78,20 +90,133 @@ def send_notify(notify_url, block_start_index, block_end_index, request, status)
         for req in request.reqs
     ]
 
-    logger.info(f"Send {status} notification, batch size: {len(payload)}")
+    logger.debug(f"Send {status} notification, batch size: {len(payload)}")
+
+    async def send_async(notify_url, payload):
+        try:
+            client = await get_http_client()
+            await client.post(notify_url, json=payload)
+        except Exception as e:
+            logger.exception(f"Error in send_async: {e}")
+
+    if not hasattr(send_notify, "async_worker"):
+        send_notify.async_worker = AsyncWorker()
+    send_notify.async_worker.run_coroutine(send_async(notify_url, payload), return_future=True)
+
+
+class PeerForwarder:
+    """
+    Sends forward and abort requests to one next peer on background threads.
+
+    Up to `max_inflight` rpc_pp_forward calls are outstanding at a time, so a hop does
+    not wait for the previous batch's round trip. Forward requests that queue up while
+    the window is full are coalesced into one RPC when a slot frees up. Requests leave
+    in the order they were submitted. An abort waits until every forward sent before it
+    has been answered, so the peer never sees it ahead of those forwards.
+    """
 
-    if notify_url is not None:
+    def __init__(
+        self,
+        peer_id: str,
+        get_stub: Callable[[str], Any],
+        max_inflight: int = 4,
+        encode: Optional[Callable[[bytes], bytes]] = None,
+        on_forwarded: Optional[Callable[[str, forward_pb2.ForwardRequest, float], None]] = None,
+    ):
+        self.peer_id = peer_id
+        self.get_stub = get_stub
+        self.encode = encode
+        self.on_forwarded = on_forwarded
+        self._pending = queue.Queue()
+        self._backlog = collections.deque()
+        self._inflight = queue.Queue()
+        self._max_inflight = max_inflight
+        self._slots = threading.Semaphore(max_inflight)
+        self._sender = threading.Thread(target=self._send_loop, daemon=True)
+        self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+        self._sender.start()
+        self._reaper.start()
+
+    def submit_forward(self, request: forward_pb2.ForwardRequest):
+        self._pending.put((b"forward", request))
+
+    def submit_abort(self, request: forward_pb2.AbortRequest):
+        self._pending.put((b"abort", request))
+
+    def stop(self):
+        self._pending.put(None)
+        self._sender.join(timeout=5)
+        self._reaper.join(timeout=5)
+
+    def _next_item(self):
+        if self._backlog:
+            return self._backlog.popleft()
+        return self._pending.get()
+
+    def _coalesce(self, request: forward_pb2.ForwardRequest) -> forward_pb2.ForwardRequest:
+        # Collect everything that queued up while waiting for a slot
+        while True:
+            try:
+                self._backlog.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        batch = [request]
+        while (
+            self._backlog
+            and self._backlog[0] is not None
+            and self._backlog[0][0] == b"forward"
+            and self._backlog[0][1].forward_mode == request.forward_mode
+        ):
+            batch.append(self._backlog.popleft()[1])
+        return merge_forward_requests(batch)
+
+    def _wait_for_inflight(self):
+        # Only the sender takes slots, so holding all of them means the window is empty
+        for _ in range(self._max_inflight):
+            self._slots.acquire()
+        for _ in range(self._max_inflight):
+            self._slots.release()
+
+    def _send_loop(self):
+        while True:
+            item = self._next_item()
+            if item is None:
+                break
+            kind, request = item
+            if kind == b"abort":
+                self._wait_for_inflight()
+                try:
+                    self.get_stub(self.peer_id).rpc_abort(request)
+                except Exception as e:
+                    logger.exception(f"Error sending abort request to {self.peer_id}: {e}")
+                continue
 
-        async def send_async(notify_url, payload):
+            self._slots.acquire()
             try:
-                client = await get_http_client()
-                await client.post(notify_url, json=payload)
+                request = self._coalesce(request)
+                if request.hidden_states and self.encode is not None:
+                    request.hidden_states = self.encode(request.hidden_states)
+                future = self.get_stub(self.peer_id).rpc_pp_forward(request)
+                self._inflight.put((future, request, time.time()))
             except Exception as e:
-                logger.exception(f"Error in send_async: {e}")
-
-        if not hasattr(send_notify, "async_worker"):
-            send_notify.async_worker = AsyncWorker()
-        send_notify.async_worker.run_coroutine(send_async(notify_url, payload), return_future=True)
+                self._slots.release()
+                logger.exception(f"Error forwarding data to {self.peer_id}: {e}")
+        self._inflight.put(None)
+
+    def _reap_loop(self):
+        while True:
+            item = self._inflight.get()
+            if item is None:
+                break
+            future, request, start = item
+            try:
+                future.result()
+                if self.on_forwarded is not None:
+                    self.on_forwarded(self.peer_id, request, start)
+            except Exception as e:
+                logger.exception(f"Error forwarding data to {self.peer_id}: {e}")
+            finally:
+                self._slots.release()
 
 
 class TransformerConnectionHandler(ConnectionHandler):
@@ -139,8 +264,16 @@ class TransformerConnectionHandler(ConnectionHandler):
             send_notify(
                 self.notify_url, self.block_start_index, self.block_end_index, request, "started"
             )
+            # Hand the packed hidden states to the executor as their own frame
+            frames = [b"forward"]
+            hidden_states = request.hidden_states
+            if hidden_states:
+                request.ClearField("hidden_states")
+                frames.extend([request.SerializeToString(), hidden_states])
+            else:
+                frames.append(request.SerializeToString())
             with self._recv_from_peer_lock:
-                self.recv_from_peer.send_multipart([b"forward", request.SerializeToString()])
+                self.recv_from_peer.send_multipart(frames, copy=False)
         except Exception as e:
             logger.exception(f"Error in rpc_pp_forward: {e}")
         return forward_pb2.ForwardResponse()
@@ -157,6 +290,11 @@ class TransformerConnectionHandler(ConnectionHandler):
             logger.exception(f"Error in rpc_abort: {e}")
         return forward_pb2.AbortResponse()
 
+    @rpc_method
+    def rpc_activation_transports(self, message):
+        """Lists the hidden state encodings this node can decode."""
+        return {"transports": supported_activation_transports()}
+
     @rpc_stream_iter
     def chat_completion(
         self,
@@ -213,6 +351,8 @@ class GradientServer:
         max_sequence_length: Optional[int] = None,
         param_mem_ratio: float = 0.65,
         kvcache_mem_ratio: float = 0.25,
+        kv_cache_dtype: str = "auto",
+        activation_transport: Optional[List[str]] = None,
     ):
         self.recv_from_peer_addr = recv_from_peer_addr
         self.send_to_peer_addr = send_to_peer_addr
@@ -233,12 +373,18 @@ class GradientServer:
         self.max_sequence_length = max_sequence_length
         self.param_mem_ratio = param_mem_ratio
         self.kvcache_mem_ratio = kvcache_mem_ratio
+        self.kv_cache_dtype = kv_cache_dtype
+        self.activation_transport_routes = parse_activation_transport(activation_transport or [])
+        self.activation_transports = {}
         self.prefix_id = f"{dht_prefix}_announce"
         self.lattica = None
         self.routing_table = None
         self.routing_table_update_interval = 10
         self.server_info = ServerInfo(state=ServerState.JOINING)
         self.stubs = {}
+        self._stubs_lock = threading.Lock()
+        self.forwarders = {}
+        self.max_inflight_forwards = 4
         self.rtts = {}
         self.rtt_last_update = 0
         self.rtt_update_interval = 60
@@ -405,9 +551,66 @@ class GradientServer:
         return server_blocks
 
     def get_stub(self, peer_id):
-        if peer_id not in self.stubs:
-            self.stubs[peer_id] = self.connection_handler.get_stub(peer_id)
-        return self.stubs[peer_id]
+        with self._stubs_lock:
+            if peer_id not in self.stubs:
+                self.stubs[peer_id] = self.connection_handler.get_stub(peer_id)
+            return self.stubs[peer_id]
+
+    def get_forwarder(self, peer_id):
+        if peer_id not in self.forwarders:
+            self.forwarders[peer_id] = PeerForwarder(
+                peer_id,
+                self.get_stub,
+                max_inflight=self.max_inflight_forwards,
+                encode=lambda frame: encode_hidden_states(
+                    frame, self.get_activation_transport(peer_id)
+                ),
+                on_forwarded=self._on_forwarded,
+            )
+        return self.forwarders[peer_id]
+
+    def _on_forwarded(self, peer_id, forward_request, start):
+        send_notify(
+            self.notify_url,
+            self.block_start_index,
+            self.block_end_index,
+            forward_request,
+            "completed",
+        )
+        total_size = forward_request.ByteSize()
+        logger.debug(
+            f"Forwarded {len(forward_request.reqs)} requests to {peer_id}, "
+            f"total size: {total_size / (1024 * 1024):.3f} MB, "
+            f"cost time: {(time.time() - start) * 1000:.3f} ms, "
+            f"speed: {total_size / (time.time() - start) / (1024 * 1024):.3f} MB/s"
+        )
+
+    def get_activation_transport(self, peer_id):
+        """Negotiates the hidden state encoding for the route to peer_id, once per peer."""
+        if peer_id in self.activation_transports:
+            return self.activation_transports[peer_id]
+
+        transport = self.activation_transport_routes.get(
+            peer_id, self.activation_transport_routes[None]
+        )
+        if transport != "none":
+            try:
+                response = self.get_stub(peer_id).rpc_activation_transports({})
+                if hasattr(response, "result"):
+                    response = response.result(timeout=30)
+                peer_transports = response.get("transports", [])
+            except Exception as e:
+                logger.warning(f"Failed to get activation transports of {peer_id}: {e}")
+                peer_transports = []
+            if transport not in peer_transports:
+                logger.warning(
+                    f"Peer {peer_id} can not decode {transport} activations, sending them raw"
+                )
+                transport = "none"
+
+        logger.info(f"Using {transport} activation transport to {peer_id}")
+        self.activation_transports[peer_id] = transport
+        return transport
 
     def start_routing_table_updater(self):
         def _updater_thread():
@@ -448,9 +651,9 @@ class GradientServer:
     def start_node_sender(self):
         send_to_peer = get_zmq_socket(zmq.Context(2), zmq.PULL, self.send_to_peer_addr, True)
 
-        def group_requests_by_next_peer(requests: List[forward_pb2.Req]):
+        def group_requests_by_next_peer(requests: List[Tuple[int, forward_pb2.Req]]):
             grouped_requests = {}
-            for req in requests:
+            for index, req in requests:
                 assert len(req.routing_table) > 0, "Request routing table is not set"
                 try:
                     self_index = list(req.routing_table).index(self.lattica.peer_id())
@@ -460,7 +663,7 @@ class GradientServer:
                 next_peer_id = req.routing_table[(self_index + 1) % len(req.routing_table)]
                 if next_peer_id not in grouped_requests:
                     grouped_requests[next_peer_id] = []
-                grouped_requests[next_peer_id].append(req)
+                grouped_requests[next_peer_id].append((index, req))
             if len(grouped_requests) > 1:
                 logger.warning(
                     f"Grouped requests by next peer: {len(grouped_requests)}, {grouped_requests.keys()}"
@@ -478,7 +681,8 @@ class GradientServer:
                     time.sleep(self.routing_table_update_interval)
                     continue
 
-                message_type, message_body = send_to_peer.recv_multipart()[:2]
+                frames = send_to_peer.recv_multipart()
+                message_type, message_body = frames[:2]
 
                 if message_type == b"forward":
                     forward_request = forward_pb2.ForwardRequest()
@@ -486,8 +690,9 @@ class GradientServer:
                     if len(forward_request.reqs) == 0:
                         raise RuntimeError("No requests in the forward request")
 
+                    hidden_states = frames[2] if len(frames) > 2 else b""
                     requests = []
-                    for req in forward_request.reqs:
+                    for index, req in enumerate(forward_request.reqs):
                         # set routing table if not scheduler mode
                         if len(req.routing_table) == 0 and self.scheduler_addr is None:
                             assert (
@@ -500,35 +705,23 @@ class GradientServer:
                             )
 
                         if len(req.routing_table) > 0:
-                            requests.append(req)
+                            requests.append((index, req))
                         else:
                             logger.error(f"Request {req.rid} has no routing table, drop it")
 
                     grouped_requests = group_requests_by_next_peer(requests)
 
                     for next_peer_id, requests in grouped_requests.items():
-                        stub = self.get_stub(next_peer_id)
-                        start = time.time()
-                        logger.info(f"Start forwarding data to {next_peer_id}")
                         new_forward_request = forward_pb2.ForwardRequest()
                         new_forward_request.forward_mode = forward_request.forward_mode
-                        new_forward_request.reqs.extend(requests)
-                        response = stub.rpc_pp_forward(new_forward_request)
-                        response.result()
-                        send_notify(
-                            self.notify_url,
-                            self.block_start_index,
-                            self.block_end_index,
-                            new_forward_request,
-                            "completed",
-                        )
-
-                        logger.info(
-                            f"Forwarding data to {next_peer_id}, "
-                            f"total size: {len(message_body) / (1024 * 1024):.3f} MB, "
-                            f"cost time: {(time.time() - start) * 1000:.3f} ms, "
-                            f"speed: {len(message_body) / (time.time() - start) / (1024 * 1024):.3f} MB/s"
-                        )
+                        new_forward_request.reqs.extend(req for _, req in requests)
+                        indices = [index for index, _ in requests]
+                        batch_hidden_states = hidden_states
+                        if hidden_states and indices != list(range(len(forward_request.reqs))):
+                            batch_hidden_states = slice_hidden_states(hidden_states, indices)
+                        if batch_hidden_states:
+                            new_forward_request.hidden_states = batch_hidden_states
+                        self.get_forwarder(next_peer_id).submit_forward(new_forward_request)
 
                 elif message_type == b"abort":
                     abort_request = forward_pb2.AbortRequest()
@@ -560,13 +753,13 @@ class GradientServer:
 
                     for peer_id, requests in grouped_requests.items():
                         if peer_id != self.lattica.peer_id():
-                            stub = self.get_stub(peer_id)
                             logger.info(
                                 f"Send abort request: {[r.rid for r in requests]} to: {peer_id}"
                             )
                             new_abort_request = forward_pb2.AbortRequest()
                             new_abort_request.reqs.extend(requests)
-                            stub.rpc_abort(new_abort_request)
+                            # Queued behind forwards already sent to the peer
+                            self.get_forwarder(peer_id).submit_abort(new_abort_request)
                 else:
                     logger.error(f"Unknown message type: {message_type}")
 
@@ -726,6 +919,7 @@ class GradientServer:
             "node_id": self.lattica.peer_id(),
             "hardware": detect_node_hardware(self.lattica.peer_id()),
             "kvcache_mem_ratio": self.kvcache_mem_ratio,
+            "kv_cache_dtype": self.kv_cache_dtype,
             "param_mem_ratio": self.param_mem_ratio,
             "max_concurrent_requests": self.max_batch_size,
             "max_sequence_length": (
@@ -770,6 +964,8 @@ class GradientServer:
             logger.info(f"Leave scheduler: {self.lattica.peer_id()}")
             self.scheduler_stub.node_leave(self.get_node_info(is_update=True))
 
+        for forwarder in self.forwarders.values():
+            forwarder.stop()
         if self.announcer is not None:
             self.announcer.join()
         if self.routing_table_updater is not None:
@@ -801,6 +997,8 @@ def _run_p2p_server_process(
     kvcache_mem_ratio: float = 0.25,
     shared_state: Optional[dict] = None,
     log_level: str = "INFO",
+    kv_cache_dtype: str = "auto",
+    activation_transport: Optional[List[str]] = None,
 ):
     """Run P2P server in subprocess"""
     # Set log level in subprocess (spawn mode doesn't inherit log configuration)
@@ -830,6 +1028,8 @@ def _run_p2p_server_process(
             max_sequence_length=max_sequence_length,
             param_mem_ratio=param_mem_ratio,
             kvcache_mem_ratio=kvcache_mem_ratio,
+            kv_cache_dtype=kv_cache_dtype,
+            activation_transport=activation_transport,
         )
         # Attach shared state to server for syncing layer allocation
         if shared_state is not None:
@@ -877,6 +1077,8 @@ def launch_p2p_server_process(
     kvcache_mem_ratio: float = 0.25,
     shared_state: Optional[dict] = None,
     log_level: str = "INFO",
+    kv_cache_dtype: str = "auto",
+    activation_transport: Optional[List[str]] = None,
 ) -> multiprocessing.Process:
     """Launch P2P server as a subprocess and return the process object
 
@@ -910,6 +1112,8 @@ def launch_p2p_server_process(
             kvcache_mem_ratio,
             shared_state,
             log_level,
+            kv_cache_dtype,
+            activation_transport,
         ),
     )
     process.start()
@@ -17,6 +17,8 @@ Executor handles
 7. Get the hidden-states from the model execution.
 """
 
+import queue
+import threading
 import time
 from abc import abstractmethod
 from http import HTTPStatus
@@ -30,7 +32,7 @@ from parallax.p2p.message_util import (
     abort_request_to_proto,
     proto_to_abort_request,
     proto_to_request,
-    request_to_proto,
+    request_to_frames,
 )
 from parallax.p2p.proto import forward_pb2
 from parallax.p2p.server import ServerState
@@ -83,6 +85,10 @@ class BaseExecutor:
         tp_size: Optional[int] = 1,
         # Optional shared state for layer reallocation detection (when running in subprocess)
         shared_state: Optional[dict] = None,
+        # Overlap host-side batch preparation with device execution
+        enable_async_scheduling: bool = False,
+        # Split long prompts into token-budgeted prefill chunks
+        enable_chunked_prefill: bool = False,
     ):
         # Backend
         if device is not None:
@@ -96,6 +102,10 @@ class BaseExecutor:
         self.start_layer = start_layer
         self.end_layer = end_layer
         self._should_stop = False  # Flag to gracefully stop the executor
+        self.enable_async_scheduling = enable_async_scheduling
+        # Sender thread state, only used with async scheduling
+        self._send_queue: Optional[queue.Queue] = None
+        self._sender_thread: Optional[threading.Thread] = None
         # Reference to shared state for layer reallocation detection (when in subprocess mode)
         if shared_state is not None:
             self.shared_state = SharedState(shared_state)  # Auto-converts dict to SharedState
@@ -145,11 +155,13 @@ class BaseExecutor:
             scheduler_wait_ms=scheduler_wait_ms,
             micro_batch_ratio=micro_batch_ratio,
             is_first_peer=self.is_first_peer,
+            is_last_peer=self.is_last_peer,
             tokenizer=self.tokenizer,
             eos_token_id=self.eos_token_id,
             kv_cache_manager=self.kv_cache_manager if self.device == "mlx" else None,
             request_timeout_s=request_timeout_s,
             shared_state=self.shared_state,
+            enable_chunked_prefill=enable_chunked_prefill,
         )
         logger.debug(
             f"Scheduler initialized (max_batch_size={max_batch_size}, max_tokens={max_num_tokens_per_batch}, wait_ms={scheduler_wait_ms})"
@@ -174,6 +186,14 @@ class BaseExecutor:
                 self.send_to_ipc_socket = get_zmq_socket(
                     self.zmq_context, zmq.PUSH, executor_output_ipc_addr, bind=False
                 )
+            # Input sockets are polled together so an idle run loop blocks instead of spinning
+            self.poller = zmq.Poller()
+            if recv_from_peer_addr:
+                self.poller.register(self.recv_from_peer_socket, zmq.POLLIN)
+            if executor_input_ipc_addr:
+                self.poller.register(self.recv_from_ipc_socket, zmq.POLLIN)
+        else:
+            self.poller = None
         if self.shared_state is not None:
             self.shared_state.set_status(ServerState.READY.value)
 
@@ -201,7 +221,11 @@ class BaseExecutor:
 
     @abstractmethod
     def _prepare_decode_batch(self, batched_requests: List[Request]) -> Dict[str, Any]:
-        """Prepares inputs for ShardedModel from a batch of decode requests."""
+        """Prepares inputs for ShardedModel from a batch of decode requests.
+
+        On the First Peer, a request's `lookahead_token` (when set) replaces its last
+        output token as input.
+        """
 
     @abstractmethod
     def _gen_token_id_from_hidden(self, hidden_states) -> Tuple[int, Any]:
@@ -214,6 +238,28 @@ class BaseExecutor:
     def _release_request(self, rid: str):
         """Release request in backend frameworks"""
 
+    def poll_input_sockets(self, timeout_ms: int) -> Optional[Dict[Any, int]]:
+        """Waits up to timeout_ms for any input socket to become readable.
+
+        Returns a mapping of ready sockets to their events, or None when this rank
+        owns no sockets and readiness is unknown (callers should just try to recv).
+        """
+        if self.poller is None:
+            return None
+        try:
+            return dict(self.poller.poll(timeout_ms))
+        except zmq.ZMQError as e:
+            # Sockets closed underneath us during shutdown
+            logger.debug(f"Error polling input sockets: {e}")
+            return {}
+
+    def _input_socket_ready(self, ready: Optional[Dict[Any, int]], name: str) -> bool:
+        """Whether the named input socket has pending messages according to `ready`."""
+        if ready is None:
+            return True
+        socket = getattr(self, name, None)
+        return socket is not None and ready.get(socket, 0) & zmq.POLLIN != 0
+
     def recv_requests_from_http(self) -> List[Request]:
         """Receives requests from http frontend"""
         if self.tp_rank != 0:
@@ -250,12 +296,14 @@ class BaseExecutor:
             while True:
                 try:
                     recv_req = self.recv_from_peer_socket.recv_multipart(zmq.NOBLOCK)
-                    assert len(recv_req) == 2, f"Received invalid request: {recv_req}"
+                    assert len(recv_req) in (2, 3), f"Received invalid request: {recv_req[:2]}"
                     if recv_req[0] == b"forward":
                         # Create a new ForwardRequest instance and parse from bytes
                         forward_request = forward_pb2.ForwardRequest()
                         forward_request.ParseFromString(recv_req[1])
-                        recv_req = proto_to_request(forward_request, self.device)
+                        # Packed hidden states come as an optional third frame
+                        hidden_states = recv_req[2] if len(recv_req) == 3 else None
+                        recv_req = proto_to_request(forward_request, self.device, hidden_states)
 
                         # Convert hidden_states dtype if necessary
                         if recv_req is not None and len(recv_req) > 0:
@@ -341,9 +389,17 @@ class BaseExecutor:
         }
 
     def prepare_next_batch_requests(
-        self, requests: List[Request], hidden_states: Any, context_lengths: Any
+        self,
+        requests: List[Request],
+        hidden_states: Any,
+        context_lengths: Any,
+        prefix_lens: Optional[Any] = None,
     ) -> List[Request]:
-        """Prepares a batch of requests for the next stage of the pipeline."""
+        """Prepares a batch of requests for the next stage of the pipeline.
+
+        `prefix_lens` are the prompt tokens served from the prefix cache; prefill
+        hidden states only cover the tokens after them.
+        """
         if self.tp_rank == 0:
             batched_requests = []
             pre_length = 0
@@ -355,6 +411,8 @@ class BaseExecutor:
                     # Other peers get a 3D array of hidden states
                     if src_request.is_prefill:
                         true_length = int(context_lengths[i])
+                        if prefix_lens is not None:
+                            true_length -= int(prefix_lens[i])
                         if hidden_states.ndim == 3:
                             hidden_state_for_req = hidden_states[i, :true_length, :]
                         else:
@@ -393,23 +451,30 @@ class BaseExecutor:
             f"Executor for layers [{self.start_layer}, {self.end_layer}) starting run loop..."
         )
         self._should_stop = False
+        # Poll timeout for the next iteration: 0 while there is runnable work,
+        # otherwise block until input arrives or a request could time out.
+        poll_timeout_ms = 0
+        # Steps launched but not yet resolved (async scheduling only)
+        pending_steps = []
+        if self.enable_async_scheduling and self.tp_rank == 0:
+            self._start_sender_thread()
         while not self._should_stop:
             received_requests = []
+            ready = self.poll_input_sockets(poll_timeout_ms)
 
-            # Receive requests from http frontend
-            if self.is_first_peer:
+            # Receive requests from http frontend, draining everything queued
+            if self.is_first_peer and self._input_socket_ready(ready, "recv_from_ipc_socket"):
                 received_requests = self.recv_requests_from_http()
 
             # Receive requests from peer
-            received_requests.extend(self.recv_requests_from_peer())
+            if self._input_socket_ready(ready, "recv_from_peer_socket"):
+                received_requests.extend(self.recv_requests_from_peer())
 
             self.handle_input_requests(received_requests)
 
             # Send finished batch to next peer
             if len(self.finished_batch) > 0 and self.is_first_peer and self.tp_rank == 0:
-                self.send_to_peer_socket.send_multipart(
-                    [b"abort", abort_request_to_proto(self.finished_batch).SerializeToString()]
-                )
+                self._send_to_peer(b"abort", self.finished_batch)
                 self.finished_batch = []
 
             # Check for layer reallocation signal (before batch processing)
@@ -444,74 +509,201 @@ class BaseExecutor:
                 # Non-fatal; continue serving
                 pass
             batch_to_process = self.scheduler.form_batch()
+            # Preempted requests recompute from scratch, so downstream peers drop their state
+            preempted_reqs = self.scheduler.pop_preempted_requests()
+            if preempted_reqs and self.is_first_peer and not self.is_last_peer:
+                self.finished_batch.extend(preempted_reqs)
             if not batch_to_process:
+                if pending_steps:
+                    # Nothing new to overlap with; finish the in-flight step now so
+                    # its requests can become ready again.
+                    self._complete_steps(pending_steps)
+                    pending_steps = []
+                    poll_timeout_ms = 0
+                    continue
+                poll_timeout_ms = 0 if self.finished_batch else self.scheduler.next_wakeup_ms()
                 continue
+            poll_timeout_ms = 0
             logger.debug(f"Formed batch with {len(batch_to_process)} requests.")
 
             # 6. Process the batch
-            try:
-                prepared_inputs_dict = self.prepare_batch_inputs(batch_to_process)
+            launched_steps = self._launch_batch(batch_to_process)
+            if self.enable_async_scheduling:
+                # Step N+1 is now queued behind step N on the device, so resolving
+                # step N's outputs below overlaps with step N+1's execution.
+                self._complete_steps(pending_steps)
+                pending_steps = launched_steps
+                if self.is_first_peer and self.is_last_peer and self.tp_rank == 0:
+                    # Decodes feed their lazily sampled tokens into the next step,
+                    # so it can be formed before this one resolves.
+                    self._schedule_ahead(launched_steps)
+            else:
+                self._complete_steps(launched_steps)
+
+    def _launch_batch(self, batch_to_process: List[Request]) -> List[Tuple[str, Dict, Any, float]]:
+        """Prepares inputs and runs the model forward for a formed batch.
+
+        Returns one (batch_type, prepared_inputs, output, start_time) step per
+        non-empty prefill/decode sub-batch. With async scheduling the outputs are
+        only enqueued for evaluation and resolved later by `_complete_steps`.
+        """
+        steps = []
+        try:
+            prepared_inputs_dict = self.prepare_batch_inputs(batch_to_process)
 
-                # We will process prefill and decode batches separately for now
-                for batch_type in ["prefill_batch", "decode_batch"]:
-                    if prepared_inputs_dict and prepared_inputs_dict.get(batch_type):
-                        prepared_inputs = prepared_inputs_dict[batch_type]
+            # We will process prefill and decode batches separately for now
+            for batch_type in ["prefill_batch", "decode_batch"]:
+                if prepared_inputs_dict and prepared_inputs_dict.get(batch_type):
+                    prepared_inputs = prepared_inputs_dict[batch_type]
 
-                        start_time = time.time()
-                        output = self.process_batch(
-                            prepared_inputs, return_decoded_tokens=self.is_last_peer
-                        )
-                        # Update metrics with per-layer latency sample (throttled by decode steps)
-                        if batch_type == "decode_batch":
-                            try:
-                                self._decode_steps_since_metric += len(prepared_inputs["requests"])
-                                if (
-                                    self._decode_steps_since_metric
-                                    >= self.layer_latency_update_every
-                                ):
-                                    elapsed_ms = (time.time() - start_time) * 1000.0
-                                    assert self.num_shard_layers > 0
-                                    per_layer_ms = elapsed_ms / float(self.num_shard_layers)
-                                    if self.shared_state is not None:
-                                        self.shared_state.update_metrics(
-                                            layer_latency_ms_sample=per_layer_ms
-                                        )
-                                    self._decode_steps_since_metric = 0
-                            except Exception:
-                                pass
-                        # 7. Prepare requests for the next stage in the pipeline
-                        next_batch = self.prepare_next_batch_requests(
-                            requests=prepared_inputs["requests"],
-                            hidden_states=output,
-                            context_lengths=prepared_inputs.get("context_lengths"),
-                        )
+                    start_time = time.time()
+                    output = self.process_batch(
+                        prepared_inputs, return_decoded_tokens=self.is_last_peer
+                    )
+                    if self.enable_async_scheduling:
+                        self._start_async_eval(output)
+                    steps.append((batch_type, prepared_inputs, output, start_time))
+        except Exception as e:
+            logger.exception(f"Error processing batch: {e}")
+            # Naive error handling: release and evict all requests in the batch
+            for req in batch_to_process:
+                self.release_and_evict_request(req.request_id)
+            return []
+        return steps
 
-                        # 8. Dispatch to the appropriate destination
-                        if self.tp_rank == 0:
-                            if self.is_last_peer and self.is_first_peer:
-                                # Single node: handle locally
-                                self.handle_input_requests(next_batch)
-                            else:
-                                # Send output to next peer
-                                self.send_to_peer_socket.send_multipart(
-                                    [
-                                        b"forward",
-                                        request_to_proto(
-                                            next_batch, self.device
-                                        ).SerializeToString(),
-                                    ]
-                                )
-                                logger.debug(
-                                    f"Processed batch of type {batch_type} with {len(next_batch)} requests "
-                                    f"in {(time.time() - start_time) * 1000:.3f} ms"
+    def _complete_steps(self, steps: List[Tuple[str, Dict, Any, float]]):
+        """Resolves model outputs of launched steps and dispatches the next requests."""
+        for batch_type, prepared_inputs, output, start_time in steps:
+            try:
+                # Update metrics with per-layer latency sample (throttled by decode steps)
+                if batch_type == "decode_batch":
+                    try:
+                        self._decode_steps_since_metric += len(prepared_inputs["requests"])
+                        if self._decode_steps_since_metric >= self.layer_latency_update_every:
+                            elapsed_ms = (time.time() - start_time) * 1000.0
+                            assert self.num_shard_layers > 0
+                            per_layer_ms = elapsed_ms / float(self.num_shard_layers)
+                            if self.shared_state is not None:
+                                self.shared_state.update_metrics(
+                                    layer_latency_ms_sample=per_layer_ms
                                 )
+                            self._decode_steps_since_metric = 0
+                    except Exception:
+                        pass
+                # 7. Prepare requests for the next stage in the pipeline
+                next_batch = self.prepare_next_batch_requests(
+                    requests=prepared_inputs["requests"],
+                    hidden_states=output,
+                    context_lengths=prepared_inputs.get("context_lengths"),
+                    prefix_lens=prepared_inputs.get("prefix_lens"),
+                )
+
+                # 8. Dispatch to the appropriate destination
+                if self.tp_rank == 0:
+                    if self.is_last_peer and self.is_first_peer:
+                        # Single node: handle locally, dropping outputs of requests that
+                        # finished or were preempted while scheduled ahead
+                        next_batch = [
+                            next_req
+                            for req, next_req in zip(prepared_inputs["requests"], next_batch)
+                            if self.scheduler.get_running_request(req.request_id) is req
+                        ]
+                        self.handle_input_requests(next_batch)
+                    else:
+                        # Send output to next peer
+                        self._send_to_peer(b"forward", next_batch)
+                        logger.debug(
+                            f"Processed batch of type {batch_type} with {len(next_batch)} requests "
+                            f"in {(time.time() - start_time) * 1000:.3f} ms"
+                        )
 
             except Exception as e:
                 logger.exception(f"Error processing batch: {e}")
-                # Naive error handling: release and evict all requests in the batch
-                for req in batch_to_process:
+                for req in prepared_inputs["requests"]:
                     self.release_and_evict_request(req.request_id)
 
+    def _schedule_ahead(self, steps: List[Tuple[str, Dict, Any, float]]):
+        """Makes decodes of just-launched single-node steps ready for their next step.
+
+        The next step takes each request's lazily sampled token as input. Requests this
+        step brings to their length limit are left to finish once it resolves; ones
+        that stop on EOS instead have their extra step dropped by `_complete_steps`.
+        """
+        for batch_type, prepared_inputs, output, _ in steps:
+            if batch_type != "decode_batch":
+                continue
+            for i, req in enumerate(prepared_inputs["requests"]):
+                if req.abort or req.is_finished:
+                    continue
+                if (
+                    req.output_length + 1 >= req.max_new_tokens
+                    or req.total_length + 1 >= req.max_total_length
+                ):
+                    continue
+                self.scheduler.schedule_ahead(req, output[i : i + 1])
+
+    def _start_async_eval(self, outputs: Any):
+        """Starts device evaluation of outputs without waiting for the result.
+
+        Backends with lazy evaluation override this; eager backends already run
+        asynchronously with respect to the host.
+        """
+
+    def _materialize_next_batch(self, next_batch: List[Request]):
+        """Forces evaluation of hidden states on the sender thread before serialization."""
+
+    def _send_to_peer(self, kind: bytes, requests: List[Request]):
+        """Sends forward or abort requests to the next peer.
+
+        With async scheduling, waiting for the hidden states, serialization and the
+        socket write happen on the sender thread, which owns the send socket for the lifetime of the loop.
+        """
+        if self._send_queue is not None:
+            self._send_queue.put((kind, requests))
+            return
+        self._send_frames(kind, requests)
+
+    def _send_frames(self, kind: bytes, requests: List[Request]):
+        if kind == b"forward":
+            forward_request, hidden_states = request_to_frames(requests, self.device)
+            frames = [kind, forward_request.SerializeToString()]
+            if hidden_states is not None:
+                frames.append(hidden_states)
+        else:
+            frames = [kind, abort_request_to_proto(requests).SerializeToString()]
+        self.send_to_peer_socket.send_multipart(frames, copy=False)
+
+    def _start_sender_thread(self):
+        if self._sender_thread is not None or not hasattr(self, "send_to_peer_socket"):
+            return
+        self._send_queue = queue.Queue()
+        self._sender_thread = threading.Thread(
+            target=self._sender_loop, name="executor-sender", daemon=True
+        )
+        self._sender_thread.start()
+
+    def _stop_sender_thread(self):
+        if self._sender_thread is None:
+            return
+        self._send_queue.put(None)
+        self._sender_thread.join(timeout=5)
+        self._sender_thread = None
+        self._send_queue = None
+
+    def _sender_loop(self):
+        while True:
+            item = self._send_queue.get()
+            if item is None:
+                break
+            kind, requests = item
+            try:
+                if kind == b"forward":
+                    # Waiting for the device here keeps the loop thread free to launch
+                    self._materialize_next_batch(requests)
+                self._send_frames(kind, requests)
+            except Exception as e:
+                logger.exception(f"Error sending {kind.decode()} requests to next peer: {e}")
+
     def run_loop_in_background(self):
         """Run the executor loop in the background."""
 
@@ -535,6 +727,8 @@ class BaseExecutor:
         except Exception:
             pass
 
+        self._stop_sender_thread()
+
         try:
             if self.tp_rank == 0:
                 self.recv_from_peer_socket.close()
@@ -653,10 +847,14 @@ class BaseExecutor:
             ), "Invalid request type for decoding."
 
             next_token_id, hidden_states = self._gen_token_id_from_hidden(hidden_states)
+            current_position = request.total_length + 1
+            if request.is_partial_prefill:
+                # Acknowledges a prefill chunk; the sampled token is not committed
+                current_position = request.prefill_chunk_end
             return IntermediateRequest(
                 request_id=request.request_id,
                 status=RequestStatus.DECODING,
-                current_position=request.total_length + 1,
+                current_position=current_position,
                 input_ids=request.input_ids,
                 hidden_states=hidden_states,
                 next_token_id=next_token_id,
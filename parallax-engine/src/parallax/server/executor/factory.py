@@ -78,7 +78,16 @@ def create_from_args(
     elif device == "mlx":
         from parallax.server.executor.mlx_executor import MLXExecutor
 
-        executor = MLXExecutor(**config)
+        executor = MLXExecutor(
+            **config,
+            enable_async_scheduling=(
+                args.enable_async_scheduling if "enable_async_scheduling" in args else False
+            ),
+            enable_chunked_prefill=(
+                args.enable_chunked_prefill if "enable_chunked_prefill" in args else False
+            ),
+            kv_cache_dtype=args.kv_cache_dtype if "kv_cache_dtype" in args else "auto",
+        )
     else:
         raise ValueError(f"Unsupported device type: {device}")
     return executor
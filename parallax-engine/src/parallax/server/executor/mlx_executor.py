@@ -20,6 +20,7 @@ from parallax.server.shard_loader import MLXModelLoader
 from parallax.utils.utils import (
     combine_padding_and_causal_masks,
     create_causal_mask,
+    create_prefix_causal_mask,
     get_device_dtype,
     pad_inputs,
 )
@@ -80,6 +81,12 @@ class MLXExecutor(BaseExecutor):
         nccl_port: Optional[int] = 4000,
         # Optional shared state for layer reallocation detection (when running in subprocess)
         shared_state: Optional[dict] = None,
+        # Pipeline host-side batch preparation with device execution via mx.async_eval
+        enable_async_scheduling: bool = False,
+        # Split long prompts into token-budgeted prefill chunks
+        enable_chunked_prefill: bool = False,
+        # KV cache storage type: "auto" (model dtype) or "int8"
+        kv_cache_dtype: str = "auto",
     ):
         logger.debug(
             f"Initializing MLX sharded model loader for repo={model_repo}, layers=[{start_layer}, {end_layer})"
@@ -140,6 +147,19 @@ class MLXExecutor(BaseExecutor):
         indexer_key_head_dim = self.config.get("indexer_key_head_dim", None)
         indexer_num_kv_heads = self.config.get("indexer_num_kv_heads", None)
 
+        # Prefix caching and chunked prefill start prefill after tokens already in the
+        # cache, which needs every layer's state to live in the paged KV cache and
+        # prefill attention to read it back.
+        supports_cached_prefill = not (self.using_state_cache or indexer_key_head_dim)
+        self.enable_prefix_cache = enable_prefix_cache
+        if (enable_prefix_cache or enable_chunked_prefill) and not supports_cached_prefill:
+            logger.warning(
+                "Prefix caching and chunked prefill are not supported for linear attention "
+                "or indexer models; disabling them."
+            )
+            self.enable_prefix_cache = False
+            enable_chunked_prefill = False
+
         logger.debug(
             "Initializing PagedKVCacheManager (mlx) with block_size=%d, layers=%d",
             kv_block_size,
@@ -152,6 +172,8 @@ class MLXExecutor(BaseExecutor):
             dtype=self.dtype,
             block_size=kv_block_size,
             cache_memory_fraction=kv_cache_memory_fraction,
+            enable_prefix_caching=self.enable_prefix_cache,
+            kv_cache_dtype=kv_cache_dtype,
             head_dim_v=v_head_dim,
             indexer_key_head_dim=indexer_key_head_dim,
             indexer_num_kv_heads=indexer_num_kv_heads,
@@ -176,6 +198,8 @@ class MLXExecutor(BaseExecutor):
             tp_rank=tp_rank,
             tp_size=tp_size,
             shared_state=shared_state,
+            enable_async_scheduling=enable_async_scheduling,
+            enable_chunked_prefill=enable_chunked_prefill,
         )
 
         try:
@@ -183,17 +207,6 @@ class MLXExecutor(BaseExecutor):
         except Exception:
             logger.warning(f"Using mlx without metal backend.")
 
-        # Prefix Cache Manager
-        self.enable_prefix_cache = enable_prefix_cache
-        # self.prefix_cache = RadixCache(
-        #     num_kv_heads=num_key_value_heads,
-        #     head_dim=head_dim,
-        #     head_dim_v=v_head_dim,
-        #     num_layers=self.num_shard_layers,
-        #     dtype=self.dtype,
-        #     page_size=1,
-        # )
-
         logger.debug(
             f"KVCacheManager ready; wired_limit set; prefix_cache={'on' if self.enable_prefix_cache else 'off'}"
         )
@@ -225,6 +238,13 @@ class MLXExecutor(BaseExecutor):
                         )
                         continue
 
+                    if original_req.is_partial_prefill:
+                        # A prefill chunk went through the pipeline; schedule the next one
+                        original_req.num_computed_tokens = original_req.prefill_chunk_end
+                        original_req.prefill_chunk_len = None
+                        self.scheduler.enque_request(original_req)
+                        continue
+
                     assert req.next_token_id is not None
                     original_req.commit_new_token(req.next_token_id)
                     if len(req.routing_table) > 0:
@@ -265,16 +285,11 @@ class MLXExecutor(BaseExecutor):
                     req, IntermediateRequest
                 ), "Non-first peers must receive IntermediateRequests."
                 if req.is_finished or req.hidden_states is None:
-                    if self.enable_prefix_cache:
-                        keys, values = self.kv_cache_manager.gather_kv_cache(req.request_id)
-                        self.prefix_cache.cache_finished_request(req, keys, values)
-                        self.prefix_cache.evict_request(req.request_id)
-
                     self.kv_cache_manager.release_request(req.request_id)
                     logger.debug(
                         f"Released resources for finished request {req.request_id}, "
-                        f"kv cache manager has {self.kv_cache_manager.tokens_in_cache} tokens, "
-                        f"memory usage: {mx.get_active_memory() / 1024**3 :.3f} GB"
+                        f"kv cache manager has {self.kv_cache_manager.get_num_free_blocks()} "
+                        f"free blocks, memory usage: {mx.get_active_memory() / 1024**3 :.3f} GB"
                     )
                     self.scheduler.evict_request(req.request_id)
                     if not self.is_last_peer:
@@ -297,6 +312,7 @@ class MLXExecutor(BaseExecutor):
             context_lengths=prepared_inputs.get("context_lengths"),
             slot_mapping=prepared_inputs.get("slot_mapping"),
             indexer_cache=prepared_inputs.get("indexer_cache"),
+            prefix_lens=prepared_inputs.get("prefix_lens"),
         )
 
         logger.debug(
@@ -305,27 +321,30 @@ class MLXExecutor(BaseExecutor):
             f"hidden_states shape: {hidden_states.shape}"
         )
 
-        lengths = mx.zeros((len(prepared_inputs["requests"]),), dtype=mx.int32)
+        # Build lengths with a single graph op instead of per-element updates
         requests = prepared_inputs["requests"]
-        for i, req in enumerate(requests):
-            if req.is_prefill:
-                lengths[i] = prepared_inputs.get("context_lengths")[i]
-            elif req.is_decoding:
-                lengths[i] = 1
-            else:
-                continue
+        is_prefill = mx.array([req.is_prefill for req in requests])
+        is_decoding = mx.array([req.is_decoding for req in requests])
+        segment_lengths = prepared_inputs.get("context_lengths")
+        if prepared_inputs.get("prefix_lens") is not None:
+            segment_lengths = segment_lengths - prepared_inputs["prefix_lens"]
+        lengths = mx.where(
+            is_prefill,
+            segment_lengths,
+            is_decoding.astype(mx.int32),
+        ).astype(mx.int32)
 
         # Note: With PagedAttention, we don't need to explicitly update requests with new K/V
         # because they are written in-place to the global cache.
         # self.kv_cache_manager.update_requests(...) is REMOVED.
 
-        # Update prefix cache (TODO: Adapt to PagedKV)
+        # Publish the prompt blocks written by this step to the prefix cache
         if self.enable_prefix_cache:
-            pass
-            # for _, req in enumerate(requests):
-            #    if req.is_prefill:
-            #        keys, values = self.kv_cache_manager.gather_kv_cache(req.request_id)
-            #        self.prefix_cache.cache_unfinished_request(req, keys, values)
+            for req in requests:
+                if req.is_prefill:
+                    self.kv_cache_manager.cache_prefix(
+                        req.request_id, req.prefill_token_ids[: req.prefill_chunk_end]
+                    )
 
         # Process last peer: need additional sampling + detokenization
         if return_decoded_tokens:
@@ -336,6 +355,16 @@ class MLXExecutor(BaseExecutor):
 
         return hidden_states
 
+    def _start_async_eval(self, outputs: Any):
+        """Enqueue the step's lazy graph so it runs while the next step is being prepared."""
+        mx.async_eval(outputs)
+
+    def _materialize_next_batch(self, next_batch: List[Request]):
+        """Evaluate per-request hidden state slices together on the sender thread."""
+        hidden_states = [req.hidden_states for req in next_batch if req.hidden_states is not None]
+        if hidden_states:
+            mx.eval(hidden_states)
+
     def _release_request(self, rid: str):
         """Release per-request resources in MLX."""
         try:
@@ -361,17 +390,11 @@ class MLXExecutor(BaseExecutor):
             return None
 
         h_or_tokens_list = []
-        block_tables_list = []
         context_lengths_list = []
-
-        # TODO: Adapt Prefix Cache to PagedKV
+        prefix_lens_list = []
 
         for req in batched_requests:
             assert req.is_prefill, f"Request {req.request_id} is not a prefill request."
-            if self.is_first_peer:
-                h_or_tokens_list.append(req.input_ids)
-            else:
-                h_or_tokens_list.append(req.hidden_states)
 
             # Allocate Paged KV blocks
             # For first peer and intermediate peers, we allocate based on prompt length
@@ -379,10 +402,17 @@ class MLXExecutor(BaseExecutor):
             if not success:
                 raise RuntimeError(f"OOM during prefill allocation for {req.request_id}")
 
-            block_table = self.kv_cache_manager.get_block_table(req.request_id)
-            block_tables_list.append(block_table)
-            # For prefill, context length after this step will be total_length
-            context_lengths_list.append(req.total_length)
+            # Prompt tokens from the prefix cache or earlier chunks are not recomputed
+            prefix_len = req.num_computed_tokens
+            context_len = req.prefill_chunk_end
+            if self.is_first_peer:
+                h_or_tokens_list.append(req.prefill_token_ids[prefix_len:context_len])
+            else:
+                h_or_tokens_list.append(req.hidden_states)
+
+            # For prefill, context length after this step is the end of the chunk
+            context_lengths_list.append(context_len)
+            prefix_lens_list.append(prefix_len)
 
         if self.is_first_peer:
             padded_inputs, padding_mask = pad_inputs(
@@ -391,41 +421,40 @@ class MLXExecutor(BaseExecutor):
         else:
             padded_inputs, padding_mask = pad_inputs(0, h_or_tokens_list, self.dtype)
 
-        # Generate slot_mapping (Batch * MaxLen) for prefill
-        max_len = padded_inputs.shape[1]
-        slot_mapping_flat = []
-
-        for i, req in enumerate(batched_requests):
-            block_table = block_tables_list[i]
-            length = req.total_length
-
-            for seq_idx in range(max_len):
-                if seq_idx < length:
-                    # Valid token
-                    block_idx = seq_idx // self.kv_cache_manager.block_size
-                    block_offset = seq_idx % self.kv_cache_manager.block_size
-                    physical_block = block_table[block_idx]
-                    slot = physical_block * self.kv_cache_manager.block_size + block_offset
-                    slot_mapping_flat.append(slot)
-                else:
-                    # Padding token
-                    # Map to -1. The kernel should ignore this.
-                    slot_mapping_flat.append(-1)
-
-        slot_mapping_tensor = mx.array(slot_mapping_flat, dtype=mx.int64)
-
-        # Pad block tables
-        max_blocks = max(len(bt) for bt in block_tables_list)
-        padded_block_tables = []
-        for bt in block_tables_list:
-            padded_block_tables.append(bt + [0] * (max_blocks - len(bt)))
+        # Padded block tables and the (Batch * MaxLen) slot mapping for prefill;
+        # padding tokens map to -1 and are ignored by the kernel.
+        block_tables_np = self.kv_cache_manager.get_padded_block_tables(
+            [req.request_id for req in batched_requests]
+        )
+        segment_lengths = [
+            context_len - prefix_len
+            for context_len, prefix_len in zip(context_lengths_list, prefix_lens_list)
+        ]
+        slot_mapping_np = self.kv_cache_manager.get_slot_mapping(
+            block_tables_np, segment_lengths, padded_inputs.shape[1], prefix_lens=prefix_lens_list
+        )
 
-        block_tables_tensor = mx.array(padded_block_tables, dtype=mx.int32)
+        slot_mapping_tensor = mx.array(slot_mapping_np)
+        block_tables_tensor = mx.array(block_tables_np)
         context_lengths_tensor = mx.array(context_lengths_list, dtype=mx.int32)
 
-        # Create mask for standard attention (used during Prefill computation)
-        causal_mask = create_causal_mask(padded_inputs.shape[1], padded_inputs.shape[1], self.dtype)
-        mask = combine_padding_and_causal_masks(padding_mask, causal_mask, self.dtype)
+        if any(prefix_lens_list):
+            # Segments attend to their cached prefix, gathered from the paged cache
+            prefix_lens_tensor = mx.array(prefix_lens_list, dtype=mx.int32)
+            mask = create_prefix_causal_mask(
+                prefix_lens_tensor,
+                context_lengths_tensor,
+                padded_inputs.shape[1],
+                block_tables_np.shape[1] * self.kv_cache_manager.block_size,
+                self.dtype,
+            )
+        else:
+            # Create mask for standard attention (used during Prefill computation)
+            prefix_lens_tensor = None
+            causal_mask = create_causal_mask(
+                padded_inputs.shape[1], padded_inputs.shape[1], self.dtype
+            )
+            mask = combine_padding_and_causal_masks(padding_mask, causal_mask, self.dtype)
 
         ret = {
             "h_or_tokens": padded_inputs,
@@ -436,9 +465,13 @@ class MLXExecutor(BaseExecutor):
             "block_tables": block_tables_tensor,
             "context_lengths": context_lengths_tensor,
             "slot_mapping": slot_mapping_tensor,
+            "prefix_lens": prefix_lens_tensor,
             "state_cache": None,
         }
-        logger.debug(f"Prepared MLX prefill batch (size={batch_size})")
+        logger.debug(
+            f"Prepared MLX prefill batch (size={batch_size}, "
+            f"cached prefix tokens={sum(prefix_lens_list)})"
+        )
         return ret
 
     def _prepare_decode_batch(self, batched_requests: List[Request]) -> Optional[Dict[str, Any]]:
@@ -448,7 +481,6 @@ class MLXExecutor(BaseExecutor):
             return None
 
         h_or_tokens_list = []
-        block_tables_list = []
         context_lengths_list = []
 
         for req in batched_requests:
@@ -462,16 +494,22 @@ class MLXExecutor(BaseExecutor):
 
             # TODO: Prefix cache update
 
-            # Allocate slot for new token
-            success = self.kv_cache_manager.append_slot(req.request_id)
-            if not success:
-                raise RuntimeError(f"OOM during decode for {req.request_id}")
-
-            block_table = self.kv_cache_manager.get_block_table(req.request_id)
-            block_tables_list.append(block_table)
+            # The scheduler already reserved the slot for the new token
             context_lengths_list.append(self.kv_cache_manager.get_context_length(req.request_id))
 
-        if isinstance(h_or_tokens_list[0], list):
+        if self.is_first_peer and any(req.lookahead_token is not None for req in batched_requests):
+            # Requests scheduled ahead take the in-flight step's lazily sampled token
+            padded_inputs = mx.concatenate(
+                [
+                    (
+                        req.lookahead_token.astype(mx.int32)
+                        if req.lookahead_token is not None
+                        else mx.array(tokens, dtype=mx.int32)
+                    )
+                    for req, tokens in zip(batched_requests, h_or_tokens_list)
+                ]
+            ).reshape(batch_size, 1)
+        elif isinstance(h_or_tokens_list[0], list):
             # First peer case: h_or_tokens_list is list of list of ints [[token_id], ...]
             padded_inputs = mx.array(h_or_tokens_list, dtype=mx.int32)  # (Batch, 1)
         else:
@@ -479,13 +517,11 @@ class MLXExecutor(BaseExecutor):
             padded_inputs = mx.concatenate(h_or_tokens_list, axis=0)  # (Batch, D)
             padded_inputs = padded_inputs.reshape(batch_size, 1, -1)  # (Batch, 1, D)
 
-        # Pad block tables
-        max_blocks = max(len(bt) for bt in block_tables_list)
-        padded_block_tables = []
-        for bt in block_tables_list:
-            padded_block_tables.append(bt + [0] * (max_blocks - len(bt)))
-
-        block_tables_tensor = mx.array(padded_block_tables, dtype=mx.int32)
+        block_tables_tensor = mx.array(
+            self.kv_cache_manager.get_padded_block_tables(
+                [req.request_id for req in batched_requests]
+            )
+        )
         context_lengths_tensor = mx.array(context_lengths_list, dtype=mx.int32)
 
         ret = {
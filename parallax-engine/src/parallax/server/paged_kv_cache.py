@@ -1,59 +1,118 @@
-from typing import Dict, List, Optional, Set, Tuple
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 import mlx.core as mx
+import numpy as np
+import psutil
 
+from parallax.metal.paged_attention.mlx_backend import QuantizedPagedCache
 from parallax_utils.logging_config import get_logger
 
 logger = get_logger(__name__)
 
 
 class BlockAllocator:
-    """Manages allocation of physical block indices."""
+    """Manages allocation of physical block indices.
+
+    Free blocks live in a preallocated int32 stack whose first `num_free` entries are
+    valid, so allocating and freeing n blocks costs O(n) regardless of the pool size.
+    A per-block bitmap catches double frees.
+    """
 
     def __init__(self, num_blocks: int, block_size: int):
         self.num_blocks = num_blocks
         self.block_size = block_size
-        # Initialize free blocks stack
-        # Using a list as a stack is efficient for LIFO allocation
-        self.free_blocks: List[int] = list(range(num_blocks))
-        # Keep track of used blocks for safety/debugging
-        self.used_blocks: Set[int] = set()
-
-    def allocate(self, num_blocks_needed: int) -> List[int]:
-        """Allocates `num_blocks_needed` physical blocks."""
-        if len(self.free_blocks) < num_blocks_needed:
+        # Free block stack; blocks are popped from (and pushed back to) the top
+        self.free_stack = np.arange(num_blocks, dtype=np.int32)
+        self.num_free = num_blocks
+        # Allocation bitmap, for safety/debugging and occupancy statistics
+        self.is_used = np.zeros(num_blocks, dtype=np.bool_)
+
+    def allocate_array(self, num_blocks_needed: int) -> np.ndarray:
+        """Allocates `num_blocks_needed` physical blocks as an int32 array (empty on OOM)."""
+        if self.num_free < num_blocks_needed:
             # Out of memory
-            return []
+            return np.empty(0, dtype=np.int32)
 
-        # Pop blocks from the stack
-        split_idx = len(self.free_blocks) - num_blocks_needed
-        allocated = self.free_blocks[split_idx:]
-        self.free_blocks = self.free_blocks[:split_idx]
+        self.num_free -= num_blocks_needed
+        allocated = self.free_stack[self.num_free : self.num_free + num_blocks_needed].copy()
+        self.is_used[allocated] = True
+        return allocated
 
-        for b in allocated:
-            self.used_blocks.add(b)
+    def allocate(self, num_blocks_needed: int) -> List[int]:
+        """Allocates `num_blocks_needed` physical blocks."""
+        return self.allocate_array(num_blocks_needed).tolist()
 
-        return allocated
+    def allocate_batch(self, num_blocks_per_request: List[int]) -> Optional[List[np.ndarray]]:
+        """Allocates blocks for several requests at once; all or nothing (None on OOM)."""
+        total = sum(num_blocks_per_request)
+        if self.num_free < total:
+            return None
+        allocated = self.allocate_array(total)
+        return np.split(allocated, np.cumsum(num_blocks_per_request)[:-1])
 
-    def free(self, blocks: List[int]):
+    def free(self, blocks: Union[List[int], np.ndarray]):
         """Frees the given physical blocks."""
-        for b in blocks:
-            if b in self.used_blocks:
-                self.used_blocks.remove(b)
-                self.free_blocks.append(b)
-            else:
-                logger.warning(f"Double free detected for block {b}")
+        blocks = np.asarray(blocks, dtype=np.int32)
+        if blocks.size == 0:
+            return
+        valid = self.is_used[blocks]
+        if len(blocks) > 1:
+            # A block repeated within one call is only freed once
+            _, first = np.unique(blocks, return_index=True)
+            unique = np.zeros(len(blocks), dtype=np.bool_)
+            unique[first] = True
+            valid &= unique
+        if not valid.all():
+            logger.warning(f"Double free detected for blocks {blocks[~valid].tolist()}")
+            blocks = blocks[valid]
+
+        self.is_used[blocks] = False
+        self.free_stack[self.num_free : self.num_free + len(blocks)] = blocks
+        self.num_free += len(blocks)
 
     def get_num_free_blocks(self) -> int:
-        return len(self.free_blocks)
+        return self.num_free
 
     def get_num_used_blocks(self) -> int:
-        return len(self.used_blocks)
+        return self.num_blocks - self.num_free
+
+    def get_stats(self) -> Dict[str, float]:
+        """Occupancy and fragmentation of the block pool.
+
+        Fragmentation is the share of free blocks outside the largest contiguous run
+        of free block indices (0 when all free blocks are adjacent).
+        """
+        largest_free_run = 0
+        if self.num_free > 0:
+            free = np.concatenate(([False], ~self.is_used, [False])).astype(np.int8)
+            edges = np.flatnonzero(np.diff(free))
+            largest_free_run = int((edges[1::2] - edges[::2]).max())
+        return {
+            "num_blocks": self.num_blocks,
+            "num_free_blocks": self.num_free,
+            "num_used_blocks": self.get_num_used_blocks(),
+            "occupancy": self.get_num_used_blocks() / max(self.num_blocks, 1),
+            "fragmentation": 1.0 - largest_free_run / self.num_free if self.num_free else 0.0,
+        }
 
 
 class PagedKVCacheManager:
     """
     Manages the Paged KV Cache tensors and block tables for requests.
+
+    With prefix caching enabled, every full prompt block is identified by a hash
+    chained over all tokens up to and including that block, so equal hashes imply
+    equal prefixes. Physical blocks are ref-counted and shared between requests with
+    a common prefix; blocks nobody references stay cached until the allocator runs
+    out of free blocks, at which point the least recently used ones are reclaimed.
+
+    New requests are only admitted while at least `watermark` of the blocks stay free
+    afterwards, which keeps headroom for running requests to grow during decode.
+
+    With `kv_cache_dtype="int8"`, keys and values are stored as int8 with a scale per
+    cached token and KV head (see `QuantizedPagedCache`), roughly halving the cache
+    footprint of fp16/bf16 models.
     """
 
     def __init__(
@@ -66,6 +125,9 @@ class PagedKVCacheManager:
         cache_memory_fraction: float = 0.8,
         num_gpu_blocks: Optional[int] = None,
         max_num_seqs: int = 256,  # Max concurrent requests hint
+        enable_prefix_caching: bool = False,
+        watermark: float = 0.01,
+        kv_cache_dtype: str = "auto",
         head_dim_v: Optional[int] = None,
         indexer_key_head_dim: Optional[int] = None,
         indexer_num_kv_heads: Optional[int] = None,
@@ -79,11 +141,17 @@ class PagedKVCacheManager:
         self.dtype = dtype
         self.block_size = block_size
         self.max_num_seqs = max_num_seqs
+        self.enable_prefix_caching = enable_prefix_caching
+        if kv_cache_dtype not in ("auto", "int8"):
+            raise ValueError(f"Unsupported kv_cache_dtype: {kv_cache_dtype}")
+        self.kv_cache_dtype = kv_cache_dtype
 
         if num_gpu_blocks is None:
             num_gpu_blocks = self._calculate_num_blocks(cache_memory_fraction, dtype)
 
         self.num_gpu_blocks = num_gpu_blocks
+        # Free blocks kept back from admission for decode growth
+        self.watermark_blocks = int(watermark * num_gpu_blocks)
 
         # 1. Initialize Allocator
         self.allocator = BlockAllocator(num_gpu_blocks, block_size)
@@ -92,15 +160,12 @@ class PagedKVCacheManager:
         # Shape: (num_layers, num_blocks, num_kv_heads, block_size, head_dim)
         logger.info(
             f"Allocating Paged KV Cache: {num_gpu_blocks} blocks, {block_size} block_size, "
-            f"k_head_dim={self.head_dim}, v_head_dim={self.head_dim_v}"
+            f"k_head_dim={self.head_dim}, v_head_dim={self.head_dim_v}, "
+            f"kv_cache_dtype={kv_cache_dtype}"
         )
 
-        self.key_cache = mx.zeros(
-            (num_layers, num_gpu_blocks, num_kv_heads, block_size, self.head_dim), dtype=dtype
-        )
-        self.value_cache = mx.zeros(
-            (num_layers, num_gpu_blocks, num_kv_heads, block_size, self.head_dim_v), dtype=dtype
-        )
+        self.key_cache = self._zeros_cache(self.head_dim)
+        self.value_cache = self._zeros_cache(self.head_dim_v)
 
         if self.indexer_key_head_dim is not None and self.indexer_num_kv_heads is not None:
             logger.info(
@@ -125,17 +190,47 @@ class PagedKVCacheManager:
         mx.eval(self.key_cache, self.value_cache)
 
         # 3. Request State Management
-        # Mapping: request_id -> List of physical block indices
-        self.block_tables: Dict[str, List[int]] = {}
+        # Mapping: request_id -> preallocated int32 array of physical block indices;
+        # only the first num_blocks[request_id] entries are valid.
+        self.block_tables: Dict[str, np.ndarray] = {}
+        # Mapping: request_id -> number of valid entries in its block table
+        self.num_blocks: Dict[str, int] = {}
         # Mapping: request_id -> current context length (number of tokens)
         self.context_lengths: Dict[str, int] = {}
+        # Mapping: request_id -> number of prompt tokens served from the prefix cache
+        self.num_cached_tokens: Dict[str, int] = {}
+
+        # 4. Prefix Cache State
+        # Number of block tables referencing each physical block
+        self.block_ref_counts = np.zeros(num_gpu_blocks, dtype=np.int32)
+        # Mapping: prefix hash -> physical block, and its inverse
+        self.cached_blocks: Dict[int, int] = {}
+        self.block_hashes: Dict[int, int] = {}
+        # Cached blocks with no references, least recently used first
+        self.evictable_blocks: "OrderedDict[int, None]" = OrderedDict()
+
+    def _zeros_cache(self, head_dim: int):
+        shape = (self.num_layers, self.num_gpu_blocks, self.num_kv_heads, self.block_size)
+        if self.kv_cache_dtype == "int8":
+            return QuantizedPagedCache(
+                mx.zeros(shape + (head_dim,), dtype=mx.int8),
+                mx.zeros(shape + (1,), dtype=self.dtype),
+            )
+        return mx.zeros(shape + (head_dim,), dtype=self.dtype)
 
     def _calculate_num_blocks(self, cache_memory_fraction: float, dtype: mx.Dtype) -> int:
 
-        device_info = mx.metal.device_info()
-        total_mem = device_info["max_recommended_working_set_size"]
-        current_mem = mx.metal.get_active_memory()
-        free_mem = total_mem - current_mem
+        if mx.metal.is_available():
+            device_info = mx.metal.device_info()
+            total_mem = device_info["max_recommended_working_set_size"]
+            current_mem = mx.get_active_memory()
+            free_mem = total_mem - current_mem
+        else:
+            # CPU fallback (pure-MLX paged attention): budget against available system memory
+            virtual_memory = psutil.virtual_memory()
+            total_mem = virtual_memory.total
+            free_mem = virtual_memory.available
+            current_mem = total_mem - free_mem
 
         # We use a fraction of FREE memory, but for safety in multi-process/multi-model
         # scenarios, we might want to base it on TOTAL memory fraction if we know
@@ -148,15 +243,16 @@ class PagedKVCacheManager:
         # But here we stick to "use what is available" to be safe.
         available_for_kv = free_mem * cache_memory_fraction
 
-        dtype_size = 2 if dtype in [mx.float16, mx.bfloat16] else 4
+        dtype_size = dtype.size
+        kv_elem_size, kv_scale_size = dtype_size, 0
+        if self.kv_cache_dtype == "int8":
+            # One byte per value plus one scale per token and head
+            kv_elem_size, kv_scale_size = 1, dtype_size
 
         # Calculate bytes per block considering potentially different K and V head dimensions
-        key_block_bytes = (
-            self.num_layers * self.num_kv_heads * self.block_size * self.head_dim * dtype_size
-        )
-        value_block_bytes = (
-            self.num_layers * self.num_kv_heads * self.block_size * self.head_dim_v * dtype_size
-        )
+        slots_per_block = self.num_layers * self.num_kv_heads * self.block_size
+        key_block_bytes = slots_per_block * (self.head_dim * kv_elem_size + kv_scale_size)
+        value_block_bytes = slots_per_block * (self.head_dim_v * kv_elem_size + kv_scale_size)
         indexer_block_bytes = 0
         if self.indexer_key_head_dim is not None and self.indexer_num_kv_heads is not None:
             indexer_block_bytes = (
@@ -190,43 +286,175 @@ class PagedKVCacheManager:
         return num_gpu_blocks
 
     def get_num_free_blocks(self) -> int:
-        return self.allocator.get_num_free_blocks()
+        """Free blocks, including cached blocks that can be reclaimed on demand."""
+        return self.allocator.get_num_free_blocks() + len(self.evictable_blocks)
 
     def can_allocate(self, num_tokens: int) -> bool:
         num_blocks = (num_tokens + self.block_size - 1) // self.block_size
-        return self.allocator.get_num_free_blocks() >= num_blocks
+        return self.get_num_free_blocks() >= num_blocks
 
-    def allocate_request(self, request_id: str, prompt_len: int) -> bool:
+    def _allocate_blocks(self, num_blocks_needed: int) -> List[int]:
+        """Allocates fresh blocks, reclaiming least recently used cached blocks if needed."""
+        shortfall = num_blocks_needed - self.allocator.get_num_free_blocks()
+        if shortfall > len(self.evictable_blocks):
+            return []
+        evicted = []
+        for _ in range(max(shortfall, 0)):
+            block, _ = self.evictable_blocks.popitem(last=False)
+            del self.cached_blocks[self.block_hashes.pop(block)]
+            evicted.append(block)
+        self.allocator.free(evicted)
+
+        blocks = self.allocator.allocate(num_blocks_needed)
+        self.block_ref_counts[blocks] = 1
+        return blocks
+
+    def _acquire_blocks(self, blocks: List[int]):
+        """Adds a reference to already allocated (possibly evictable) blocks."""
+        for block in blocks:
+            self.evictable_blocks.pop(block, None)
+            self.block_ref_counts[block] += 1
+
+    def _release_blocks(self, blocks: List[int]):
+        """Drops a reference to each block; unreferenced blocks are cached or freed."""
+        to_free = []
+        # Release the tail first so a sequence's head blocks are evicted last
+        for block in reversed(blocks):
+            self.block_ref_counts[block] -= 1
+            if self.block_ref_counts[block] > 0:
+                continue
+            if block in self.block_hashes:
+                self.evictable_blocks[block] = None
+            else:
+                to_free.append(block)
+        self.allocator.free(to_free)
+
+    def _copy_block(self, src: int, dst: int):
+        """Copies one physical block across all layers."""
+        arrays = [self.key_cache, self.value_cache]
+        if self.kv_cache_dtype == "int8":
+            arrays = [*self.key_cache, *self.value_cache]
+        if self.indexer_key_cache is not None:
+            arrays.append(self.indexer_key_cache)
+        for array in arrays:
+            array[:, dst] = array[:, src]
+
+    def _iter_block_hashes(self, token_ids: List[int]) -> Iterator[int]:
+        """Yields the chained hash of every full block of `token_ids`."""
+        parent_hash = None
+        for start in range(0, len(token_ids) - self.block_size + 1, self.block_size):
+            parent_hash = hash((parent_hash, tuple(token_ids[start : start + self.block_size])))
+            yield parent_hash
+
+    def _match_prefix(self, token_ids: List[int]) -> List[int]:
+        """Returns the cached physical blocks holding the longest cached prefix of `token_ids`."""
+        blocks = []
+        for block_hash in self._iter_block_hashes(token_ids):
+            block = self.cached_blocks.get(block_hash)
+            if block is None:
+                break
+            blocks.append(block)
+        return blocks
+
+    def allocate_request(
+        self,
+        request_id: str,
+        prompt_len: int,
+        token_ids: Optional[List[int]] = None,
+        num_cached_tokens: Optional[int] = None,
+    ) -> bool:
         """
         Allocates initial blocks for a new request (Prefill).
-        Returns True if successful, False if OOM.
+
+        With prefix caching enabled and `token_ids` given, the longest cached prefix
+        is shared instead of allocated. At least the last prompt token is always left
+        to compute, so the request still produces hidden states; if the reused prefix
+        ends inside a block, that block is copied before the request writes to it.
+        `num_cached_tokens` asks for exactly that many cached tokens (e.g. to mirror
+        an upstream peer) and fails if they are not cached here.
+
+        Returns True if successful, False if OOM or the requested prefix is missing.
         """
         if request_id in self.block_tables:
             return True
 
         num_blocks = (prompt_len + self.block_size - 1) // self.block_size
-        blocks = self.allocator.allocate(num_blocks)
 
-        if len(blocks) < num_blocks:
-            # Allocation failed
-            if blocks:
-                self.allocator.free(blocks)
+        shared: List[int] = []
+        num_cached = 0
+        if self.enable_prefix_caching and token_ids is not None and num_cached_tokens != 0:
+            shared = self._match_prefix(token_ids[:prompt_len])
+            num_cached = min(len(shared) * self.block_size, prompt_len - 1)
+            if num_cached_tokens is not None:
+                num_cached = min(num_cached, num_cached_tokens)
+            shared = shared[: (num_cached + self.block_size - 1) // self.block_size]
+
+        if num_cached_tokens is not None and num_cached < num_cached_tokens:
+            logger.warning(
+                f"Request {request_id} expects {num_cached_tokens} cached prefix tokens, "
+                f"but only {num_cached} are cached on this peer."
+            )
+            return False
+
+        # Reference the shared blocks first so they can't be reclaimed below
+        self._acquire_blocks(shared)
+        copy_on_write = num_cached % self.block_size != 0
+        num_new_blocks = num_blocks - len(shared) + int(copy_on_write)
+        if self.get_num_free_blocks() - num_new_blocks < self.watermark_blocks:
+            # Admitting would eat into the decode headroom
+            self._release_blocks(shared)
             return False
 
-        self.block_tables[request_id] = blocks
+        blocks = self._allocate_blocks(num_new_blocks)
+
+        if copy_on_write:
+            # The request writes into the last shared block, so give it a private copy
+            src, dst = shared[-1], blocks.pop(0)
+            self._copy_block(src, dst)
+            self._release_blocks([src])
+            shared[-1] = dst
+
+        # Leave headroom so decode steps rarely need to grow the table
+        table = np.zeros(max(2 * num_blocks, 4), dtype=np.int32)
+        table[:num_blocks] = shared + blocks
+        self.block_tables[request_id] = table
+        self.num_blocks[request_id] = num_blocks
         self.context_lengths[request_id] = prompt_len
+        self.num_cached_tokens[request_id] = num_cached
         return True
 
+    def cache_prefix(self, request_id: str, token_ids: List[int]):
+        """
+        Registers the request's full prompt blocks in the prefix cache.
+        Call once the prompt's KV has been written (scheduled) for the request.
+        """
+        if not self.enable_prefix_caching or request_id not in self.block_tables:
+            return
+        table = self.get_block_table_array(request_id)
+        for i, block_hash in enumerate(self._iter_block_hashes(token_ids)):
+            if i >= len(table):
+                break
+            block = int(table[i])
+            if block_hash not in self.cached_blocks and block not in self.block_hashes:
+                self.cached_blocks[block_hash] = block
+                self.block_hashes[block] = block_hash
+
+    def get_num_cached_tokens(self, request_id: str) -> int:
+        """Number of prompt tokens of the request that were served from the prefix cache."""
+        return self.num_cached_tokens.get(request_id, 0)
+
     def has_request(self, request_id: str) -> bool:
         return request_id in self.block_tables
 
     def free_request(self, request_id: str):
         """Frees all blocks associated with a request."""
         if request_id in self.block_tables:
-            blocks = self.block_tables[request_id]
-            self.allocator.free(blocks)
+            blocks = self.get_block_table(request_id)
+            self._release_blocks(blocks)
             del self.block_tables[request_id]
+            del self.num_blocks[request_id]
             del self.context_lengths[request_id]
+            del self.num_cached_tokens[request_id]
 
     def release_request(self, request_id: str):
         """Alias for free_request to match Executor expectation."""
@@ -243,16 +471,66 @@ class PagedKVCacheManager:
         current_len = self.context_lengths[request_id]
 
         if current_len % self.block_size == 0:
-            new_blocks = self.allocator.allocate(1)
+            new_blocks = self._allocate_blocks(1)
             if not new_blocks:
                 return False  # OOM
-            self.block_tables[request_id].extend(new_blocks)
+            table = self.block_tables[request_id]
+            n = self.num_blocks[request_id]
+            if n == len(table):
+                # Amortized growth: double the preallocated table
+                grown = np.zeros(2 * len(table), dtype=np.int32)
+                grown[:n] = table
+                self.block_tables[request_id] = table = grown
+            table[n] = new_blocks[0]
+            self.num_blocks[request_id] = n + 1
 
         self.context_lengths[request_id] += 1
         return True
 
     def get_block_table(self, request_id: str) -> List[int]:
-        return self.block_tables.get(request_id, [])
+        if request_id not in self.block_tables:
+            return []
+        return self.get_block_table_array(request_id).tolist()
+
+    def get_block_table_array(self, request_id: str) -> np.ndarray:
+        """Returns a view of the valid part of the request's int32 block table."""
+        return self.block_tables[request_id][: self.num_blocks[request_id]]
+
+    def get_padded_block_tables(self, request_ids: List[str]) -> np.ndarray:
+        """Returns the block tables of `request_ids` as a zero-padded (batch, max_blocks) array."""
+        counts = [self.num_blocks[rid] for rid in request_ids]
+        padded = np.zeros((len(request_ids), max(max(counts), 1)), dtype=np.int32)
+        for i, rid in enumerate(request_ids):
+            padded[i, : counts[i]] = self.block_tables[rid][: counts[i]]
+        return padded
+
+    def get_slot_mapping(
+        self,
+        padded_block_tables: np.ndarray,
+        lengths: List[int],
+        max_len: int,
+        prefix_lens: Optional[List[int]] = None,
+    ) -> np.ndarray:
+        """
+        Maps every (request, position) of a padded batch to its physical cache slot.
+
+        Position `i` of request `b` is token `prefix_lens[b] + i` of the sequence
+        (`prefix_lens` defaults to 0, i.e. the batch starts at the first token).
+        Returns a flat (batch * max_len,) int64 array; positions at or beyond a
+        request's length (padding) are mapped to -1 so the kernel skips them.
+        """
+        positions = np.arange(max_len, dtype=np.int64)[None, :]
+        if prefix_lens is not None:
+            positions = positions + np.asarray(prefix_lens, dtype=np.int64)[:, None]
+        block_idx = np.minimum(positions // self.block_size, padded_block_tables.shape[1] - 1)
+        slots = (
+            np.take_along_axis(padded_block_tables, block_idx, axis=1).astype(np.int64)
+            * self.block_size
+            + positions % self.block_size
+        )
+        padding = np.arange(max_len)[None, :] >= np.asarray(lengths, dtype=np.int64)[:, None]
+        slots[padding] = -1
+        return slots.reshape(-1)
 
     def get_context_length(self, request_id: str) -> int:
         return self.context_lengths.get(request_id, 0)
@@ -7,7 +7,8 @@ Each Intermediate Peer will only hold `IntermediateRequest`,
     which contains part of the info of `InitialRequest`.
         * request id,
         * current position.
-        * relevant hidden_states (prompt_len, hidden_size) or (1, hidden_size)
+        * relevant hidden_states (prompt_len, hidden_size) or (1, hidden_size);
+          with prefix caching, prefill hidden states skip the cached prompt tokens.
     We will pack `IntermediateRequest` and send to the following peers.
 
 In our current design, the Last Peer won't hold `InitialRequest` for several reasons:
@@ -53,11 +54,24 @@ Decode:
     Last Peer: takes in `hidden_states`,
         generates and sends `output_id` to the first Peer.
 
+Chunked prefill:
+    The First Peer may split a long prompt into chunks that fit the step's token budget.
+    Each chunk travels like a prefill whose hidden states cover positions
+    [num_computed_tokens, current_position). For a partial chunk the Last Peer replies with
+    an acknowledgement (current_position before the end of the prefill) instead of a token to
+    commit, and the First Peer schedules the next chunk once it arrives.
+
+Preemption:
+    When the KV cache runs out of blocks for decoding, the First Peer's scheduler frees the
+    lowest-priority running requests and aborts them downstream. A preempted request goes back
+    to PREFILLING and later recomputes its prompt plus the tokens generated so far.
+
 TODO:
     1. Add support for multiple output_ids in a single step (e.g. beam width, top-k sampling, etc.);
     2. Accepts more generation configs like repetition penalties.
 """
 
+import time
 import uuid
 from enum import Enum
 from typing import Any, List, Optional
@@ -106,9 +120,23 @@ class Request:
         self.abort = False
         self.ready_for_next_step = False
         self.last_updated_time: Optional[float] = None
+        # Earlier arrivals have higher priority when requests are preempted
+        self.arrival_time = time.time()
+        # Leading prompt tokens already in the KV cache before the next prefill segment
+        self.num_computed_tokens = 0
+        # Prompt tokens the scheduler picked for the current prefill step (None: all remaining)
+        self.prefill_chunk_len: Optional[int] = None
+        # Lazily sampled token of the in-flight decode step, when the request is
+        # scheduled again before that step resolves (single node, async scheduling)
+        self.lookahead_token: Optional[Any] = None
         self.lora_id: Optional[str] = None
         self.lora_path = lora_path
 
+    @property
+    def prefill_token_ids(self) -> List[int]:
+        """Token IDs the prefill computes the KV cache for."""
+        return self.input_ids
+
     @property
     def is_finished(self) -> bool:
         """Checks if the request has finished processing."""
@@ -198,6 +226,25 @@ class InitialRequest(Request):
         """Total length of the sequence (input + output)."""
         return self.prompt_len + self.output_length
 
+    @property
+    def prefill_token_ids(self) -> List[int]:
+        """The prompt, followed by the generated tokens when a preempted request recomputes."""
+        if not self.output_ids:
+            return self.input_ids
+        return self.input_ids + self.output_ids
+
+    @property
+    def prefill_chunk_end(self) -> int:
+        """Position (exclusive) the current prefill step computes up to."""
+        if not self.is_prefill or self.prefill_chunk_len is None:
+            return self.total_length
+        return min(self.num_computed_tokens + self.prefill_chunk_len, self.total_length)
+
+    @property
+    def is_partial_prefill(self) -> bool:
+        """Whether the current prefill step leaves part of the sequence for later chunks."""
+        return self.is_prefill and self.prefill_chunk_end < self.total_length
+
     def get_model_input_for_first_peer(self) -> List[int]:
         """
         Returns the token IDs the First Peer's model should process for the current step.
@@ -262,6 +309,7 @@ class IntermediateRequest(Request):
         routing_table: Optional[List[str]] = [],
         sampling_params: Optional[SamplingParams] = None,
         lora_path: Optional[str] = None,
+        num_computed_tokens: int = 0,
     ):
         super().__init__(
             request_id=request_id,
@@ -283,6 +331,8 @@ class IntermediateRequest(Request):
         self.current_position = current_position
         self.hidden_states = hidden_states
         self.next_token_id = next_token_id
+        # Prefill hidden states only cover positions [num_computed_tokens, current_position)
+        self.num_computed_tokens = num_computed_tokens
 
     @property
     def input_length(self) -> int:
@@ -295,6 +345,16 @@ class IntermediateRequest(Request):
         """Total length of the sequence (input + output)."""
         return self.current_position
 
+    @property
+    def prefill_chunk_end(self) -> int:
+        """Position (exclusive) the carried prefill hidden states end at."""
+        return self.current_position
+
+    @property
+    def is_partial_prefill(self) -> bool:
+        """Whether the carried prefill chunk ends before the prompt does."""
+        return self.is_prefill and self.current_position < len(self.input_ids)
+
     @classmethod
     def from_initial_request(
         cls,
@@ -326,13 +386,18 @@ class IntermediateRequest(Request):
         return IntermediateRequest(
             request_id=initial_request.request_id,
             status=initial_request.status,
-            input_ids=initial_request.input_ids,
+            input_ids=(
+                initial_request.prefill_token_ids
+                if initial_request.is_prefill
+                else initial_request.input_ids
+            ),
             next_token_id=next_token_id,
-            current_position=initial_request.total_length,
+            current_position=initial_request.prefill_chunk_end,
             hidden_states=hidden_states,
             sampling_params=initial_request.sampling_params,
             routing_table=initial_request.routing_table,
             lora_path=lora_path,
+            num_computed_tokens=initial_request.num_computed_tokens,
         )
 
     @classmethod
@@ -356,6 +421,7 @@ class IntermediateRequest(Request):
             routing_table=old_request.routing_table,
             sampling_params=old_request.sampling_params,
             lora_path=lora_path,
+            num_computed_tokens=old_request.num_computed_tokens,
         )
 
     def __repr__(self):
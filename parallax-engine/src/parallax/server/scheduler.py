@@ -15,13 +15,20 @@ We use an explicit 2-Phase approach:
         Implemented by `form_batch`. We prioritize PREFILL requests
         first within `max_num_tokens_per_batch` and `micro_batch_size`,
         then include DECODE requests that are marked ready for the next decode step.
+        With chunked prefill, the First Peer splits prompts that don't fit the token
+        budget left after the ready decodes, so prefill and decode share every step.
+        Decodes reserve their next KV slot here; when the cache is out of blocks the
+        First Peer preempts the most recently arrived idle requests, which go back to
+        the wait queue and recompute their KV cache once readmitted.
+        With async scheduling on a single node, decodes are scheduled ahead with the
+        in-flight step's lazily sampled token, so the next step can be formed at once.
 
 Our scheduler also handles tokenization and pre-processing for the First Peer's requests.
 """
 
 import time
 from collections import OrderedDict
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
 from parallax.server.kv_cache import KVCacheManager
 from parallax.server.request import InitialRequest, Request, RequestStatus
@@ -45,9 +52,11 @@ class Scheduler:
         scheduler_wait_ms: int = 200,
         micro_batch_ratio: int = 2,
         is_first_peer: bool = False,
+        is_last_peer: bool = False,
         kv_cache_manager: Optional[KVCacheManager] = None,
         request_timeout_s: Optional[int] = 600,
         shared_state: Optional[SharedState] = None,
+        enable_chunked_prefill: bool = False,
         **kwargs,
     ):
         """
@@ -56,15 +65,20 @@ class Scheduler:
             max_num_tokens_per_batch: Maxmimum number of prefill + decode tokens in a single batch;
             scheduler_wait_ms: The minimum time to wait before dispatching a batch;
             micro_batch_ratio: micro_batch_size = max_batch_size // micro_batch_ratio;
+            is_last_peer: whether this peer also runs the model's last layers (single node
+                when combined with is_first_peer);
             tokenizer: The tokenizer to use for the model;
             kv_cache_manager: The KV cache manager to use for the scheduler.
             request_timeout_s: timeout for each inflight request (default 10mins).
+            enable_chunked_prefill: split long prompts into token-budgeted chunks (First Peer).
         """
         self.max_batch_size = max_batch_size
         self.max_num_tokens_per_batch = max_num_tokens_per_batch
         self.micro_batch_size = max(1, max_batch_size // micro_batch_ratio)
         self.scheduler_wait_ms = scheduler_wait_ms
         self.is_first_peer = is_first_peer
+        self.is_last_peer = is_last_peer
+        self.enable_chunked_prefill = enable_chunked_prefill
         if is_first_peer:
             # Load configs for building InitialRequest
             self.tokenizer = kwargs.get("tokenizer", None)
@@ -76,6 +90,8 @@ class Scheduler:
         self._wait_queue: List[Request] = []
         # Keeps track of all in-flight requests
         self._running_requests: Dict[str, Request] = OrderedDict()
+        # Requests preempted since the last `pop_preempted_requests`
+        self._preempted_requests: List[Request] = []
 
         self.kv_cache_manager = kv_cache_manager
         self.shared_state = shared_state
@@ -124,20 +140,25 @@ class Scheduler:
             )
             return
 
+        if request.lookahead_token is not None:
+            # Already scheduled ahead with this token, which output_ids now holds
+            request.lookahead_token = None
+            return
+
         request.ready_for_next_step = True
         request.last_updated_time = time.time()
-        # TODO: Handle chunked prefill.
-        if request.is_decoding:
-            rid = request.request_id
+        rid = request.request_id
+        if request.is_decoding or rid in self._running_requests:
+            # Decode steps and follow-up prefill chunks belong to an admitted request
             if rid not in self._running_requests:
                 raise ValueError(
                     f"Decode request {rid} must already be admitted (in running requests)."
                 )
-            # Merge incoming decode readiness/state into the existing running request
+            # Merge incoming readiness/state into the existing running request
             self._running_requests[rid] = request
             # Update recency ordering so earlier-ready decodes are encountered first during batching
             self._running_requests.move_to_end(rid)
-            logger.debug(f"Decode request {rid} marked ready for next decode.")
+            logger.debug(f"Request {rid} marked ready for next step.")
             return
 
         self._wait_queue.append(request)
@@ -145,6 +166,21 @@ class Scheduler:
             f"Prefill request {request.request_id} added to the prefill wait queue (size={len(self._wait_queue)})."
         )
 
+    def schedule_ahead(self, request: Request, token: Any):
+        """Marks a running decode request ready before its in-flight step resolves.
+
+        `token` is that step's lazily sampled output; the next decode step takes it as
+        input, so the step can be launched while the previous one still runs. The
+        `enque_request` that follows the token's commit then leaves the request as is.
+        """
+        rid = request.request_id
+        if self._running_requests.get(rid) is not request:
+            return
+        request.lookahead_token = token
+        request.ready_for_next_step = True
+        request.last_updated_time = time.time()
+        self._running_requests.move_to_end(rid)
+
     def evict_request(self, request_id: str):
         """Removes a request from the scheduler's running queue."""
         if request_id in self._running_requests:
@@ -166,6 +202,12 @@ class Scheduler:
             req = self._running_requests[request_id]
             req.abort = True
             logger.debug(f"Cancelled request {request_id} from scheduler.")
+        elif any(req.request_id == request_id for req in self._wait_queue):
+            # Preempted requests wait for readmission; stop once they are recomputed
+            for req in self._wait_queue:
+                if req.request_id == request_id:
+                    req.abort = True
+            logger.debug(f"Cancelled waiting request {request_id} from scheduler.")
         else:
             raise ValueError(f"Attempted to cancel non-existent request {request_id}.")
 
@@ -227,12 +269,33 @@ class Scheduler:
             # Check kv cache pool
             if self.kv_cache_manager is not None:
                 if not self.kv_cache_manager.has_request(req.request_id):
-                    # TODO: Handle chunked prefill, and support preemption.
-                    if not self.kv_cache_manager.allocate_request(req.request_id, req.total_length):
+                    # Later peers must mirror exactly the prefix the previous peer skipped.
+                    # Each peer evicts its own prefix blocks, so the first peer only skips
+                    # its cached prefix when no later peer has to hold the same one.
+                    # Prefill reserves the whole prompt, even if it arrives in chunks
+                    token_ids = req.prefill_token_ids if req.is_prefill else None
+                    num_tokens = len(token_ids) if req.is_prefill else req.total_length
+                    if not self.is_first_peer:
+                        num_cached_tokens = req.num_computed_tokens
+                    elif self.is_last_peer:
+                        num_cached_tokens = None
+                    else:
+                        num_cached_tokens = 0
+                    if not self.kv_cache_manager.allocate_request(
+                        req.request_id,
+                        num_tokens,
+                        token_ids=token_ids,
+                        num_cached_tokens=num_cached_tokens,
+                    ):
+                        # Keep it at the head of the queue and retry once blocks free up;
+                        # upstream peers are already waiting for it
                         logger.warning(
                             f"Request {rid} can't be admit to running batch due to KV cache size."
                         )
-                        continue
+                        self._wait_queue.insert(0, req)
+                        break
+                    if self.is_first_peer and req.is_prefill:
+                        req.num_computed_tokens = self.kv_cache_manager.get_num_cached_tokens(rid)
 
             # Add request to running requests
             self._running_requests[rid] = req
@@ -272,6 +335,79 @@ class Scheduler:
                 continue
         return timed_out
 
+    def next_wakeup_ms(self) -> int:
+        """Milliseconds an idle executor may block waiting for input.
+
+        Bounded by `scheduler_wait_ms` and by the earliest running request timeout,
+        so timeouts are still enforced while nothing else is happening.
+        """
+        wait_ms = float(self.scheduler_wait_ms)
+        if self.request_timeout_s is not None and self._running_requests:
+            now = time.time()
+            for req in self._running_requests.values():
+                if req.last_updated_time is None:
+                    continue
+                remaining_ms = (req.last_updated_time + self.request_timeout_s - now) * 1000.0
+                wait_ms = min(wait_ms, remaining_ms)
+        return max(0, int(wait_ms))
+
+    def _reserve_decode_slot(self, req: Request, batch: List[Request]) -> bool:
+        """Grows the KV cache by the slot the request decodes into next.
+
+        When no block is free, the First Peer preempts the lowest-priority (latest
+        arrived) idle request until the slot fits; that may be `req` itself. Other
+        peers can't recompute on their own, so they keep `req` ready and retry later.
+        Returns whether `req` can run this step.
+        """
+        if self.kv_cache_manager is None:
+            return True
+        rid = req.request_id
+        while not self.kv_cache_manager.append_slot(rid):
+            if not self.is_first_peer:
+                logger.warning(f"Out of KV cache blocks, deferring decode for request {rid}.")
+                return False
+            scheduled = {r.request_id for r in batch}
+            # Only requests waiting for a step can be preempted. One scheduled ahead may
+            # still have a step in flight, whose output is dropped once it resolves.
+            victims = [
+                r
+                for r in self._running_requests.values()
+                if r.ready_for_next_step and r.request_id not in scheduled
+            ]
+            victim = max(victims, key=lambda r: r.arrival_time)
+            self.preempt_request(victim)
+            if victim is req:
+                return False
+        return True
+
+    def preempt_request(self, request: Request):
+        """Frees a running request's KV cache and requeues it to recompute later.
+
+        The request goes back to the front of the wait queue as a prefill over its
+        prompt and generated tokens. Downstream peers must drop their copy too; the
+        executor collects these requests with `pop_preempted_requests`.
+        """
+        rid = request.request_id
+        logger.info(
+            f"Preempting request {rid} ({request.total_length} tokens) to free KV cache blocks."
+        )
+        if self.kv_cache_manager is not None:
+            self.kv_cache_manager.release_request(rid)
+        self.evict_request(rid)
+        request.status = RequestStatus.PREFILLING
+        request.num_computed_tokens = 0
+        request.prefill_chunk_len = None
+        request.lookahead_token = None
+        request.ready_for_next_step = True
+        self._wait_queue.insert(0, request)
+        self._preempted_requests.append(request)
+
+    def pop_preempted_requests(self) -> List[Request]:
+        """Returns and clears the requests preempted since the last call."""
+        preempted = self._preempted_requests
+        self._preempted_requests = []
+        return preempted
+
     def form_batch(self) -> List[Request]:
         """Form the active batch for the next forward pass.
 
@@ -297,12 +433,26 @@ class Scheduler:
                 elif req.is_decoding:
                     decode_candidates.append(req)
 
+        # Token budget kept for ready decodes, so a long prompt can't starve them
+        decode_reserve = 0
+        chunking = self.enable_chunked_prefill and self.is_first_peer
+        if chunking:
+            decode_reserve = min(len(decode_candidates), self.micro_batch_size)
+
         # 1) Fill with prefills first
         for req in prefill_candidates:
             if len(batch) >= self.micro_batch_size:
                 break
-            cost = req.prompt_len
-            if cost + inflight_tokens > self.max_num_tokens_per_batch:
+            # Prompt tokens not yet in the KV cache (cached prefix or earlier chunks)
+            cost = req.total_length - req.num_computed_tokens
+            budget = self.max_num_tokens_per_batch - decode_reserve - inflight_tokens
+            if chunking:
+                if budget <= 0:
+                    continue
+                # Schedule as much of the prompt as the budget allows
+                cost = min(cost, budget)
+                req.prefill_chunk_len = cost
+            if cost > budget:
                 continue
             batch.append(req)
             inflight_tokens += cost
@@ -314,6 +464,11 @@ class Scheduler:
             cost = 1
             if cost + inflight_tokens > self.max_num_tokens_per_batch:
                 continue
+            if req.request_id not in self._running_requests:
+                # Preempted to make room for an earlier decode
+                continue
+            if not self._reserve_decode_slot(req, batch):
+                continue
             batch.append(req)
             inflight_tokens += cost
 
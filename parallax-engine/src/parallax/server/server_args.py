@@ -105,6 +105,22 @@ def parse_args() -> argparse.Namespace:
         "--kv-block-size", type=int, default=64, help="Block size for KV cache management"
     )
 
+    parser.add_argument(
+        "--kv-cache-dtype",
+        type=str,
+        default="auto",
+        choices=["auto", "int8"],
+        help="KV cache storage type; int8 stores per-token scales (MLX backend)",
+    )
+
+    parser.add_argument(
+        "--activation-transport",
+        nargs="+",
+        default=["none"],
+        help="Encoding of hidden states sent to the next peer: none, lz4, zstd (lossless) or "
+        "int8 (per-token quantized). Use <PEER_ID>=<MODE> to set it for a single route",
+    )
+
     parser.add_argument(
         "--enable-prefix-cache", action="store_true", help="Enable prefix cache reuse"
     )
@@ -140,6 +156,18 @@ def parse_args() -> argparse.Namespace:
         "--scheduler-wait-ms", type=int, default=500, help="Scheduler wait time in milliseconds"
     )
 
+    parser.add_argument(
+        "--enable-async-scheduling",
+        action="store_true",
+        help="Overlap batch preparation with model execution (MLX backend)",
+    )
+
+    parser.add_argument(
+        "--enable-chunked-prefill",
+        action="store_true",
+        help="Split long prompts into token-budgeted chunks interleaved with decodes (MLX backend)",
+    )
+
     parser.add_argument(
         "--request-timeout-s",
         type=int,
@@ -333,3 +361,24 @@ def validate_args(args: argparse.Namespace) -> None:
     ]
     if args.dtype not in dtype_list:
         raise ValueError(f"Unsupported dtype: {args.dtype}. Supported dtypes: {dtype_list}")
+
+    if getattr(args, "kv_cache_dtype", "auto") == "int8":
+        from parallax.utils.utils import get_current_device
+
+        # Other backends would silently keep a full-precision cache while the node
+        # advertises int8 capacity to the scheduler
+        if get_current_device() != "mlx":
+            raise ValueError("kv_cache_dtype int8 is only supported on the MLX backend")
+
+    if getattr(args, "activation_transport", None):
+        from parallax.p2p.message_util import (
+            parse_activation_transport,
+            supported_activation_transports,
+        )
+
+        for transport in parse_activation_transport(args.activation_transport).values():
+            if transport not in supported_activation_transports():
+                raise ValueError(
+                    f"Activation transport {transport} needs the "
+                    f"{'zstandard' if transport == 'zstd' else transport} package"
+                )
@@ -2,7 +2,7 @@
 
 import random
 import socket
-from typing import List
+from typing import List, Optional
 
 import mlx.core as mx
 import numpy as np
@@ -252,6 +252,60 @@ def create_causal_mask(seq_len: int, total_len: int, dtype=mx.bfloat16) -> mx.ar
     return final_mask
 
 
+def get_rope_offsets(
+    context_lengths: mx.array, target_len: int, prefix_lens: Optional[mx.array] = None
+):
+    """
+    Returns RoPE position offsets for a batch.
+
+    Decode steps continue from each sequence's own context length, so this returns
+    a (batch,) vector of offsets that `rope(x, offset=...)` applies per sequence in a
+    single op. Prefill segments start right after the tokens already in the KV cache
+    (`prefix_lens`), or at position 0 when nothing is cached.
+    """
+    if target_len == 1:
+        return context_lengths - 1
+    if prefix_lens is not None:
+        return prefix_lens
+    return 0
+
+
+def create_prefix_causal_mask(
+    prefix_lens: mx.array,
+    context_lengths: mx.array,
+    target_len: int,
+    source_len: int,
+    dtype=mx.bfloat16,
+    window_size: Optional[int] = None,
+) -> mx.array:
+    """
+    Creates the mask for prefill segments that attend to a cached prefix.
+
+    Query `i` of sequence `b` sits at position `prefix_lens[b] + i` and may attend to
+    cached positions up to and including its own, within the sequence's context.
+
+    Args:
+        prefix_lens: (B,) number of tokens already cached before each segment.
+        context_lengths: (B,) context length of each sequence after the segment.
+        target_len: padded segment length.
+        source_len: number of gathered cache positions.
+        dtype: The data type for the mask.
+        window_size: Optional sliding window; positions at least this far behind
+            the query are masked out.
+
+    Returns:
+        mx.array: An additive mask of shape (B, 1, target_len, source_len).
+    """
+    q_pos = prefix_lens[:, None, None] + mx.arange(target_len)[None, :, None]
+    k_pos = mx.arange(source_len)[None, None, :]
+    allowed = (k_pos <= q_pos) & (k_pos < context_lengths[:, None, None])
+    if window_size is not None:
+        allowed = allowed & (q_pos - k_pos < window_size)
+    inf_value = get_infinite_value_by_dtype(dtype)
+    mask = mx.where(allowed, mx.array(0, dtype), mx.array(-inf_value, dtype))
+    return mask[:, None, :, :]
+
+
 def combine_padding_and_causal_masks(
     padding_mask: mx.array, causal_mask: mx.array, dtype=mx.bfloat16
 ) -> mx.array:
@@ -69,7 +69,7 @@ def compute_max_tokens_in_cache(
     per_token_cache_size = (
         num_shard_layers * num_key_value_heads * (head_dim_k + head_dim_v) * elem_bytes
     )
-    return max(0, available_cache_size // per_token_cache_size)
+    return max(0, int(available_cache_size // per_token_cache_size))
 
 
 def derive_max_batch_size(
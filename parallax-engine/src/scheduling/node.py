@@ -10,9 +10,10 @@ Scheduling primitives for distributed LLM inference.
 """
 
 import time
+from concurrent.futures import Future
 from dataclasses import dataclass, field
 from math import floor
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from parallax_utils.logging_config import get_logger
 from parallax_utils.utils import bytes_per_element, compute_max_batch_size
@@ -47,12 +48,25 @@ class RequestSignal:
     - request_id: Unique identifier (hash) for the request
     - received_ts: UNIX timestamp (seconds) when the request was received
     - routing_table: Set by the scheduler when a path is assigned. Semantics:
-        None -> not assigned yet; [] -> all pipelines full at the moment; [..] -> route
+        None -> not assigned yet; [] -> scheduler stopped before routing it; [..] -> route.
+        Requests that find every pipeline full stay queued until capacity frees up.
+    - routed: Resolved with the routing table once it is set, so callers can block or
+        await (via `asyncio.wrap_future`) instead of polling. Cancelling it withdraws
+        the request from the scheduler's admission queue.
     """
 
     request_id: str
     received_ts: float = field(default_factory=time.time)
     routing_table: Optional[List[str]] = None
+    routed: "Future[List[str]]" = field(default_factory=Future, repr=False, compare=False)
+
+    def resolve(self, routing_table: List[str]) -> bool:
+        """Publish the routing decision; returns False if the caller stopped waiting."""
+        if not self.routed.set_running_or_notify_cancel():
+            return False
+        self.routing_table = routing_table
+        self.routed.set_result(routing_table)
+        return True
 
 
 class RooflinePerformanceModel:
@@ -176,6 +190,8 @@ class Node:
 
     kvcache_mem_ratio: float = 0.3
     param_mem_ratio: float = 0.5
+    # KV cache storage type reported by the node: "auto" (model dtype) or "int8"
+    kv_cache_dtype: str = "auto"
 
     max_concurrent_requests: int = 16
     max_sequence_length: int = 4096
@@ -197,6 +213,18 @@ class Node:
 
     _force_max_concurrent_requests: bool = False
 
+    # Routing evaluates node costs for every request; these only change with the
+    # allocation or config, so they are cached under the inputs they depend on.
+    _max_requests_cache: Optional[Tuple[tuple, int]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _roofline_model: Optional[RooflinePerformanceModel] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _roofline_latency_cache: Dict[tuple, float] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
     def __post_init__(self):
         if self.last_heartbeat == 0.0:
             self.last_heartbeat = time.time()
@@ -211,12 +239,25 @@ class Node:
 
         if self.start_layer is None or self.end_layer is None:
             return self.max_concurrent_requests
+        key = (
+            self.start_layer,
+            self.end_layer,
+            self.kv_cache_dtype,
+            self.kvcache_mem_ratio,
+            self.max_concurrent_requests,
+            self.max_sequence_length,
+        )
+        if self._max_requests_cache is not None and self._max_requests_cache[0] == key:
+            return self._max_requests_cache[1]
         try:
             elem_bytes = bytes_per_element(
                 getattr(self.model_info, "cache_bytes_per_element", None)
             )
         except Exception:
             elem_bytes = 2
+        if self.kv_cache_dtype == "int8":
+            # int8 values plus one scale in the model dtype per token and head
+            elem_bytes = 1 + elem_bytes / self.model_info.head_size_k
         derived_max = compute_max_batch_size(
             requested_max_batch_size=self.max_concurrent_requests,
             max_sequence_len=self.max_sequence_length,
@@ -234,10 +275,10 @@ class Node:
             raise ValueError(
                 f"Node {self.node_id} has invalid max concurrent requests: {derived_max}"
             )
-        if self.max_concurrent_requests is None:
-            return derived_max
-        else:
-            return min(self.max_concurrent_requests, derived_max)
+        if self.max_concurrent_requests is not None:
+            derived_max = min(self.max_concurrent_requests, derived_max)
+        self._max_requests_cache = (key, derived_max)
+        return derived_max
 
     @property
     def num_current_layers(self) -> int:
@@ -333,27 +374,44 @@ class Node:
 
     def roofline_layer_latency_ms(self) -> float:
         """Get the roofline layer latency for this node."""
-        # Compute an effective compute speedup due to quantization.
-        bytes_per_elem = float(self.model_info.param_bytes_per_element)
-        # bf16/fp16 baseline ~2 bytes
-        base = 1.0 if bytes_per_elem <= 0 else 2.0 / bytes_per_elem
-        # Empirical efficiency factor: int8 often achieves ~80% of theoretical 2x
-        efficiency = 0.8 if bytes_per_elem < 2.0 else 1.0
-        quantization_speedup = max(0.1, base * efficiency)
-        perf_model = RooflinePerformanceModel(
-            hardware=self.hardware,
-            model_info=self.model_info,
-            quantization_speedup=quantization_speedup,
-            batch_size=self.current_requests,
-            target_seq_len=1,
-            source_seq_len=self.max_sequence_length,
-            using_mlx=self.hardware.device == "mlx",
+        key = (
+            self.current_requests,
+            self.max_sequence_length,
+            self.has_embedding,
+            self.has_lm_head,
+            self.num_current_layers,
+        )
+        latency = self._roofline_latency_cache.get(key)
+        if latency is not None:
+            return latency
+
+        if self._roofline_model is None:
+            # Compute an effective compute speedup due to quantization.
+            bytes_per_elem = float(self.model_info.param_bytes_per_element)
+            # bf16/fp16 baseline ~2 bytes
+            base = 1.0 if bytes_per_elem <= 0 else 2.0 / bytes_per_elem
+            # Empirical efficiency factor: int8 often achieves ~80% of theoretical 2x
+            efficiency = 0.8 if bytes_per_elem < 2.0 else 1.0
+            quantization_speedup = max(0.1, base * efficiency)
+            self._roofline_model = RooflinePerformanceModel(
+                hardware=self.hardware,
+                model_info=self.model_info,
+                quantization_speedup=quantization_speedup,
+                target_seq_len=1,
+                using_mlx=self.hardware.device == "mlx",
+            )
+        self._roofline_model.set_sequence_shape(
+            batch_size=self.current_requests, source_seq_len=self.max_sequence_length
         )
-        return perf_model.roofline_layer_latency_ms(
+        latency = self._roofline_model.roofline_layer_latency_ms(
             include_input_embed=self.has_embedding,
             include_lm_head=self.has_lm_head,
             num_current_layers=self.num_current_layers,
         )
+        if len(self._roofline_latency_cache) >= 1024:
+            self._roofline_latency_cache.clear()
+        self._roofline_latency_cache[key] = latency
+        return latency
 
     @property
     def layer_latency_ms(self) -> float:
@@ -12,7 +12,9 @@ warm-up phase (to inform rebalancing), then perform shard-level DP to produce th
 final node path and total latency.
 """
 
+import threading
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 
 from parallax_utils.logging_config import get_logger
@@ -40,6 +42,9 @@ class RequestRoutingStrategy(ABC):
     def find_optimal_path(self, nodes: List[Node], num_layers: int) -> Tuple[List[str], float]:
         """Shard-level DP path across nodes. Returns (node_ids, latency)."""
 
+    def invalidate(self) -> None:
+        """Drop routing state derived from RTTs, e.g. after significant RTT changes."""
+
 
 class DynamicProgrammingRouting(RequestRoutingStrategy):
     """
@@ -50,8 +55,26 @@ class DynamicProgrammingRouting(RequestRoutingStrategy):
     - Routing: run a shard-level DP over node assignments (contiguous layer ranges),
       using per-node execution latency and RTT via `Node.get_rtt_to`, to obtain a
       minimum-latency node sequence and total latency.
+
+    The shard graph (node order, transitions and their RTTs) is cached and rebuilt
+    when the node set, an allocation or a node's active state changes, or after
+    `invalidate()`. Per request, only the load-dependent node latencies are
+    re-evaluated.
     """
 
+    def __init__(self) -> None:
+        self._graph_key: Optional[tuple] = None
+        self._graph: Optional[_ShardGraph] = None
+        # Bumped by invalidate() so a graph built from stale RTTs is never stored
+        self._generation = 0
+        self._graph_lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._graph_lock:
+            self._generation += 1
+            self._graph_key = None
+            self._graph = None
+
     @staticmethod
     def find_turning_points(nodes: List[Node], num_layers: int) -> List[Tuple[str, int, str]]:
         """Find shard truncation points via layer-level DP.
@@ -143,11 +166,8 @@ class DynamicProgrammingRouting(RequestRoutingStrategy):
                 turning.append((n.node_id, l0, "head"))
         return turning
 
-    def find_optimal_path(self, nodes: List[Node], num_layers: int) -> Tuple[List[str], float]:
-        """Shard-level DP path across node ranges using `Node` APIs."""
-        if num_layers <= 0 or not nodes:
-            return [], 0.0
-
+    @staticmethod
+    def _build_shard_graph(nodes: List[Node], num_layers: int) -> "_ShardGraph":
         # Collect vertices from nodes with valid layer ranges
         starts: Dict[int, List[int]] = {}
         ends: Dict[int, List[int]] = {}
@@ -157,50 +177,68 @@ class DynamicProgrammingRouting(RequestRoutingStrategy):
             starts.setdefault(n.start_layer, []).append(idx)
             ends.setdefault(n.end_layer, []).append(idx)
 
-        # DP over vertices sorted by (start, end)
-        order = [
-            i
-            for i, n in sorted(
-                [
-                    (i, n)
-                    for i, n in enumerate(nodes)
-                    if n.start_layer is not None and n.end_layer is not None
-                ],
-                key=lambda p: (p[1].start_layer, p[1].end_layer),
-            )
-        ]
-
-        dp: Dict[int, float] = {i: float("inf") for i in order}
-        parent: Dict[int, Optional[int]] = {i: None for i in order}
-
-        # Initialize with nodes starting at layer 0
-        for i in starts.get(0, []):
-            dp[i] = float(nodes[i].layer_latency_ms)
-            parent[i] = None
+        # Vertices sorted by (start, end)
+        order = sorted(
+            [i for idx_list in starts.values() for i in idx_list],
+            key=lambda i: (nodes[i].start_layer, nodes[i].end_layer, i),
+        )
 
         # Transitions: j -> i if end(j) == start(i)
+        transitions: Dict[int, List[Tuple[int, float]]] = {}
         for i in order:
-            if dp[i] == float("inf"):
-                # Not reachable yet; still try to relax successors using INF + ... won't help
-                pass
             n_i = nodes[i]
-            if n_i.start_layer is None:
-                continue
-            for j in ends.get(n_i.start_layer, []):
+            transitions[i] = [
+                (j, 0.0 if nodes[j].node_id == n_i.node_id else float(nodes[j].get_rtt_to(n_i)))
+                for j in ends.get(n_i.start_layer, [])
+            ]
+        return _ShardGraph(
+            heads=starts.get(0, []),
+            order=order,
+            transitions=transitions,
+            terminals=ends.get(num_layers, []),
+        )
+
+    def find_optimal_path(self, nodes: List[Node], num_layers: int) -> Tuple[List[str], float]:
+        """Shard-level DP path across node ranges using `Node` APIs."""
+        if num_layers <= 0 or not nodes:
+            return [], 0.0
+
+        key = (num_layers,) + tuple(
+            (id(n), n.node_id, n.start_layer, n.end_layer, n.is_active) for n in nodes
+        )
+        # invalidate() may run on another thread, so work on a local reference
+        with self._graph_lock:
+            graph = self._graph if self._graph_key == key else None
+            generation = self._generation
+        if graph is None:
+            graph = self._build_shard_graph(nodes, num_layers)
+            with self._graph_lock:
+                if self._generation == generation:
+                    self._graph, self._graph_key = graph, key
+
+        if not graph.terminals:
+            return [], float("inf")
+
+        # Load-dependent node latencies, evaluated once per node
+        latency: Dict[int, float] = {i: float(nodes[i].layer_latency_ms) for i in graph.order}
+        dp: Dict[int, float] = {i: float("inf") for i in graph.order}
+        parent: Dict[int, Optional[int]] = {i: None for i in graph.order}
+
+        # Initialize with nodes starting at layer 0
+        for i in graph.heads:
+            dp[i] = latency[i]
+
+        for i in graph.order:
+            for j, trans in graph.transitions[i]:
                 if dp[j] == float("inf"):
                     continue
-                n_j = nodes[j]
-                trans = 0.0 if n_j.node_id == n_i.node_id else float(n_j.get_rtt_to(n_i))
-                cand = dp[j] + trans + float(n_i.layer_latency_ms)
+                cand = dp[j] + trans + latency[i]
                 if cand < dp[i]:
                     dp[i] = cand
                     parent[i] = j
 
         # Pick best terminal node that ends at num_layers
-        terminals = ends.get(num_layers, [])
-        if not terminals:
-            return [], float("inf")
-        end_idx = min(terminals, key=lambda k: dp.get(k, float("inf")))
+        end_idx = min(graph.terminals, key=lambda k: dp.get(k, float("inf")))
         if dp.get(end_idx, float("inf")) == float("inf"):
             return [], float("inf")
 
@@ -214,6 +252,16 @@ class DynamicProgrammingRouting(RequestRoutingStrategy):
         return [nodes[i].node_id for i in path_indices], dp[end_idx]
 
 
+@dataclass
+class _ShardGraph:
+    """Cached shard-level routing graph; entries are indices into the node list."""
+
+    heads: List[int]
+    order: List[int]
+    transitions: Dict[int, List[Tuple[int, float]]]
+    terminals: List[int]
+
+
 class RoundRobinPipelineRouting(RequestRoutingStrategy):
     """
     Baseline routing strategy using round-robin over complete pipelines.
@@ -41,6 +41,7 @@ class Scheduler:
         water_filling_max_iterations: int = 40,
         request_warm_up_for_reshard: int = 0,
         heartbeat_timeout: float = 60.0,
+        rtt_change_threshold: float = 0.2,
     ) -> None:
         """Initialize the scheduler.
 
@@ -56,6 +57,7 @@ class Scheduler:
             water_filling_max_iterations: Max iterations for water-filling allocation.
             request_warm_up_for_reshard: Number of warm-up requests to detect truncation.
             heartbeat_timeout: Time in seconds to consider node heartbeat stale.
+            rtt_change_threshold: Relative RTT change that invalidates cached routes.
         """
         self.model_info = model_info
         self.num_layers = model_info.num_layers
@@ -78,8 +80,13 @@ class Scheduler:
             DynamicProgrammingRouting() if routing_strategy == "dp" else RoundRobinPipelineRouting()
         )
         self.request_warm_up_for_reshard = request_warm_up_for_reshard
+        self.rtt_change_threshold = rtt_change_threshold
+        # RTTs each node had when routes were last invalidated
+        self._routed_rtts: Dict[str, Dict[str, float]] = {}
 
         self._request_queue: "queue.Queue[RequestSignal]" = queue.Queue()
+        # Requests waiting for pipeline capacity, in arrival order (dispatcher thread only)
+        self._admission_queue: Deque[RequestSignal] = deque()
         self.request_arrival_horizon_sec = request_arrival_horizon_sec
         self.heartbeat_timeout = heartbeat_timeout
         self._arrival_ts: Deque[float] = deque()
@@ -92,6 +99,8 @@ class Scheduler:
         # Concurrency controls
         self._stop_event: threading.Event = threading.Event()
         self._wake_event: threading.Event = threading.Event()
+        # Set when node updates may have freed capacity for queued requests
+        self._capacity_event: threading.Event = threading.Event()
         self._node_count_cv: threading.Condition = threading.Condition()
         self._event_thread: Optional[threading.Thread] = None
         self._dispatch_thread: Optional[threading.Thread] = None
@@ -238,12 +247,19 @@ class Scheduler:
     ) -> None:
         """Update the info of a node."""
         if current_requests is not None:
+            if current_requests < node.current_requests:
+                self._capacity_event.set()
             node.current_requests = current_requests
         if layer_latency_ms is not None:
             node.set_layer_latency_ms(layer_latency_ms)
         if new_rtt_to_nodes is not None:
             node.rtt_to_nodes = new_rtt_to_nodes
+            if self._rtts_changed(self._routed_rtts.get(node.node_id), new_rtt_to_nodes):
+                self._routed_rtts[node.node_id] = dict(new_rtt_to_nodes)
+                self.request_router.invalidate()
         if is_active is not None:
+            if is_active and not node.is_active:
+                self._capacity_event.set()
             node.is_active = is_active
         node.last_heartbeat = time.time()
         # logger.debug(
@@ -254,6 +270,15 @@ class Scheduler:
         #     0 if new_rtt_to_nodes is None else len(new_rtt_to_nodes),
         # )
 
+    def _rtts_changed(self, old: Optional[Dict[str, float]], new: Dict[str, float]) -> bool:
+        """Whether RTTs moved enough since routes were cached to re-route."""
+        if old is None or old.keys() != new.keys():
+            return True
+        return any(
+            abs(new[peer] - rtt) > self.rtt_change_threshold * max(rtt, 1.0)
+            for peer, rtt in old.items()
+        )
+
     # Async-style event enqueuers for main loop
     def enqueue_join(self, node: Node) -> None:
         """Enqueue a join event."""
@@ -378,6 +403,10 @@ class Scheduler:
         with self._node_count_cv:
             self._node_count_cv.notify_all()
 
+    def is_bootstrapped(self) -> bool:
+        """Whether a full pipeline is allocated, so dispatched requests can be routed."""
+        return self._bootstrapped_event.is_set()
+
     def receive_request(self, request: RequestSignal) -> None:
         """Add a request to the wait pool."""
         self._request_queue.put(request)
@@ -393,23 +422,24 @@ class Scheduler:
             self._arrival_ts.popleft()
 
     def dispatch_next_request(self) -> Optional[Tuple[str, List[str], float]]:
-        """Route the next request in the wait pool; returns (request_id, path, latency)."""
-        try:
-            req = self._request_queue.get_nowait()
-        except queue.Empty:
-            req = None
-        if req is None:
+        """Route the oldest waiting request; returns (request_id, path, latency).
+
+        Returns None when no request is waiting or every pipeline is full. A request
+        that finds every pipeline full stays at the head of the admission queue.
+        """
+        self._drain_request_queue()
+        while self._admission_queue and self._admission_queue[0].routed.cancelled():
+            # The caller stopped waiting
+            self._admission_queue.popleft()
+        if not self._admission_queue:
             return None
+        req = self._admission_queue[0]
         path, latency = self.request_router.find_optimal_path(self.nodes, self.num_layers)
-        req.routing_table = path
-        # Update simple load counters
-        for node_id in path:
-            n = self.node_id_to_node[node_id]
-            if n is not None:
-                self._node_assigned_request_count[node_id] = (
-                    self._node_assigned_request_count.get(node_id, 0) + 1
-                )
-                n.add_request()
+        if not path:
+            return None
+        self._admission_queue.popleft()
+        if req.resolve(path):
+            self._assign_path(path)
         logger.debug(
             "Dispatched request %s via path %s (est_lat=%.2fms)", req.request_id, path, latency
         )
@@ -510,27 +540,56 @@ class Scheduler:
             self._wake_event.clear()
 
     def _dispatch_loop(self, poll_interval: float) -> None:
-        """Continuously dispatch incoming requests while running."""
+        """Continuously dispatch incoming requests while running.
+
+        Requests are admitted in arrival order. When every pipeline is full they stay in
+        the admission queue and are retried as soon as node updates report freed
+        capacity (or after `poll_interval` at the latest), instead of being bounced back
+        to the caller with an empty routing table.
+        """
         while not self._stop_event.is_set():
-            try:
-                req = self._request_queue.get(timeout=poll_interval)
-                if req is None:
+            if self._admission_queue:
+                self._capacity_event.wait(timeout=poll_interval)
+                self._capacity_event.clear()
+            else:
+                try:
+                    req = self._request_queue.get(timeout=poll_interval)
+                except queue.Empty:
                     continue
-                path, path_rtt = self.request_router.find_optimal_path(self.nodes, self.num_layers)
-                logger.debug(f"Path RTT: {path_rtt}")
-                req.routing_table = path
-                for node_id in path:
-                    n = self.node_id_to_node[node_id]
-                    if n is not None:
-                        self._node_assigned_request_count[node_id] = (
-                            self._node_assigned_request_count.get(node_id, 0) + 1
-                        )
-                        n.add_request()
-                logger.debug(
-                    "Dispatched request %s via path %s", getattr(req, "request_id", "?"), path
-                )
+                if req is not None:
+                    self._admission_queue.append(req)
+            self._drain_request_queue()
+            self._admit_requests()
+
+        # Nothing will route the remaining requests; report them as rejected
+        self._drain_request_queue()
+        while self._admission_queue:
+            self._admission_queue.popleft().resolve([])
+
+    def _drain_request_queue(self) -> None:
+        """Move newly received requests to the back of the admission queue."""
+        while True:
+            try:
+                req = self._request_queue.get_nowait()
             except queue.Empty:
-                continue
+                return
+            if req is not None:
+                self._admission_queue.append(req)
+
+    def _admit_requests(self) -> None:
+        """Route queued requests in order until one finds every pipeline full."""
+        while self.dispatch_next_request() is not None:
+            pass
+
+    def _assign_path(self, path: List[str]) -> None:
+        """Count a routed request against the load of every node on its path."""
+        for node_id in path:
+            n = self.node_id_to_node[node_id]
+            if n is not None:
+                self._node_assigned_request_count[node_id] = (
+                    self._node_assigned_request_count.get(node_id, 0) + 1
+                )
+                n.add_request()
 
     def _wait_for_bootstrap(self, poll_interval: float) -> bool:
         """Wait until enough nodes then run bootstrap. Returns False if stopped."""
@@ -581,6 +640,8 @@ class Scheduler:
             joined_any = True
             if node.manual_layer_assignment:
                 had_manual_assignment = True
+        if joined_any:
+            self._capacity_event.set()
 
         # If we are not bootstrapped (e.g., after a leave-triggered rebalance) and
         # new nodes just joined, attempt a greedy bootstrap immediately when we have
@@ -617,11 +678,14 @@ class Scheduler:
                 self.leave(node_id)
             except Exception as exc:
                 logger.warning(f"Leave failed for {node_id}: {exc}")
+            # Leaves may rebalance the remaining nodes into new pipelines
+            self._capacity_event.set()
 
     def stop(self) -> None:
         """Signal background threads to stop and wake any waiters."""
         self._stop_event.set()
         self._wake_event.set()
+        self._capacity_event.set()
         with self._node_count_cv:
             self._node_count_cv.notify_all()
 
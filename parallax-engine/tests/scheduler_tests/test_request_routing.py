@@ -281,3 +281,82 @@ def test_round_robin_pipeline_discovery_overlapping_heads_and_tails():
     )
     has_expected2 = any(matches_path(r, expected2) for r in ranges)
     assert has_expected1 and has_expected2
+
+
+def test_optimal_path_caches_shard_graph():
+    """Cached RTTs are reused until invalidated; load and allocation changes apply at once."""
+    num_layers = 12
+    model = build_model(num_layers)
+    n1 = build_node("n1", model, tflops=200.0, x=0.0, y=0.0)
+    n2 = build_node("n2", model, tflops=200.0, x=1.0, y=0.0)
+    n3 = build_node("n3", model, tflops=200.0, x=2.0, y=0.0)
+    n1.set_layer_allocation(0, 6)
+    n2.set_layer_allocation(6, num_layers)
+    n3.set_layer_allocation(6, num_layers)
+    set_rtt_from_coords([n1, n2, n3])
+    nodes = [n1, n2, n3]
+
+    router = DynamicProgrammingRouting()
+    assert router.find_optimal_path(nodes, num_layers)[0] == ["n1", "n2"]
+
+    # Load is re-evaluated on every call
+    for _ in range(n2.max_requests):
+        n2.add_request()
+    assert router.find_optimal_path(nodes, num_layers)[0] == ["n1", "n3"]
+    n2.current_requests = 0
+
+    # RTT changes only apply after invalidate()
+    n1.rtt_to_nodes["n2"] = 1e6
+    assert router.find_optimal_path(nodes, num_layers)[0] == ["n1", "n2"]
+    router.invalidate()
+    assert router.find_optimal_path(nodes, num_layers)[0] == ["n1", "n3"]
+
+    # Allocation changes rebuild the graph
+    n3.set_layer_allocation(0, num_layers)
+    node_ids, latency = router.find_optimal_path(nodes, num_layers)
+    assert node_ids == ["n3"]
+    assert latency == pytest.approx(float(n3.layer_latency_ms), rel=1e-6)
+
+
+def test_graph_built_across_invalidate_is_not_cached():
+    """A graph built while invalidate() runs is used once but not stored."""
+    num_layers = 12
+    model = build_model(num_layers)
+    n1 = build_node("n1", model, tflops=200.0, x=0.0, y=0.0)
+    n2 = build_node("n2", model, tflops=200.0, x=1.0, y=0.0)
+    n1.set_layer_allocation(0, 6)
+    n2.set_layer_allocation(6, num_layers)
+    set_rtt_from_coords([n1, n2])
+
+    router = DynamicProgrammingRouting()
+    build = router._build_shard_graph
+
+    def build_then_invalidate(nodes, layers):
+        graph = build(nodes, layers)
+        router.invalidate()
+        return graph
+
+    router._build_shard_graph = build_then_invalidate
+    assert router.find_optimal_path([n1, n2], num_layers)[0] == ["n1", "n2"]
+    assert router._graph is None
+
+    router._build_shard_graph = build
+    assert router.find_optimal_path([n1, n2], num_layers)[0] == ["n1", "n2"]
+    assert router._graph is not None
+
+
+def test_node_costs_follow_allocation_and_load():
+    """Cached node cost terms track allocation and load changes."""
+    model = build_model(12)
+    n = build_node("n", model, tflops=200.0, x=0.0, y=0.0)
+    n._force_max_concurrent_requests = False
+    n.max_concurrent_requests = None
+    n.set_layer_allocation(0, 6)
+    half_max = n.max_requests
+
+    n.set_layer_allocation(0, 12)
+    assert n.max_requests < half_max
+
+    idle = n.roofline_layer_latency_ms()
+    n.current_requests = 8
+    assert n.roofline_layer_latency_ms() > idle
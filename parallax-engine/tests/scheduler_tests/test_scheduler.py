@@ -4,6 +4,8 @@ Minimal tests for the Scheduler orchestrator.
 
 from __future__ import annotations
 
+import threading
+
 from scheduling.node import RequestSignal
 from scheduling.scheduler import Scheduler
 
@@ -239,3 +241,90 @@ def test_scheduler_three_nodes_sequential_join_leave_rejoin():
     # Verify full pipeline coverage
     total_covered = sum(e - s for _, s, e in allocations)
     assert total_covered >= model.num_layers, "All layers should be covered"
+
+
+def test_int8_kv_cache_raises_node_max_requests():
+    """Nodes reporting an int8 KV cache fit roughly twice as many requests."""
+    model = build_model_info(12)
+    limits = {}
+    for kv_cache_dtype in ("auto", "int8"):
+        node = build_node("mac-0", model, mem_gb=16.0)
+        node._force_max_concurrent_requests = False
+        node.max_concurrent_requests = None
+        node.kv_cache_dtype = kv_cache_dtype
+        node.start_layer, node.end_layer = 0, 12
+        limits[kv_cache_dtype] = node.max_requests
+    assert isinstance(limits["int8"], int)
+    assert 1.8 * limits["auto"] <= limits["int8"] <= 2 * limits["auto"]
+
+
+def test_only_significant_rtt_updates_invalidate_routes():
+    """Small RTT jitter keeps the cached routing graph; large changes drop it."""
+    model = build_model_info(12)
+    n1 = build_node("n1", model, tflops=312.0, mem_gb=80.0, x=0, y=0)
+    n2 = build_node("n2", model, tflops=312.0, mem_gb=80.0, x=1, y=0)
+    set_rtt_from_coords([n1, n2])
+    sched = Scheduler(model, [n1, n2], strategy="greedy", routing_strategy="dp")
+    sched.layer_allocator.global_allocation()
+
+    rtt = n1.rtt_to_nodes["n2"]
+    sched.update_node_info(n2, is_active=True)
+    sched.update_node_info(n1, new_rtt_to_nodes={"n2": rtt}, is_active=True)
+    assert sched.request_router.find_optimal_path(sched.nodes, sched.num_layers)[0]
+    assert sched.request_router._graph is not None
+
+    sched.update_node_info(n1, new_rtt_to_nodes={"n2": rtt * 1.05})
+    assert sched.request_router._graph is not None
+    sched.update_node_info(n1, new_rtt_to_nodes={"n2": rtt * 2 + 10})
+    assert sched.request_router._graph is None
+
+
+def test_full_pipelines_queue_requests_until_capacity_frees():
+    """Requests wait in the admission queue and are routed once node load drops."""
+    model = build_model_info(12)
+    n1 = build_node("n1", model, tflops=312.0, mem_gb=80.0, x=0, y=0)
+    set_rtt_from_coords([n1])
+    sched = Scheduler(model, [n1], strategy="greedy", min_nodes_bootstrapping=1)
+    sched.layer_allocator.global_allocation()
+    sched.update_node_info(n1, current_requests=n1.max_requests, is_active=True)
+
+    dispatcher = threading.Thread(target=sched._dispatch_loop, args=(0.01,), daemon=True)
+    dispatcher.start()
+    try:
+        withdrawn, waiting = RequestSignal("withdrawn"), RequestSignal("waiting")
+        sched.receive_request(withdrawn)
+        sched.receive_request(waiting)
+        assert not waiting.routed.done()
+        assert withdrawn.routed.cancel()
+
+        sched.update_node_info(n1, current_requests=0)
+        assert waiting.routed.result(timeout=5.0) == ["n1"]
+        assert waiting.routing_table == ["n1"]
+        assert withdrawn.routing_table is None
+        assert n1.current_requests == 1
+    finally:
+        sched.stop()
+        dispatcher.join(timeout=2.0)
+
+
+def test_dispatch_next_request_keeps_request_queued_while_full():
+    """A request that finds every pipeline full is not answered with an empty route."""
+    model = build_model_info(12)
+    n1 = build_node("n1", model, tflops=312.0, mem_gb=80.0, x=0, y=0)
+    set_rtt_from_coords([n1])
+    sched = Scheduler(model, [n1], strategy="greedy", min_nodes_bootstrapping=1)
+    sched.layer_allocator.global_allocation()
+    sched.update_node_info(n1, current_requests=n1.max_requests, is_active=True)
+
+    req = RequestSignal("req-1")
+    sched.receive_request(req)
+    assert sched.dispatch_next_request() is None
+    assert not req.routed.done()
+    assert req.routing_table is None
+
+    sched.update_node_info(n1, current_requests=0)
+    req_id, path, _ = sched.dispatch_next_request()
+    assert req_id == "req-1"
+    assert path == ["n1"]
+    assert req.routed.result(timeout=0) == ["n1"]
+    assert sched.dispatch_next_request() is None
@@ -0,0 +1,113 @@
+"""
+Tests for async scheduling in the executor run loop, using a fake single-node executor.
+"""
+
+from parallax.server.executor.base_executor import BaseExecutor
+from parallax.server.request import InitialRequest, RequestStatus
+
+EOS = 99
+
+
+class FakeTokenizer:
+    pad_token_id = 0
+    eos_token_id = EOS
+    chat_template = None
+
+
+class LazyTokens:
+    """Stands in for a lazily evaluated array of sampled tokens."""
+
+    def __init__(self, step: int, tokens: list):
+        self.step = step
+        self.tokens = tokens
+
+    def __getitem__(self, idx):
+        return LazyTokens(self.step, self.tokens[idx])
+
+
+class FakeExecutor(BaseExecutor):
+    """Single-node executor whose model samples `token + 1`, or EOS after `eos_on`."""
+
+    def __init__(self, eos_on: int = None):
+        self.config = {"num_hidden_layers": 2, "eos_token_id": EOS}
+        self.tokenizer = FakeTokenizer()
+        self.kv_cache_manager = None
+        self.eos_on = eos_on
+        self.num_steps = 0
+        self.events = []
+        super().__init__(
+            start_layer=0,
+            end_layer=2,
+            device="mlx",
+            scheduler_wait_ms=0,
+            enable_async_scheduling=True,
+        )
+
+    def handle_input_requests(self, requests):
+        for req in requests:
+            if isinstance(req, InitialRequest):
+                self.scheduler.enque_request(req)
+                continue
+            original_req = self.scheduler.get_running_request(req.request_id)
+            original_req.commit_new_token(req.next_token_id)
+            if self.scheduler.check_and_update_request_status(original_req):
+                self._should_stop = self.scheduler.num_running_requests == 0
+            else:
+                self.scheduler.enque_request(original_req)
+
+    def _prepare_prefill_batch(self, batched_requests):
+        if not batched_requests:
+            return None
+        return {"requests": batched_requests, "tokens": [r.input_ids[-1] for r in batched_requests]}
+
+    def _prepare_decode_batch(self, batched_requests):
+        if not batched_requests:
+            return None
+        tokens = [
+            r.lookahead_token.tokens[0] if r.lookahead_token is not None else r.output_ids[-1]
+            for r in batched_requests
+        ]
+        return {"requests": batched_requests, "tokens": tokens}
+
+    def process_batch(self, prepared_inputs, return_decoded_tokens=True):
+        self.num_steps += 1
+        self.events.append(("launch", self.num_steps))
+        if self.num_steps > 20:
+            self._should_stop = True
+        tokens = [EOS if t == self.eos_on else t + 1 for t in prepared_inputs["tokens"]]
+        return LazyTokens(self.num_steps, tokens)
+
+    def _gen_token_id_from_hidden(self, hidden_states):
+        self.events.append(("resolve", hidden_states.step))
+        return hidden_states.tokens[0], hidden_states.tokens
+
+    def _release_request(self, rid):
+        pass
+
+
+def test_decode_step_launches_before_previous_step_resolves():
+    executor = FakeExecutor()
+    req = InitialRequest(request_id="r", input_ids=[10], max_new_tokens=4, max_total_length=64)
+    executor.scheduler.enque_request(req)
+    executor.run_loop()
+
+    assert req.output_ids == [11, 12, 13, 14]
+    assert req.status == RequestStatus.FINISHED_MAX_LENGTH
+    # Step 1 is the prefill; each decode step N+1 runs on step N's unresolved token
+    events = executor.events
+    for step in (2, 3):
+        assert events.index(("launch", step + 1)) < events.index(("resolve", step))
+    # The length limit is known ahead, so no step is wasted
+    assert executor.num_steps == 4
+
+
+def test_step_scheduled_ahead_of_eos_is_dropped():
+    executor = FakeExecutor(eos_on=12)
+    req = InitialRequest(request_id="r", input_ids=[10], max_new_tokens=16, max_total_length=64)
+    executor.scheduler.enque_request(req)
+    executor.run_loop()
+
+    assert req.output_ids == [11, 12, EOS]
+    assert req.status == RequestStatus.FINISHED_EOS
+    # One step already ran past EOS; its output was dropped
+    assert executor.num_steps == 4
@@ -1,4 +1,14 @@
-from parallax.server.request import InitialRequest, Request, RequestStatus
+import time
+
+import mlx.core as mx
+
+from parallax.server.paged_kv_cache import PagedKVCacheManager
+from parallax.server.request import (
+    InitialRequest,
+    IntermediateRequest,
+    Request,
+    RequestStatus,
+)
 from parallax.server.scheduler import Scheduler
 
 
@@ -6,17 +16,35 @@ class FakeKVCacheManager:
     def __init__(self, allow: bool = True):
         self.allow = allow
         self._reqs = set()
+        # Decode slots left before append_slot runs out of blocks (None: unlimited)
+        self.free_slots = None
 
     def has_request(self, request_id: str) -> bool:
         return request_id in self._reqs
 
-    def allocate_request(self, request_id: str, num_tokens: int) -> bool:
+    def allocate_request(self, request_id: str, num_tokens: int, **kwargs) -> bool:
         """PagedKV interface."""
         if not self.allow:
             return False
         self._reqs.add(request_id)
         return True
 
+    def get_num_cached_tokens(self, request_id: str) -> int:
+        return 0
+
+    def append_slot(self, request_id: str) -> bool:
+        if self.free_slots is None:
+            return True
+        if self.free_slots == 0:
+            return False
+        self.free_slots -= 1
+        return True
+
+    def release_request(self, request_id: str):
+        self._reqs.discard(request_id)
+        if self.free_slots is not None:
+            self.free_slots += 1
+
 
 def make_prefill(rid: str, prompt_len: int) -> InitialRequest:
     return InitialRequest(request_id=rid, input_ids=[0] * prompt_len)
@@ -106,3 +134,222 @@ def test_kv_cache_admission_guard_blocks_prefill():
     batch = sched.form_batch()
     assert len(batch) == 0
     assert sched.num_running_requests == 0
+    # The request stays queued until blocks free up
+    assert sched.num_queued_requests == 1
+    kv_mgr.allow = True
+    assert sched.form_batch() == [p]
+
+
+def test_next_wakeup_bounded_by_wait_ms_and_timeouts():
+    sched = Scheduler(max_batch_size=2, scheduler_wait_ms=500, request_timeout_s=600)
+    # Nothing running: block for the full wait window
+    assert sched.next_wakeup_ms() == 500
+
+    # A running request close to its timeout shortens the wait
+    d = make_decode("d", ready=False)
+    d.last_updated_time = time.time() - 599.9
+    sched._running_requests[d.request_id] = d
+    assert 0 < sched.next_wakeup_ms() <= 100
+
+    # Already overdue requests never produce a negative timeout
+    d.last_updated_time = time.time() - 700
+    assert sched.next_wakeup_ms() == 0
+
+
+def test_chunked_prefill_splits_prompt_and_keeps_decodes():
+    sched = Scheduler(
+        max_batch_size=4,
+        max_num_tokens_per_batch=8,
+        micro_batch_ratio=1,
+        is_first_peer=True,
+        enable_chunked_prefill=True,
+        kv_cache_manager=FakeKVCacheManager(),
+    )
+    d1 = make_decode("d1")
+    d2 = make_decode("d2")
+    sched._running_requests[d1.request_id] = d1
+    sched._running_requests[d2.request_id] = d2
+    p1 = make_prefill("p1", 20)
+    sched.enque_request(p1)
+
+    # Two tokens of the budget are kept for the ready decodes
+    batch = sched.form_batch()
+    assert [r.request_id for r in batch] == ["p1", "d1", "d2"]
+    assert p1.prefill_chunk_len == 6
+    assert p1.prefill_chunk_end == 6
+    assert p1.is_partial_prefill
+
+    # The chunk acknowledgement re-enters the running request, not the wait queue
+    p1.num_computed_tokens = p1.prefill_chunk_end
+    p1.prefill_chunk_len = None
+    sched.enque_request(p1)
+    assert sched.num_queued_requests == 0
+
+    batch = sched.form_batch()
+    assert [r.request_id for r in batch] == ["p1"]
+    assert p1.prefill_chunk_end == 14
+
+    # The last chunk covers the rest of the prompt
+    p1.num_computed_tokens = p1.prefill_chunk_end
+    sched.enque_request(p1)
+    sched.form_batch()
+    assert p1.prefill_chunk_end == 20
+    assert not p1.is_partial_prefill
+
+
+def make_running_decode(sched: Scheduler, rid: str, arrival_time: float) -> InitialRequest:
+    r = InitialRequest(
+        request_id=rid, input_ids=[0] * 4, output_ids=[1, 2], status=RequestStatus.DECODING
+    )
+    r.arrival_time = arrival_time
+    r.ready_for_next_step = True
+    sched.kv_cache_manager.allocate_request(rid, r.total_length)
+    sched._running_requests[rid] = r
+    return r
+
+
+def test_decode_oom_preempts_latest_arrival_for_recompute():
+    kv = FakeKVCacheManager()
+    sched = Scheduler(
+        max_batch_size=4,
+        max_num_tokens_per_batch=100,
+        micro_batch_ratio=1,
+        is_first_peer=True,
+        kv_cache_manager=kv,
+    )
+    old = make_running_decode(sched, "old", arrival_time=1.0)
+    new = make_running_decode(sched, "new", arrival_time=2.0)
+    kv.free_slots = 0
+
+    batch = sched.form_batch()
+    assert [r.request_id for r in batch] == ["old"]
+    assert sched.get_running_request("new") is None
+    assert not kv.has_request("new")
+    assert sched.pop_preempted_requests() == [new]
+    assert sched.pop_preempted_requests() == []
+
+    # The preempted request recomputes its prompt and generated tokens first
+    assert new.is_prefill
+    assert new.prefill_token_ids == [0, 0, 0, 0, 1, 2]
+    batch = sched.form_batch()
+    assert [r.request_id for r in batch] == ["new"]
+    assert kv.has_request("new")
+    assert old.is_decoding
+
+
+def test_decode_oom_preempts_itself_when_lowest_priority():
+    kv = FakeKVCacheManager()
+    sched = Scheduler(
+        max_batch_size=4,
+        max_num_tokens_per_batch=100,
+        micro_batch_ratio=1,
+        is_first_peer=True,
+        kv_cache_manager=kv,
+    )
+    only = make_running_decode(sched, "only", arrival_time=1.0)
+    kv.free_slots = 0
+    kv.allow = False
+
+    assert sched.form_batch() == []
+    assert sched.pop_preempted_requests() == [only]
+    assert sched.num_queued_requests == 1
+
+
+def test_decode_oom_is_deferred_on_later_peers():
+    kv = FakeKVCacheManager()
+    sched = Scheduler(
+        max_batch_size=4, max_num_tokens_per_batch=100, micro_batch_ratio=1, kv_cache_manager=kv
+    )
+    d1 = make_decode("d1")
+    kv.allocate_request("d1", 4)
+    sched._running_requests["d1"] = d1
+    kv.free_slots = 0
+
+    assert sched.form_batch() == []
+    assert d1.ready_for_next_step
+    assert sched.pop_preempted_requests() == []
+
+    kv.free_slots = 1
+    assert sched.form_batch() == [d1]
+
+
+def test_schedule_ahead_readies_in_flight_decode_once():
+    sched = Scheduler(
+        max_batch_size=4,
+        max_num_tokens_per_batch=100,
+        micro_batch_ratio=1,
+        is_first_peer=True,
+        kv_cache_manager=FakeKVCacheManager(),
+    )
+    r = make_running_decode(sched, "r", arrival_time=1.0)
+    assert sched.form_batch() == [r]
+
+    # Step N is in flight; step N+1 is formed with its lazily sampled token
+    sched.schedule_ahead(r, token=[7])
+    assert r.lookahead_token == [7]
+    assert sched.form_batch() == [r]
+
+    # Committing step N's token must not schedule the request a second time
+    r.commit_new_token(7)
+    sched.enque_request(r)
+    assert r.lookahead_token is None
+    assert sched.form_batch() == []
+
+    # Requests that left the running set are not scheduled ahead
+    sched.evict_request("r")
+    sched.schedule_ahead(r, token=[8])
+    assert r.lookahead_token is None
+
+
+def make_prefix_cache(cached_tokens: list) -> PagedKVCacheManager:
+    mgr = PagedKVCacheManager(
+        num_layers=1,
+        num_kv_heads=1,
+        head_dim=4,
+        dtype=mx.float16,
+        block_size=4,
+        num_gpu_blocks=64,
+        enable_prefix_caching=True,
+    )
+    if cached_tokens:
+        mgr.allocate_request("warm", len(cached_tokens), token_ids=cached_tokens)
+        mgr.cache_prefix("warm", cached_tokens)
+        mgr.release_request("warm")
+    return mgr
+
+
+def test_pipeline_peers_with_different_cached_prefixes_admit_prefill():
+    tokens = list(range(12))
+    # The first peer still caches 8 prompt tokens, the next peer already evicted half
+    first_kv, next_kv = make_prefix_cache(tokens[:8]), make_prefix_cache(tokens[:4])
+    first = Scheduler(
+        max_batch_size=2,
+        max_num_tokens_per_batch=100,
+        is_first_peer=True,
+        kv_cache_manager=first_kv,
+    )
+    downstream = Scheduler(max_batch_size=2, max_num_tokens_per_batch=100, kv_cache_manager=next_kv)
+
+    req = InitialRequest(request_id="r", input_ids=tokens)
+    first.enque_request(req)
+    assert first.form_batch() == [req]
+    # No cached prefix is skipped, so the next peer gets hidden states for the whole prompt
+    assert req.num_computed_tokens == 0
+
+    forwarded = IntermediateRequest.from_initial_request(req, hidden_states=mx.zeros((12, 4)))
+    downstream.enque_request(forwarded)
+    assert downstream.form_batch() == [forwarded]
+    assert next_kv.has_request("r")
+
+    # A single node still serves the prompt from its own prefix cache
+    single = Scheduler(
+        max_batch_size=2,
+        max_num_tokens_per_batch=100,
+        is_first_peer=True,
+        is_last_peer=True,
+        kv_cache_manager=make_prefix_cache(tokens[:8]),
+    )
+    req = InitialRequest(request_id="s", input_ids=tokens)
+    single.enque_request(req)
+    assert single.form_batch() == [req]
+    assert req.num_computed_tokens == 8
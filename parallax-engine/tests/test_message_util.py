@@ -9,12 +9,19 @@ import pytest
 from parallax.p2p.message_util import (
     abort_request_to_proto,
     bytes_to_tensor,
+    encode_hidden_states,
+    merge_forward_requests,
+    pack_hidden_states,
+    parse_activation_transport,
     proto_to_abort_request,
     proto_to_request,
     proto_to_sampling_params,
+    request_to_frames,
     request_to_proto,
     sampling_params_to_proto,
+    slice_hidden_states,
     tensor_to_bytes,
+    unpack_hidden_states,
 )
 from parallax.p2p.proto import forward_pb2
 from parallax.server.request import IntermediateRequest, Request, RequestStatus
@@ -62,7 +69,7 @@ class TestMessageUtil:
         assert list(proto_req.routing_table) == ["layer1", "layer2"]
 
         # Verify hidden_states
-        deserialized_hs = bytes_to_tensor(proto_req.hidden_states)
+        deserialized_hs = unpack_hidden_states(forward_request.hidden_states)[0]
         np.testing.assert_array_equal(
             np.array(deserialized_hs.tolist()), np.array(hidden_states.tolist())
         )
@@ -90,7 +97,7 @@ class TestMessageUtil:
         proto_req = forward_request.reqs[0]
         assert proto_req.rid == self.request_id
         assert proto_req.next_token_id == 42
-        assert proto_req.hidden_states  # hidden_states should be serialized
+        assert forward_request.hidden_states  # hidden_states should be serialized
 
     def test_proto_to_request_conversion(self):
         """Test the round-trip conversion from request to proto and back."""
@@ -175,6 +182,121 @@ class TestMessageUtil:
             np.array(deserialized_reqs[1].hidden_states.tolist()), np.array([[2.0]])
         )
 
+    def test_hidden_states_frame(self):
+        """Test sending hidden states as a separate raw frame."""
+        requests = [
+            IntermediateRequest(
+                request_id=f"req{i}",
+                input_ids=[1, 2, 3],
+                current_position=3,
+                status=RequestStatus.PREFILLING,
+                hidden_states=hidden_states,
+                lora_path=None,
+            )
+            for i, hidden_states in enumerate(
+                [
+                    mx.arange(12, dtype=mx.bfloat16).reshape(3, 4),
+                    mx.arange(8, dtype=mx.bfloat16).reshape(2, 4),
+                ]
+            )
+        ]
+
+        forward_request, frame = request_to_frames(requests)
+        assert not forward_request.hidden_states
+        assert all(not proto_req.hidden_states for proto_req in forward_request.reqs)
+
+        converted = proto_to_request(forward_request, hidden_states=frame)
+        for request, original in zip(converted, requests):
+            assert request.status == RequestStatus.PREFILLING
+            assert request.hidden_states.dtype == mx.bfloat16
+            assert mx.array_equal(request.hidden_states, original.hidden_states).item()
+        # One of the three prompt tokens was skipped by the sender's prefix cache
+        assert converted[1].num_computed_tokens == 1
+
+        sliced = unpack_hidden_states(slice_hidden_states(frame, [1]))
+        assert list(sliced) == [0]
+        assert mx.array_equal(sliced[0], requests[1].hidden_states).item()
+
+        # Requests without hidden states are left out; non-contiguous tensors are packed
+        transposed = mx.arange(6, dtype=mx.float32).reshape(2, 3).T
+        frame = pack_hidden_states([None, transposed])
+        unpacked = unpack_hidden_states(frame)
+        assert list(unpacked) == [1]
+        assert mx.array_equal(unpacked[1], transposed).item()
+        assert slice_hidden_states(frame, [0]) is None
+        assert pack_hidden_states([None, None]) is None
+
+    @pytest.mark.parametrize("transport", ["none", "lz4", "zstd", "int8"])
+    def test_activation_transport_round_trip(self, transport):
+        """Test encoded hidden states round trip, within int8 error for the lossy mode."""
+        if transport == "lz4":
+            pytest.importorskip("lz4")
+        elif transport == "zstd":
+            pytest.importorskip("zstandard")
+
+        mx.random.seed(0)
+        hidden_states = (mx.random.normal((6, 64)) * 4).astype(mx.bfloat16)
+        token_ids = mx.array([7, 11], dtype=mx.int32)
+        frame = pack_hidden_states([hidden_states, None, token_ids])
+
+        encoded = encode_hidden_states(frame, transport)
+        decoded = unpack_hidden_states(slice_hidden_states(encoded, [0, 2]))
+        assert decoded[0].dtype == mx.bfloat16
+        assert decoded[0].shape == hidden_states.shape
+        # Token ids are never quantized
+        assert mx.array_equal(decoded[1], token_ids).item()
+
+        if transport == "int8":
+            assert len(encoded) < 0.6 * len(frame)
+            error = mx.abs(decoded[0].astype(mx.float32) - hidden_states.astype(mx.float32))
+            # Half a quantization step per token, plus bfloat16 rounding of the result
+            step = mx.max(mx.abs(hidden_states.astype(mx.float32)), axis=-1, keepdims=True) / 127
+            assert mx.all(error <= 0.5 * step + 2**-7 * mx.abs(hidden_states)).item()
+        else:
+            assert mx.array_equal(decoded[0], hidden_states).item()
+
+    def test_merge_forward_requests(self):
+        """Test coalescing queued forward requests into one."""
+        first = forward_pb2.ForwardRequest(forward_mode=forward_pb2.ForwardMode.DECODE)
+        first.reqs.add(rid="a")
+        first.reqs.add(rid="b")
+        first.hidden_states = encode_hidden_states(
+            pack_hidden_states([None, mx.ones((1, 4), dtype=mx.float16)]), "int8"
+        )
+        second = forward_pb2.ForwardRequest(forward_mode=forward_pb2.ForwardMode.DECODE)
+        second.reqs.add(rid="c")
+        second.hidden_states = pack_hidden_states([mx.zeros((1, 4), dtype=mx.float16)])
+
+        assert merge_forward_requests([second]) is second
+        merged = merge_forward_requests([first, second])
+        assert [req.rid for req in merged.reqs] == ["a", "b", "c"]
+        hidden_states = unpack_hidden_states(merged.hidden_states)
+        assert list(hidden_states) == [1, 2]
+        assert hidden_states[1].tolist() == [[1.0] * 4]
+        assert hidden_states[2].tolist() == [[0.0] * 4]
+
+    def test_parse_activation_transport(self):
+        """Test per-route activation transport selection."""
+        assert parse_activation_transport([]) == {None: "none"}
+        assert parse_activation_transport(["zstd", "peerA=int8"]) == {
+            None: "zstd",
+            "peerA": "int8",
+        }
+        with pytest.raises(ValueError, match="Unknown activation transport"):
+            parse_activation_transport(["peerA=fp8"])
+
+    def test_legacy_per_request_hidden_states(self):
+        """Test decoding per-request safetensors payloads from older senders."""
+        forward_request = forward_pb2.ForwardRequest()
+        forward_request.forward_mode = forward_pb2.ForwardMode.DECODE
+        proto_req = forward_request.reqs.add()
+        proto_req.rid = "legacy"
+        proto_req.hidden_states = tensor_to_bytes(mx.array([[1.0, 2.0]], dtype=mx.float16))
+
+        converted = proto_to_request(forward_request)
+        assert converted[0].status == RequestStatus.DECODING
+        assert converted[0].hidden_states.tolist() == [[1.0, 2.0]]
+
     @pytest.mark.parametrize(
         "dtype,shape",
         [
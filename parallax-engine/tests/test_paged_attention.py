@@ -5,7 +5,15 @@ import mlx.core as mx
 import numpy as np
 import pytest
 
-from parallax.metal.paged_attention.kernel import paged_attention, reshape_and_cache
+from parallax.metal.paged_attention import mlx_backend
+from parallax.metal.paged_attention.kernel import (
+    gather_kv_cache,
+    paged_attention,
+    paged_attention_metal,
+    reshape_and_cache,
+)
+from parallax.server.paged_kv_cache import PagedKVCacheManager
+from parallax.utils.utils import create_prefix_causal_mask
 
 
 def ref_masked_attention(q, k, v, scale):
@@ -379,5 +387,246 @@ class TestPagedAttention:
         print(f"Paged Attention: {paged_time:.3f} ms")
 
 
+def _random_paged_setup(batch_size, num_heads, num_kv_heads, head_dim, block_size, context_lens):
+    blocks_per_seq = max((l + block_size - 1) // block_size for l in context_lens)
+    num_blocks = batch_size * blocks_per_seq
+    key_cache = mx.random.normal((1, num_blocks, num_kv_heads, block_size, head_dim))
+    value_cache = mx.random.normal((1, num_blocks, num_kv_heads, block_size, head_dim))
+    block_tables = mx.array(
+        np.random.permutation(num_blocks).astype(np.int32).reshape(batch_size, blocks_per_seq)
+    )
+    queries = mx.random.normal((batch_size, num_heads, 1, head_dim))
+    return queries, key_cache, value_cache, block_tables
+
+
+def _contiguous_kv(cache, block_tables, batch_idx, length):
+    """(num_kv_heads, length, dim) view of one sequence's cached tokens."""
+    blocks = cache[0][block_tables[batch_idx]]  # (max_blocks, heads, block_size, dim)
+    heads = blocks.shape[1]
+    return blocks.transpose(1, 0, 2, 3).reshape(heads, -1, blocks.shape[-1])[:, :length]
+
+
+@pytest.mark.parametrize("window_size", [0, 6])
+def test_mlx_backend_window_and_sinks(window_size):
+    """Sliding window + attention sinks (GPT-OSS) against a dense reference."""
+    batch_size, num_heads, num_kv_heads, head_dim, block_size = 2, 4, 2, 16, 8
+    context_lens = [13, 20]
+    scale = 1.0 / math.sqrt(head_dim)
+    q, key_cache, value_cache, block_tables = _random_paged_setup(
+        batch_size, num_heads, num_kv_heads, head_dim, block_size, context_lens
+    )
+    sinks = mx.random.normal((num_heads,))
+
+    out = mlx_backend.paged_attention(
+        q,
+        key_cache,
+        value_cache,
+        block_tables,
+        mx.array(context_lens, dtype=mx.int32),
+        block_size,
+        scale,
+        num_kv_heads,
+        0,
+        window_size=window_size,
+        sinks=sinks,
+    )
+
+    n_rep = num_heads // num_kv_heads
+    for b, length in enumerate(context_lens):
+        start = max(0, length - 1 - window_size) if window_size > 0 else 0
+        k = mx.repeat(_contiguous_kv(key_cache, block_tables, b, length), n_rep, axis=0)
+        v = mx.repeat(_contiguous_kv(value_cache, block_tables, b, length), n_rep, axis=0)
+        scores = (q[b, :, 0, None, :] @ k.swapaxes(-1, -2))[:, 0, start:] * scale
+        scores = mx.concatenate([sinks[:, None], scores], axis=-1)
+        probs = mx.softmax(scores, axis=-1)[:, 1:]
+        ref = (probs[:, None, :] @ v[:, start:])[:, 0]
+        assert mx.allclose(out[b, :, 0], ref, atol=1e-4).item()
+
+
+def test_mlx_backend_top_k_selection():
+    """DeepSeek V3.2 style top-k token selection; a leading -1 attends to everything."""
+    batch_size, num_heads, num_kv_heads, head_dim, block_size = 2, 2, 1, 16, 4
+    context_lens = [10, 10]
+    scale = 1.0 / math.sqrt(head_dim)
+    q, key_cache, value_cache, block_tables = _random_paged_setup(
+        batch_size, num_heads, num_kv_heads, head_dim, block_size, context_lens
+    )
+    top_k = mx.array([[1, 4, 7], [-1, -1, -1]], dtype=mx.int32)
+
+    out = mlx_backend.paged_attention(
+        q,
+        key_cache,
+        value_cache,
+        block_tables,
+        mx.array(context_lens, dtype=mx.int32),
+        block_size,
+        scale,
+        num_kv_heads,
+        0,
+        top_k_indices=top_k,
+    )
+
+    for b, selected in enumerate([[1, 4, 7], list(range(context_lens[1]))]):
+        idx = mx.array(selected)
+        k = _contiguous_kv(key_cache, block_tables, b, context_lens[b])[:, idx]
+        v = _contiguous_kv(value_cache, block_tables, b, context_lens[b])[:, idx]
+        ref = ref_attention_large(q[b : b + 1], k[None], v[None], scale)[0]
+        assert mx.allclose(out[b, :, 0], ref, atol=1e-4).item()
+
+
+def test_prefill_with_cached_prefix_matches_full_prefill():
+    """A segment attending to its gathered prefix equals causal attention over the whole prompt."""
+    num_heads, num_kv_heads, head_dim, block_size = 4, 2, 16, 4
+    context_lens, prefix_lens = [10, 7], [8, 4]
+    scale = 1.0 / math.sqrt(head_dim)
+    mgr = PagedKVCacheManager(
+        num_layers=1,
+        num_kv_heads=num_kv_heads,
+        head_dim=head_dim,
+        dtype=mx.float32,
+        block_size=block_size,
+        num_gpu_blocks=16,
+    )
+    for b, length in enumerate(context_lens):
+        assert mgr.allocate_request(str(b), length)
+    block_tables_np = mgr.get_padded_block_tables(["0", "1"])
+    block_tables = mx.array(block_tables_np)
+
+    max_len = max(context_lens)
+    keys = mx.random.normal((2, max_len, num_kv_heads, head_dim))
+    values = mx.random.normal((2, max_len, num_kv_heads, head_dim))
+    queries = mx.random.normal((2, num_heads, max_len, head_dim))
+    key_cache, value_cache = mgr.get_cache()
+
+    # Write the cached prefix, then the segment after it
+    def write(starts, lengths):
+        seg_len = max(lengths)
+        seg = mx.array(np.arange(seg_len)[None, :] + np.array(starts)[:, None])
+        seg = mx.minimum(seg, max_len - 1)
+        batch_idx = mx.arange(2)[:, None]
+        slot_mapping = mgr.get_slot_mapping(block_tables_np, lengths, seg_len, prefix_lens=starts)
+        mlx_backend.reshape_and_cache(
+            keys[batch_idx, seg],
+            values[batch_idx, seg],
+            key_cache,
+            value_cache,
+            block_tables,
+            mx.array(context_lens, dtype=mx.int32),
+            block_size,
+            0,
+            slot_mapping=mx.array(slot_mapping),
+        )
+        return seg
+
+    write([0, 0], prefix_lens)
+    seg_lens = [c - p for c, p in zip(context_lens, prefix_lens)]
+    seg = write(prefix_lens, seg_lens)
+
+    cached_keys, cached_values = gather_kv_cache(key_cache, value_cache, block_tables, 0)
+    mask = create_prefix_causal_mask(
+        mx.array(prefix_lens, dtype=mx.int32),
+        mx.array(context_lens, dtype=mx.int32),
+        max(seg_lens),
+        cached_keys.shape[2],
+        mx.float32,
+    )
+    seg_queries = queries[mx.arange(2)[:, None], :, seg].transpose(0, 2, 1, 3)
+    out = mx.fast.scaled_dot_product_attention(
+        seg_queries, cached_keys, cached_values, scale=scale, mask=mask
+    )
+
+    for b, (length, prefix) in enumerate(zip(context_lens, prefix_lens)):
+        ref = mx.fast.scaled_dot_product_attention(
+            queries[b : b + 1, :, :length],
+            keys[b : b + 1, :length].transpose(0, 2, 1, 3),
+            values[b : b + 1, :length].transpose(0, 2, 1, 3),
+            scale=scale,
+            mask="causal",
+        )
+        assert mx.allclose(out[b, :, : length - prefix], ref[0, :, prefix:], atol=1e-4).item()
+
+
+def test_int8_kv_cache_matches_full_precision():
+    """Decode attention over an int8 cache stays close to the full-precision cache."""
+    num_heads, num_kv_heads, head_dim, block_size = 4, 2, 32, 4
+    context_lens = [10, 7]
+    scale = 1.0 / math.sqrt(head_dim)
+    max_len = max(context_lens)
+    keys = mx.random.normal((2, max_len, num_kv_heads, head_dim))
+    values = mx.random.normal((2, max_len, num_kv_heads, head_dim))
+    queries = mx.random.normal((2, num_heads, 1, head_dim))
+
+    outputs = []
+    for kv_cache_dtype in ("auto", "int8"):
+        mgr = PagedKVCacheManager(
+            num_layers=1,
+            num_kv_heads=num_kv_heads,
+            head_dim=head_dim,
+            dtype=mx.float32,
+            block_size=block_size,
+            num_gpu_blocks=16,
+            kv_cache_dtype=kv_cache_dtype,
+        )
+        for b, length in enumerate(context_lens):
+            assert mgr.allocate_request(str(b), length)
+        block_tables_np = mgr.get_padded_block_tables(["0", "1"])
+        block_tables = mx.array(block_tables_np)
+        context_lengths = mx.array(context_lens, dtype=mx.int32)
+        key_cache, value_cache = mgr.get_cache()
+        slot_mapping = mgr.get_slot_mapping(block_tables_np, context_lens, max_len)
+        reshape_and_cache(
+            keys,
+            values,
+            key_cache,
+            value_cache,
+            block_tables,
+            context_lengths,
+            block_size,
+            0,
+            slot_mapping=mx.array(slot_mapping),
+        )
+        outputs.append(
+            paged_attention(
+                queries,
+                key_cache,
+                value_cache,
+                block_tables,
+                context_lengths,
+                block_size,
+                scale,
+                num_kv_heads,
+                0,
+            )
+        )
+
+    assert isinstance(key_cache, mlx_backend.QuantizedPagedCache)
+    assert key_cache.data.dtype == mx.int8
+    assert mx.allclose(outputs[0], outputs[1], atol=3e-2).item()
+
+
+@pytest.mark.skipif(not mx.metal.is_available(), reason="Metal is not available")
+def test_mlx_backend_matches_metal():
+    batch_size, num_heads, num_kv_heads, head_dim, block_size = 4, 8, 2, 64, 16
+    context_lens = [1, 17, 40, 64]
+    scale = 1.0 / math.sqrt(head_dim)
+    q, key_cache, value_cache, block_tables = _random_paged_setup(
+        batch_size, num_heads, num_kv_heads, head_dim, block_size, context_lens
+    )
+    args = (
+        q,
+        key_cache,
+        value_cache,
+        block_tables,
+        mx.array(context_lens, dtype=mx.int32),
+        block_size,
+        scale,
+        num_kv_heads,
+        0,
+    )
+    assert mx.allclose(
+        mlx_backend.paged_attention(*args), paged_attention_metal(*args), atol=1e-4
+    ).item()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,238 @@
+import mlx.core as mx
+import numpy as np
+
+from parallax.server.paged_kv_cache import BlockAllocator, PagedKVCacheManager
+
+
+def make_manager(
+    num_gpu_blocks: int = 64, block_size: int = 4, enable_prefix_caching: bool = False
+) -> PagedKVCacheManager:
+    return PagedKVCacheManager(
+        num_layers=1,
+        num_kv_heads=1,
+        head_dim=4,
+        dtype=mx.float16,
+        block_size=block_size,
+        num_gpu_blocks=num_gpu_blocks,
+        enable_prefix_caching=enable_prefix_caching,
+    )
+
+
+def reference_slot_mapping(block_tables, lengths, max_len, block_size):
+    slots = []
+    for block_table, length in zip(block_tables, lengths):
+        for seq_idx in range(max_len):
+            if seq_idx < length:
+                physical_block = block_table[seq_idx // block_size]
+                slots.append(physical_block * block_size + seq_idx % block_size)
+            else:
+                slots.append(-1)
+    return slots
+
+
+def test_block_allocator_free_stack():
+    allocator = BlockAllocator(num_blocks=8, block_size=4)
+    first = allocator.allocate(3)
+    second = allocator.allocate(3)
+    assert len(set(first + second)) == 6
+    assert allocator.get_num_free_blocks() == 2
+    assert allocator.allocate(3) == []
+
+    allocator.free(first)
+    # Double frees are ignored
+    allocator.free([first[0], second[0], second[0]])
+    assert allocator.get_num_free_blocks() == 6
+    assert allocator.get_num_used_blocks() == 2
+
+    batch = allocator.allocate_batch([2, 0, 4])
+    assert [len(blocks) for blocks in batch] == [2, 0, 4]
+    assert allocator.get_num_free_blocks() == 0
+    assert allocator.allocate_batch([1]) is None
+
+    allocator.free(np.concatenate(batch))
+    stats = allocator.get_stats()
+    assert stats["num_used_blocks"] == 2
+    assert stats["occupancy"] == 0.25
+    assert 0.0 <= stats["fragmentation"] < 1.0
+
+
+def test_block_allocator_fragmentation():
+    allocator = BlockAllocator(num_blocks=6, block_size=4)
+    blocks = allocator.allocate(6)
+    assert allocator.get_stats()["fragmentation"] == 0.0
+    allocator.free([b for b in blocks if b % 2 == 0])
+    assert allocator.get_stats()["fragmentation"] == 1.0 - 1 / 3
+    allocator.free([b for b in blocks if b % 2 == 1])
+    assert allocator.get_stats()["fragmentation"] == 0.0
+
+
+def test_slot_mapping_matches_per_token_reference():
+    mgr = make_manager()
+    lengths = [3, 9, 6]
+    rids = ["a", "b", "c"]
+    for rid, length in zip(rids, lengths):
+        assert mgr.allocate_request(rid, length)
+
+    padded = mgr.get_padded_block_tables(rids)
+    assert padded.dtype == np.int32
+    assert padded.shape == (3, 3)
+    for i, rid in enumerate(rids):
+        table = mgr.get_block_table(rid)
+        assert padded[i, : len(table)].tolist() == table
+        assert not padded[i, len(table) :].any()
+
+    max_len = max(lengths)
+    slot_mapping = mgr.get_slot_mapping(padded, lengths, max_len)
+    expected = reference_slot_mapping(
+        [mgr.get_block_table(rid) for rid in rids], lengths, max_len, mgr.block_size
+    )
+    assert slot_mapping.tolist() == expected
+
+
+def test_append_slot_grows_block_table_incrementally():
+    mgr = make_manager()
+    assert mgr.allocate_request("r", 4)
+    initial_capacity = len(mgr.block_tables["r"])
+
+    # Decode well past the preallocated capacity
+    for _ in range(initial_capacity * mgr.block_size):
+        assert mgr.append_slot("r")
+
+    num_tokens = 4 + initial_capacity * mgr.block_size
+    assert mgr.get_context_length("r") == num_tokens
+    table = mgr.get_block_table("r")
+    assert len(table) == (num_tokens + mgr.block_size - 1) // mgr.block_size
+    assert len(set(table)) == len(table)
+
+    mgr.release_request("r")
+    assert mgr.get_num_free_blocks() == mgr.num_gpu_blocks
+    assert mgr.get_block_table("r") == []
+
+
+def test_slot_mapping_with_prefix_offsets():
+    mgr = make_manager()
+    assert mgr.allocate_request("a", 10)
+    assert mgr.allocate_request("b", 6)
+    padded = mgr.get_padded_block_tables(["a", "b"])
+    # "a" computes tokens [8, 10), "b" computes tokens [3, 6)
+    slot_mapping = mgr.get_slot_mapping(padded, [2, 3], 3, prefix_lens=[8, 3])
+    full = mgr.get_slot_mapping(padded, [10, 6], 10)
+    assert slot_mapping.tolist() == [full[8], full[9], -1, full[13], full[14], full[15]]
+
+
+def test_prefix_blocks_are_shared_and_ref_counted():
+    mgr = make_manager(enable_prefix_caching=True)
+    tokens = list(range(10))
+    assert mgr.allocate_request("a", 10, token_ids=tokens)
+    assert mgr.get_num_cached_tokens("a") == 0
+    mgr.cache_prefix("a", tokens)
+
+    # Two full blocks (8 tokens) are shared, the rest is private
+    assert mgr.allocate_request("b", 12, token_ids=tokens[:9] + [100, 101, 102])
+    assert mgr.get_num_cached_tokens("b") == 8
+    table_a, table_b = mgr.get_block_table("a"), mgr.get_block_table("b")
+    assert table_b[:2] == table_a[:2]
+    assert table_b[2] != table_a[2]
+    assert mgr.block_ref_counts[table_a[0]] == 2
+
+    # Released cached blocks stay reusable and still count as free
+    mgr.release_request("a")
+    mgr.release_request("b")
+    assert mgr.get_num_free_blocks() == mgr.num_gpu_blocks
+    assert mgr.allocate_request("c", 10, token_ids=tokens)
+    assert mgr.get_num_cached_tokens("c") == 8
+    assert mgr.get_block_table("c")[:2] == table_a[:2]
+
+
+def test_fully_cached_prompt_copies_last_block():
+    mgr = make_manager(enable_prefix_caching=True)
+    tokens = list(range(8))
+    assert mgr.allocate_request("a", 8, token_ids=tokens)
+    mgr.cache_prefix("a", tokens)
+    table_a = mgr.get_block_table("a")
+    mgr.key_cache[:, table_a[1]] = mx.ones_like(mgr.key_cache[:, table_a[1]])
+
+    # The last prompt token is recomputed, into a private copy of the last block
+    assert mgr.allocate_request("b", 8, token_ids=tokens)
+    assert mgr.get_num_cached_tokens("b") == 7
+    table_b = mgr.get_block_table("b")
+    assert table_b[0] == table_a[0]
+    assert table_b[1] != table_a[1]
+    assert mx.array_equal(mgr.key_cache[:, table_b[1]], mgr.key_cache[:, table_a[1]]).item()
+    assert mgr.block_ref_counts[table_a[1]] == 1
+
+
+def test_unreferenced_blocks_are_evicted_lru():
+    mgr = make_manager(num_gpu_blocks=4, enable_prefix_caching=True)
+    old, new = list(range(8)), list(range(100, 108))
+    for rid, tokens in (("old", old), ("new", new)):
+        assert mgr.allocate_request(rid, 8, token_ids=tokens)
+        mgr.cache_prefix(rid, tokens)
+        mgr.release_request(rid)
+    assert mgr.get_num_free_blocks() == 4
+
+    # Touching "old" makes "new" the least recently used prefix
+    assert mgr.allocate_request("hit", 8, token_ids=old)
+    mgr.release_request("hit")
+    assert mgr.allocate_request("other", 8, token_ids=list(range(200, 208)))
+    assert mgr._match_prefix(new) == []
+    assert len(mgr._match_prefix(old)) == 2
+
+
+def test_mirrored_prefix_must_be_cached():
+    mgr = make_manager(enable_prefix_caching=True)
+    tokens = list(range(10))
+    assert not mgr.allocate_request("a", 10, token_ids=tokens, num_cached_tokens=8)
+    assert not mgr.has_request("a")
+    assert mgr.get_num_free_blocks() == mgr.num_gpu_blocks
+
+    assert mgr.allocate_request("a", 10, token_ids=tokens)
+    mgr.cache_prefix("a", tokens)
+    assert mgr.allocate_request("b", 10, token_ids=tokens, num_cached_tokens=4)
+    assert mgr.get_num_cached_tokens("b") == 4
+
+
+def test_admission_keeps_watermark_blocks_free():
+    mgr = PagedKVCacheManager(
+        num_layers=1,
+        num_kv_heads=1,
+        head_dim=4,
+        dtype=mx.float16,
+        block_size=4,
+        num_gpu_blocks=10,
+        watermark=0.2,
+    )
+    assert mgr.watermark_blocks == 2
+    assert mgr.allocate_request("a", 24)
+    assert not mgr.allocate_request("b", 12)
+    assert mgr.allocate_request("b", 8)
+
+    # Decodes may still use the reserved blocks
+    assert mgr.append_slot("b")
+    assert mgr.get_num_free_blocks() == 1
+
+
+def test_int8_cache_fits_more_blocks_and_copies_scales():
+    auto = make_manager()
+    int8 = PagedKVCacheManager(
+        num_layers=1,
+        num_kv_heads=1,
+        head_dim=4,
+        dtype=mx.float16,
+        block_size=4,
+        num_gpu_blocks=64,
+        enable_prefix_caching=True,
+        kv_cache_dtype="int8",
+    )
+    # 4 fp16 values (8 bytes) vs. 4 int8 values plus an fp16 scale (6 bytes)
+    assert int8._calculate_num_blocks(0.5, mx.float16) > auto._calculate_num_blocks(0.5, mx.float16)
+
+    tokens = list(range(8))
+    assert int8.allocate_request("a", 8, token_ids=tokens)
+    int8.cache_prefix("a", tokens)
+    src = int8.get_block_table("a")[1]
+    int8.key_cache.scales[:, src] = mx.ones_like(int8.key_cache.scales[:, src])
+    assert int8.allocate_request("b", 8, token_ids=tokens)
+    dst = int8.get_block_table("b")[1]
+    assert dst != src
+    assert mx.array_equal(int8.key_cache.scales[:, dst], int8.key_cache.scales[:, src]).item()
@@ -0,0 +1,89 @@
+"""
+Tests for PeerForwarder's in-flight window, coalescing and abort ordering.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+from parallax.p2p.proto import forward_pb2
+from parallax.p2p.server import PeerForwarder
+
+
+class FakeStub:
+    """Records sent RPCs; each forward stays outstanding until its future is resolved."""
+
+    def __init__(self):
+        self.sent = []
+        self.futures = []
+        self.lock = threading.Lock()
+
+    def rpc_pp_forward(self, request):
+        future = Future()
+        with self.lock:
+            self.sent.append(("forward", [r.rid for r in request.reqs]))
+            self.futures.append(future)
+        return future
+
+    def rpc_abort(self, request):
+        with self.lock:
+            self.sent.append(("abort", [r.rid for r in request.reqs]))
+
+
+def make_forward(rid: str) -> forward_pb2.ForwardRequest:
+    request = forward_pb2.ForwardRequest(forward_mode=forward_pb2.ForwardMode.DECODE)
+    request.reqs.add(rid=rid)
+    return request
+
+
+def make_abort(rid: str) -> forward_pb2.AbortRequest:
+    request = forward_pb2.AbortRequest()
+    request.reqs.add(rid=rid)
+    return request
+
+
+def wait_for_sent(stub: FakeStub, count: int, timeout: float = 2.0):
+    deadline = time.time() + timeout
+    while len(stub.sent) < count and time.time() < deadline:
+        time.sleep(0.005)
+    assert len(stub.sent) == count, stub.sent
+
+
+def test_window_coalescing_and_abort_ordering():
+    stub = FakeStub()
+    forwarder = PeerForwarder("peer", lambda peer_id: stub, max_inflight=2)
+    try:
+        forwarder.submit_forward(make_forward("a"))
+        wait_for_sent(stub, 1)
+        forwarder.submit_forward(make_forward("b"))
+        wait_for_sent(stub, 2)
+
+        # The window is full; later requests queue up behind it
+        forwarder.submit_forward(make_forward("c"))
+        forwarder.submit_forward(make_forward("d"))
+        forwarder.submit_abort(make_abort("x"))
+        forwarder.submit_forward(make_forward("e"))
+        time.sleep(0.1)
+        assert len(stub.sent) == 2
+
+        # A free slot sends the queued forwards as one RPC, up to the abort
+        stub.futures[0].set_result(forward_pb2.ForwardResponse())
+        wait_for_sent(stub, 3)
+        assert stub.sent[2] == ("forward", ["c", "d"])
+
+        # The abort waits for every forward sent before it to be answered
+        stub.futures[1].set_result(forward_pb2.ForwardResponse())
+        time.sleep(0.1)
+        assert len(stub.sent) == 3
+        stub.futures[2].set_result(forward_pb2.ForwardResponse())
+        wait_for_sent(stub, 5)
+        assert stub.sent == [
+            ("forward", ["a"]),
+            ("forward", ["b"]),
+            ("forward", ["c", "d"]),
+            ("abort", ["x"]),
+            ("forward", ["e"]),
+        ]
+        stub.futures[3].set_result(forward_pb2.ForwardResponse())
+    finally:
+        forwarder.stop()
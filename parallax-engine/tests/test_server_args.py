@@ -48,6 +48,45 @@ class TestValidateArgs:
         with pytest.raises(ValueError, match="start_layer must be non-negative"):
             validate_args(args)
 
+    def test_invalid_activation_transport(self):
+        """Test unknown activation transport."""
+        args = argparse.Namespace(
+            start_layer=0,
+            end_layer=10,
+            dtype="bfloat16",
+            kv_cache_memory_fraction=0.5,
+            max_batch_size=16,
+            max_num_tokens_per_batch=1024,
+            kv_block_size=16,
+            micro_batch_ratio=2,
+            scheduler_wait_ms=500,
+            activation_transport=["int8", "peerA=fp8"],
+        )
+
+        with pytest.raises(ValueError, match="Unknown activation transport"):
+            validate_args(args)
+
+    def test_int8_kv_cache_requires_mlx(self):
+        """Test int8 KV cache is rejected on non-MLX devices."""
+        args = argparse.Namespace(
+            start_layer=0,
+            end_layer=10,
+            dtype="bfloat16",
+            kv_cache_memory_fraction=0.5,
+            max_batch_size=16,
+            max_num_tokens_per_batch=1024,
+            kv_block_size=16,
+            micro_batch_ratio=2,
+            scheduler_wait_ms=500,
+            kv_cache_dtype="int8",
+        )
+
+        with patch("parallax.utils.utils.get_current_device", return_value="cuda"):
+            with pytest.raises(ValueError, match="only supported on the MLX backend"):
+                validate_args(args)
+        with patch("parallax.utils.utils.get_current_device", return_value="mlx"):
+            validate_args(args)
+
     def test_invalid_end_layer(self):
         """Test invalid end layer."""
         args = argparse.Namespace(